@@ -112,7 +112,6 @@ def check_requirements():
         'reportlab==4.0.9',
         'Pillow==10.1.0',
         'python-dotenv==1.0.0',
-        'django-cors-headers==4.3.1',
         'django-ratelimit==4.1.0',
         'psycopg2-binary==2.9.9',
         'gunicorn==21.2.0',
@@ -1,6 +1,9 @@
 from django.contrib import admin
-from .models import PlanAbonnement, Abonnement, UtilisateurProfile, CahierUtilisation, CahierCharges
+from .models import PlanAbonnement, Abonnement, UtilisateurProfile, CahierUtilisation, CahierCharges, VersionCahier
 from .models_paiement import TransactionLigdiCash
+from .forms import CahierChargesForm
+from . import recherche
+from . import versions
 
 @admin.register(PlanAbonnement)
 class PlanAbonnementAdmin(admin.ModelAdmin):
@@ -57,10 +60,24 @@ class CahierUtilisationAdmin(admin.ModelAdmin):
 
 @admin.register(CahierCharges)
 class CahierChargesAdmin(admin.ModelAdmin):
+    # Formulaire du site : expose les champs stockés dans `details`
+    form = CahierChargesForm
     list_display = ('nom_projet', 'utilisateur', 'type_projet', 'date_creation')
-    list_filter = ('type_projet', 'date_creation')
-    search_fields = ('nom_projet', 'description', 'utilisateur__username')
+    list_filter = ('type_projet', 'brouillon', 'date_creation')
+    # Les textes sont recherchés via l'index plein texte (voir get_search_results)
+    search_fields = ('utilisateur__username',)
     date_hierarchy = 'date_creation'
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if obj.utilisateur and versions.historique_disponible(obj.utilisateur):
+            versions.enregistrer_version(obj, auteur=request.user)
+    
+    def get_search_results(self, request, queryset, search_term):
+        resultats, doublons = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            resultats |= recherche.filtrer(queryset, search_term)
+        return resultats, doublons
 
 @admin.register(TransactionLigdiCash)
 class TransactionLigdiCashAdmin(admin.ModelAdmin):
@@ -92,3 +109,15 @@ class TransactionLigdiCashAdmin(admin.ModelAdmin):
     def has_add_permission(self, request):
         # Empêcher la création manuelle de transactions
         return False
+
+@admin.register(VersionCahier)
+class VersionCahierAdmin(admin.ModelAdmin):
+    list_display = ('cahier', 'numero', 'auteur', 'date_creation', 'instantane', 'taille', 'champs_modifies')
+    list_filter = ('instantane', 'date_creation')
+    search_fields = ('cahier__nom_projet', 'auteur__username')
+    readonly_fields = ('cahier', 'numero', 'auteur', 'date_creation', 'instantane', 'contenu', 'champs_modifies', 'taille')
+    list_select_related = ('cahier', 'auteur')
+    
+    def has_add_permission(self, request):
+        # Les versions sont enregistrées par l'application
+        return False
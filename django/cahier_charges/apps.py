@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+MOTEUR_SQLITE_PRODUCTION = 'cahier_charges.backends.sqlite3'
+
+
+def configurer_sqlite(sender, connection, **kwargs):
+    """Applique settings.SQLITE_PRAGMAS aux connexions du backend SQLite de production"""
+    if connection.settings_dict['ENGINE'] != MOTEUR_SQLITE_PRODUCTION:
+        return
+    with connection.cursor() as cursor:
+        for pragma, valeur in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {valeur}')
 
 
 class CahierChargesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cahier_charges'
+
+    def ready(self):
+        connection_created.connect(configurer_sqlite, dispatch_uid='cahier_charges_sqlite')
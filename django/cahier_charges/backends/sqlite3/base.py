@@ -0,0 +1,20 @@
+"""
+Backend SQLite pour la production (SQLITE_PRODUCTION=True)
+
+Identique au backend de Django, sauf que les transactions (transaction.atomic)
+démarrent par BEGIN IMMEDIATE : le verrou d'écriture est pris au début de la
+transaction. Avec BEGIN (DEFERRED), deux transactions qui lisent puis écrivent
+peuvent se bloquer mutuellement au moment de passer en écriture, et SQLite
+répond immédiatement "database is locked" sans respecter busy_timeout.
+
+Les PRAGMA (WAL, busy_timeout...) sont appliqués à l'ouverture de chaque
+connexion par cahier_charges.apps.configurer_sqlite (signal connection_created).
+"""
+
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
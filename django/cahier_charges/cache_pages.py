@@ -0,0 +1,50 @@
+"""
+Cache des pages publiques
+
+- Page entière : la page d'accueil des visiteurs anonymes ne dépend que de
+  l'URL. Les URL de l'application sont dans i18n_patterns : LocaleMiddleware y
+  prend la langue du préfixe d'URL (langue par défaut sans préfixe), jamais du
+  cookie de langue ni d'Accept-Language. Le cache Django en garde une entrée
+  par URL, quels que soient les cookies du visiteur (CSRF, mesure d'audience).
+  Les réponses portent `Vary: Accept-Language, Cookie` pour les navigateurs et
+  les proxys : la page change à la connexion (base.html, user.is_authenticated)
+  et ne doit pas être resservie déconnectée pendant sa durée de vie.
+- Fragments : les cartes des forfaits (abonnement/carte_plan.html) et la grille des
+  types de projet (choisir_type.html) sont mises en cache avec {% cache %},
+  par version du catalogue (models.version_catalogue) et par langue. Les parties
+  propres à l'utilisateur (forfait actuel, jeton CSRF des formulaires) restent
+  hors du fragment. Les fragments sont invalidés par changement de clé : leur
+  durée (24 h) ne sert qu'à libérer le cache.
+"""
+
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.utils.cache import patch_cache_control
+from django.views.decorators.cache import cache_page
+from django.views.decorators.vary import vary_on_headers
+
+
+def cache_anonyme(vue):
+    """
+    Met en cache la réponse des visiteurs anonymes pendant CACHE_PAGES_DUREE ;
+    les utilisateurs connectés et les requêtes avec des messages flash en
+    attente ne passent pas par le cache
+    """
+    # Vary posé après la mise en cache : la langue est dans l'URL, déjà dans la
+    # clé du cache Django, qui n'est donc fragmentée ni par Accept-Language ni
+    # par les cookies ; il ne s'adresse qu'aux caches en aval
+    vue_en_cache = vary_on_headers('Accept-Language', 'Cookie')(
+        cache_page(settings.CACHE_PAGES_DUREE, key_prefix='anonyme')(vue)
+    )
+
+    @wraps(vue)
+    def envelopper(request, *args, **kwargs):
+        if request.user.is_authenticated or len(messages.get_messages(request)):
+            reponse = vary_on_headers('Accept-Language', 'Cookie')(vue)(request, *args, **kwargs)
+            patch_cache_control(reponse, private=True)
+            return reponse
+        return vue_en_cache(request, *args, **kwargs)
+
+    return envelopper
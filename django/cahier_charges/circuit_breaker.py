@@ -0,0 +1,149 @@
+"""
+Disjoncteur (circuit breaker) pour les appels à l'API LigdiCash
+
+L'état est stocké dans le cache Django afin d'être partagé entre tous les
+workers (à condition d'utiliser un cache partagé comme Redis, voir CACHES).
+
+- fermé      : les appels passent, les succès/échecs sont comptés sur une fenêtre glissante
+- ouvert     : le taux d'échec a dépassé le seuil, les appels échouent immédiatement
+- semi-ouvert: après la durée d'ouverture, un seul appel d'essai est autorisé;
+               son succès referme le circuit, son échec le rouvre
+"""
+
+import logging
+import time
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Disjoncteur partagé via le cache, identifié par son nom"""
+
+    FERME = 'closed'
+    OUVERT = 'open'
+    SEMI_OUVERT = 'half_open'
+
+    def __init__(self, nom, seuil_echec=0.5, min_appels=5, fenetre=60, duree_ouverture=30, nb_tranches=6):
+        self.nom = nom
+        self.seuil_echec = seuil_echec
+        self.min_appels = min_appels
+        self.fenetre = fenetre
+        self.duree_ouverture = duree_ouverture
+        self.nb_tranches = nb_tranches
+        self.taille_tranche = max(1, fenetre // nb_tranches)
+
+    # Clés de cache
+
+    def _cle(self, suffixe):
+        return f'circuit:{self.nom}:{suffixe}'
+
+    def _cle_tranche(self, generation, tranche, type_resultat):
+        return self._cle(f'{generation}:{tranche}:{type_resultat}')
+
+    def _lire_etat(self):
+        """Retourne (date d'ouverture ou None, génération des compteurs)"""
+        valeurs = cache.get_many([self._cle('ouvert'), self._cle('generation')])
+        return valeurs.get(self._cle('ouvert')), valeurs.get(self._cle('generation'), 0)
+
+    # État
+
+    def etat(self):
+        ouvert_depuis, _ = self._lire_etat()
+        return self._etat_depuis(ouvert_depuis)
+
+    def _etat_depuis(self, ouvert_depuis):
+        if ouvert_depuis is None:
+            return self.FERME
+        if time.time() < ouvert_depuis + self.duree_ouverture:
+            return self.OUVERT
+        return self.SEMI_OUVERT
+
+    def autoriser(self):
+        """Indique si un appel peut être tenté (réserve l'appel d'essai en semi-ouvert)"""
+        etat = self.etat()
+        if etat == self.FERME:
+            return True
+        if etat == self.OUVERT:
+            return False
+        # Un seul appel d'essai à la fois, tous workers confondus
+        return cache.add(self._cle('essai'), 1, self.duree_ouverture)
+
+    # Enregistrement des résultats
+
+    def succes(self):
+        ouvert_depuis, generation = self._lire_etat()
+        self._incrementer(generation, 'succes')
+        if self._etat_depuis(ouvert_depuis) == self.SEMI_OUVERT:
+            self._fermer()
+
+    def echec(self):
+        ouvert_depuis, generation = self._lire_etat()
+        self._incrementer(generation, 'echec')
+        etat = self._etat_depuis(ouvert_depuis)
+        if etat == self.SEMI_OUVERT:
+            # Échec de l'appel d'essai: rouvrir pour une nouvelle période
+            self._ouvrir()
+            return
+        if etat == self.OUVERT:
+            return
+
+        succes, echecs = self._compter(generation)
+        total = succes + echecs
+        if total >= self.min_appels and echecs / total >= self.seuil_echec:
+            self._ouvrir()
+
+    def statistiques(self):
+        """Résumé de l'état courant, utilisé par l'endpoint de métriques"""
+        ouvert_depuis, generation = self._lire_etat()
+        succes, echecs = self._compter(generation)
+        total = succes + echecs
+        return {
+            'etat': self._etat_depuis(ouvert_depuis),
+            'succes': succes,
+            'echecs': echecs,
+            'taux_echec': (echecs / total) if total else 0.0,
+        }
+
+    # Implémentation
+
+    def _tranche_courante(self):
+        return int(time.time() // self.taille_tranche)
+
+    def _incrementer(self, generation, type_resultat):
+        cle = self._cle_tranche(generation, self._tranche_courante(), type_resultat)
+        # La tranche expire d'elle-même une fois sortie de la fenêtre
+        if not cache.add(cle, 1, self.fenetre + self.taille_tranche):
+            try:
+                cache.incr(cle)
+            except ValueError:
+                cache.set(cle, 1, self.fenetre + self.taille_tranche)
+
+    def _compter(self, generation):
+        courante = self._tranche_courante()
+        cles = {}
+        for tranche in range(courante - self.nb_tranches + 1, courante + 1):
+            cles[self._cle_tranche(generation, tranche, 'succes')] = 'succes'
+            cles[self._cle_tranche(generation, tranche, 'echec')] = 'echec'
+        succes = echecs = 0
+        for cle, valeur in cache.get_many(list(cles)).items():
+            if cles[cle] == 'succes':
+                succes += valeur
+            else:
+                echecs += valeur
+        return succes, echecs
+
+    def _ouvrir(self):
+        logger.warning(f"Disjoncteur {self.nom} ouvert pour {self.duree_ouverture} s")
+        cache.set(self._cle('ouvert'), time.time(), None)
+        cache.delete(self._cle('essai'))
+
+    def _fermer(self):
+        logger.info(f"Disjoncteur {self.nom} refermé")
+        cache.delete_many([self._cle('ouvert'), self._cle('essai')])
+        # Nouvelle génération de compteurs: les échecs passés ne rouvrent pas le circuit
+        try:
+            cache.incr(self._cle('generation'))
+        except ValueError:
+            cache.set(self._cle('generation'), 1, None)
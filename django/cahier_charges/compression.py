@@ -0,0 +1,163 @@
+"""
+Compression des réponses (middleware.CompressionMiddleware)
+
+Négociation Brotli / gzip selon Accept-Encoding et compresseurs incrémentaux,
+utilisables sur un corps complet comme sur une réponse en flux (un morceau
+compressé et vidé par morceau reçu, pour que le client reçoive les données au
+fil de l'eau).
+
+Brotli est optionnel (pip install Brotli) : sans lui, seul gzip est proposé.
+
+BREACH : une page HTML ou JSON compressée qui contient un secret (jeton CSRF)
+et un texte choisi par l'attaquant (paramètre reflété) laisse deviner le secret
+par la taille de la réponse. Comme le GZipMiddleware de Django, chaque réponse
+reçoit un remplissage de longueur aléatoire (0 à COMPRESSION_REMPLISSAGE_MAX
+octets) qui brouille cette taille : nom de fichier de l'en-tête gzip (FNAME),
+méta-blocs de métadonnées en tête du flux Brotli, ignorés au décodage. Le
+contenu n'est pas modifié et les pages des utilisateurs connectés restent
+compressées.
+"""
+
+import secrets
+import struct
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Budget CPU (COMPRESSION_BUDGET_CPU) -> (qualité Brotli 0-11, niveau gzip 1-9).
+# Mesurer avec `python manage.py bench_compression` avant de changer de niveau.
+NIVEAUX = {
+    'faible': (1, 1),
+    'moyen': (4, 6),
+    'eleve': (9, 9),
+}
+
+# Types textuels : les PDF, images, archives... sont déjà compressés
+TYPES_COMPRESSIBLES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'application/xhtml+xml',
+    'image/svg+xml',
+)
+SUFFIXES_COMPRESSIBLES = ('+json', '+xml')
+
+
+def type_compressible(content_type):
+    type_mime = content_type.split(';')[0].strip().lower()
+    return type_mime.startswith(TYPES_COMPRESSIBLES) or type_mime.endswith(SUFFIXES_COMPRESSIBLES)
+
+
+def choisir_encodage(accept_encoding):
+    """
+    'gzip, deflate, br' -> 'br' ; 'br;q=0, gzip' -> 'gzip' ; '' -> None
+    """
+    poids = {}
+    for element in accept_encoding.split(','):
+        nom, _, parametres = element.strip().partition(';')
+        q = 1.0
+        parametres = parametres.strip()
+        if parametres.startswith('q='):
+            try:
+                q = float(parametres[2:])
+            except ValueError:
+                q = 0.0
+        if nom:
+            poids[nom.strip().lower()] = q
+    for encodage in ('br', 'gzip'):
+        if encodage == 'br' and brotli is None:
+            continue
+        if poids.get(encodage, poids.get('*', 0)) > 0:
+            return encodage
+    return None
+
+
+def _en_tete_gzip(longueur):
+    # ID1 ID2, deflate, FNAME ; mtime 0, XFL 0, OS inconnu ; nom terminé par un octet nul
+    return b'\x1f\x8b\x08\x08' + bytes(4) + b'\x00\xff' + b'a' * longueur + b'\x00'
+
+
+def _metadonnees_brotli(longueur):
+    """
+    Méta-blocs de métadonnées (RFC 7932, 9.2) de `longueur` octets au total de
+    données ignorées, à insérer à une limite d'octet entre deux méta-blocs
+    """
+    blocs = []
+    while longueur > 0:
+        taille = min(longueur, 256)
+        # ISLAST=0, MNIBBLES=0 (11), réservé 0, MSKIPBYTES=1, puis MSKIPLEN-1 sur 8 bits
+        blocs.append(bytes([0x16 | ((taille - 1) & 3) << 6, (taille - 1) >> 2]) + bytes(taille))
+        longueur -= taille
+    return b''.join(blocs)
+
+
+class Compresseur:
+    """
+    Compresseur incrémental pour l'encodage négocié ('br' ou 'gzip'), avec un
+    remplissage aléatoire de 0 à `remplissage_max` octets en tête du flux
+    """
+
+    def __init__(self, encodage, budget='moyen', remplissage_max=0):
+        qualite_brotli, niveau_gzip = NIVEAUX[budget]
+        self.encodage = encodage
+        longueur = secrets.randbelow(remplissage_max + 1) if remplissage_max else 0
+        if encodage == 'br':
+            self._compresseur = brotli.Compressor(quality=qualite_brotli)
+            # flush() aligne le flux sur un octet après l'en-tête (WBITS)
+            self._en_tete = (
+                self._compresseur.process(b'') + self._compresseur.flush() + _metadonnees_brotli(longueur)
+                if longueur else b''
+            )
+        else:
+            # Deflate brut : l'en-tête gzip (avec FNAME) et la fin (CRC32, taille) sont écrits ici
+            self._compresseur = zlib.compressobj(niveau_gzip, zlib.DEFLATED, -zlib.MAX_WBITS)
+            self._en_tete = _en_tete_gzip(longueur)
+            self._crc = 0
+            self._taille = 0
+
+    def ajouter(self, donnees, vider=False):
+        if self.encodage == 'br':
+            sortie = self._compresseur.process(donnees)
+            if vider:
+                sortie += self._compresseur.flush()
+        else:
+            self._crc = zlib.crc32(donnees, self._crc)
+            self._taille += len(donnees)
+            sortie = self._compresseur.compress(donnees)
+            if vider:
+                sortie += self._compresseur.flush(zlib.Z_SYNC_FLUSH)
+        return self._prefixer(sortie)
+
+    def terminer(self):
+        if self.encodage == 'br':
+            sortie = self._compresseur.finish()
+        else:
+            sortie = self._compresseur.flush() + struct.pack('<II', self._crc, self._taille & 0xFFFFFFFF)
+        return self._prefixer(sortie)
+
+    def _prefixer(self, sortie):
+        en_tete, self._en_tete = self._en_tete, b''
+        return en_tete + sortie
+
+
+def compresser(contenu, encodage, budget='moyen', remplissage_max=0):
+    compresseur = Compresseur(encodage, budget, remplissage_max)
+    return compresseur.ajouter(contenu) + compresseur.terminer()
+
+
+def compresser_flux(morceaux, encodage, budget='moyen', remplissage_max=0):
+    compresseur = Compresseur(encodage, budget, remplissage_max)
+    for morceau in morceaux:
+        yield compresseur.ajouter(morceau, vider=True)
+    yield compresseur.terminer()
+
+
+async def compresser_flux_async(morceaux, encodage, budget='moyen', remplissage_max=0):
+    compresseur = Compresseur(encodage, budget, remplissage_max)
+    async for morceau in morceaux:
+        yield compresseur.ajouter(morceau, vider=True)
+    yield compresseur.terminer()
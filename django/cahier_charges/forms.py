@@ -2,13 +2,84 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
-from .models import CahierCharges, TypeProjet
+from .models import CahierCharges, TypeProjet, CHAMPS_DETAILS
 
 class CahierChargesForm(forms.ModelForm):
+    # Champs propres au type de projet, stockés dans CahierCharges.details
+    fonctionnalites = forms.CharField(required=False, widget=forms.Textarea(attrs={
+        'class': 'form-control',
+        'rows': 5,
+        'placeholder': 'Listez les principales fonctionnalités souhaitées...'
+    }))
+    technologies = forms.CharField(required=False, widget=forms.Textarea(attrs={
+        'class': 'form-control',
+        'rows': 3,
+        'placeholder': 'Technologies préférées ou imposées...'
+    }))
+    public_cible = forms.CharField(required=False, widget=forms.Textarea(attrs={
+        'class': 'form-control',
+        'rows': 3,
+        'placeholder': 'Décrivez votre audience cible...'
+    }))
+    contraintes_techniques = forms.CharField(required=False, widget=forms.Textarea(attrs={
+        'class': 'form-control',
+        'rows': 4,
+        'placeholder': 'Contraintes techniques particulières...'
+    }))
+    type_ia = forms.CharField(required=False, max_length=200, widget=forms.Select(attrs={'class': 'form-select'}))
+    donnees_requises = forms.CharField(required=False, widget=forms.Textarea(attrs={
+        'class': 'form-control',
+        'rows': 4,
+        'placeholder': 'Types de données nécessaires pour l\'IA...'
+    }))
+    performance_attendue = forms.CharField(required=False, widget=forms.Textarea(attrs={
+        'class': 'form-control',
+        'rows': 3,
+        'placeholder': 'Niveau de performance souhaité...'
+    }))
+    date_mariage = forms.DateField(required=False, widget=forms.DateInput(attrs={
+        'class': 'form-control',
+        'type': 'date'
+    }))
+    lieu_mariage = forms.CharField(required=False, max_length=200, widget=forms.TextInput(attrs={
+        'class': 'form-control',
+        'placeholder': 'Lieu de la cérémonie'
+    }))
+    nombre_invites = forms.IntegerField(required=False, widget=forms.NumberInput(attrs={
+        'class': 'form-control',
+        'min': '1',
+        'placeholder': 'Nombre d\'invités'
+    }))
+    style_mariage = forms.CharField(required=False, max_length=200, widget=forms.Select(attrs={'class': 'form-select'}))
+    services_requis = forms.CharField(required=False, widget=forms.Textarea(attrs={
+        'class': 'form-control',
+        'rows': 5,
+        'placeholder': 'Services souhaités (traiteur, DJ, photographe...)...'
+    }))
+    type_construction = forms.CharField(required=False, max_length=200, widget=forms.Select(attrs={'class': 'form-select'}))
+    surface = forms.CharField(required=False, max_length=100, widget=forms.TextInput(attrs={
+        'class': 'form-control',
+        'placeholder': 'Surface en m²'
+    }))
+    localisation = forms.CharField(required=False, max_length=200, widget=forms.TextInput(attrs={
+        'class': 'form-control',
+        'placeholder': 'Adresse ou zone géographique'
+    }))
+    materiaux = forms.CharField(required=False, widget=forms.Textarea(attrs={
+        'class': 'form-control',
+        'rows': 4,
+        'placeholder': 'Matériaux souhaités ou imposés...'
+    }))
+    normes = forms.CharField(required=False, widget=forms.Textarea(attrs={
+        'class': 'form-control',
+        'rows': 4,
+        'placeholder': 'Normes et réglementations à respecter...'
+    }))
+
     class Meta:
         model = CahierCharges
         fields = '__all__'
-        exclude = ['date_creation']
+        exclude = ['date_creation', 'details', 'brouillon', 'revision']
         widgets = {
             'nom_projet': forms.TextInput(attrs={
                 'class': 'form-control',
@@ -31,87 +102,29 @@ class CahierChargesForm(forms.ModelForm):
                 'class': 'form-control',
                 'placeholder': 'Ex: 3 mois, 6 semaines...'
             }),
-            'fonctionnalites': forms.Textarea(attrs={
-                'class': 'form-control',
-                'rows': 5,
-                'placeholder': 'Listez les principales fonctionnalités souhaitées...'
-            }),
-            'technologies': forms.Textarea(attrs={
-                'class': 'form-control',
-                'rows': 3,
-                'placeholder': 'Technologies préférées ou imposées...'
-            }),
-            'public_cible': forms.Textarea(attrs={
-                'class': 'form-control',
-                'rows': 3,
-                'placeholder': 'Décrivez votre audience cible...'
-            }),
-            'contraintes_techniques': forms.Textarea(attrs={
-                'class': 'form-control',
-                'rows': 4,
-                'placeholder': 'Contraintes techniques particulières...'
-            }),
-            'type_ia': forms.Select(attrs={'class': 'form-select'}),
-            'donnees_requises': forms.Textarea(attrs={
-                'class': 'form-control',
-                'rows': 4,
-                'placeholder': 'Types de données nécessaires pour l\'IA...'
-            }),
-            'performance_attendue': forms.Textarea(attrs={
-                'class': 'form-control',
-                'rows': 3,
-                'placeholder': 'Niveau de performance souhaité...'
-            }),
-            'date_mariage': forms.DateInput(attrs={
-                'class': 'form-control',
-                'type': 'date'
-            }),
-            'lieu_mariage': forms.TextInput(attrs={
-                'class': 'form-control',
-                'placeholder': 'Lieu de la cérémonie'
-            }),
-            'nombre_invites': forms.NumberInput(attrs={
-                'class': 'form-control',
-                'min': '1',
-                'placeholder': 'Nombre d\'invités'
-            }),
-            'style_mariage': forms.Select(attrs={'class': 'form-select'}),
-            'services_requis': forms.Textarea(attrs={
-                'class': 'form-control',
-                'rows': 5,
-                'placeholder': 'Services souhaités (traiteur, DJ, photographe...)...'
-            }),
-            'type_construction': forms.Select(attrs={'class': 'form-select'}),
-            'surface': forms.TextInput(attrs={
-                'class': 'form-control',
-                'placeholder': 'Surface en m²'
-            }),
-            'localisation': forms.TextInput(attrs={
-                'class': 'form-control',
-                'placeholder': 'Adresse ou zone géographique'
-            }),
-            'materiaux': forms.Textarea(attrs={
-                'class': 'form-control',
-                'rows': 4,
-                'placeholder': 'Matériaux souhaités ou imposés...'
-            }),
-            'normes': forms.Textarea(attrs={
-                'class': 'form-control',
-                'rows': 4,
-                'placeholder': 'Normes et réglementations à respecter...'
-            }),
         }
 
+    # Type de projet des formulaires générés par _creer_formulaire (None : tous les champs, admin)
+    TYPE_PROJET = None
+
     def __init__(self, *args, **kwargs):
-        self.type_projet = kwargs.pop('type_projet', None)
         super().__init__(*args, **kwargs)
         
-        if self.type_projet:
-            self.fields['type_projet'].initial = self.type_projet
-            self.fields['type_projet'].widget = forms.HiddenInput()
-            
-            # Masquer les champs non pertinents selon le type de projet
-            self._configure_fields_for_project_type()
+        # Les champs de details ne sont pas des champs du modèle : valeurs initiales de l'instance
+        if self.instance.pk:
+            for nom in CHAMPS_DETAILS:
+                if nom in self.fields:
+                    self.initial.setdefault(nom, getattr(self.instance, nom))
+        
+        # Le type vient de l'URL (formulaire_cahier), il n'est pas lu dans le POST
+        if self.TYPE_PROJET:
+            self.instance.type_projet = self.TYPE_PROJET
+
+    def save(self, commit=True):
+        for nom in CHAMPS_DETAILS:
+            if nom in self.cleaned_data:
+                setattr(self.instance, nom, self.cleaned_data[nom])
+        return super().save(commit)
 
     def clean_nom_projet(self):
         nom_projet = self.cleaned_data.get('nom_projet')
@@ -131,34 +144,42 @@ class CahierChargesForm(forms.ModelForm):
             raise forms.ValidationError('Le nombre d\'invités doit être d\'au moins 1.')
         return nombre_invites
 
-    def _configure_fields_for_project_type(self):
-        """Configure les champs visibles selon le type de projet"""
-        base_fields = ['type_projet', 'nom_projet', 'description', 'budget', 'delai']
-        
-        if self.type_projet in ['site_web', 'app_mobile']:
-            visible_fields = base_fields + [
-                'fonctionnalites', 'technologies', 'public_cible', 'contraintes_techniques'
-            ]
-        elif self.type_projet == 'ia':
-            visible_fields = base_fields + [
-                'type_ia', 'donnees_requises', 'performance_attendue', 'contraintes_techniques'
-            ]
-        elif self.type_projet == 'mariage':
-            visible_fields = base_fields + [
-                'date_mariage', 'lieu_mariage', 'nombre_invites', 'style_mariage', 'services_requis'
-            ]
-        elif self.type_projet == 'construction':
-            visible_fields = base_fields + [
-                'type_construction', 'surface', 'localisation', 'materiaux', 'normes'
-            ]
-        else:
-            visible_fields = base_fields
-
-        # Masquer tous les champs non pertinents
-        for field_name in self.fields:
-            if field_name not in visible_fields:
-                self.fields[field_name].widget = forms.HiddenInput()
-                self.fields[field_name].required = False
+
+# Champs affichés pour tous les types de projet, puis champs de details propres à chaque type
+CHAMPS_COMMUNS = ['nom_projet', 'description', 'budget', 'delai']
+CHAMPS_PAR_TYPE = {
+    TypeProjet.SITE_WEB: ['fonctionnalites', 'technologies', 'public_cible', 'contraintes_techniques'],
+    TypeProjet.APPLICATION_MOBILE: ['fonctionnalites', 'technologies', 'public_cible', 'contraintes_techniques'],
+    TypeProjet.IA: ['type_ia', 'donnees_requises', 'performance_attendue', 'contraintes_techniques'],
+    TypeProjet.MARIAGE: ['date_mariage', 'lieu_mariage', 'nombre_invites', 'style_mariage', 'services_requis'],
+    TypeProjet.CONSTRUCTION: ['type_construction', 'surface', 'localisation', 'materiaux', 'normes'],
+}
+
+
+def _creer_formulaire(type_projet, champs):
+    """
+    Sous-classe de CahierChargesForm limitée aux champs du type de projet : les
+    autres champs ne sont ni copiés à l'instanciation, ni rendus, ni validés
+    """
+    attributs = {
+        # Un champ déclaré mis à None est retiré de la sous-classe
+        **{nom: None for nom in CHAMPS_DETAILS if nom not in champs},
+        'TYPE_PROJET': type_projet,
+        'Meta': type('Meta', (CahierChargesForm.Meta,), {'fields': CHAMPS_COMMUNS, 'exclude': None}),
+    }
+    return type(f'CahierChargesForm_{type_projet}', (CahierChargesForm,), attributs)
+
+
+# Une classe par type de projet, construite une seule fois à l'import
+FORMULAIRES = {
+    type_projet: _creer_formulaire(type_projet, champs)
+    for type_projet, champs in CHAMPS_PAR_TYPE.items()
+}
+
+
+def formulaire_cahier(type_projet):
+    """Classe de formulaire du type de projet (type validé par la vue)"""
+    return FORMULAIRES[type_projet]
 
 class UtilisateurForm(UserCreationForm):
     email = forms.EmailField(required=True, label='Email')
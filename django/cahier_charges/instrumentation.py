@@ -0,0 +1,119 @@
+"""
+Instrumentation des performances par requête
+
+Une mesure est attachée à la requête courante via une ContextVar : requêtes SQL
+(nombre et durée, via connection.execute_wrapper), rendu des templates
+(backend DjangoTemplatesInstrumente) et spans nommés (`with span('pdf_build')`).
+Hors d'une requête mesurée, span() ne fait rien et ne coûte presque rien.
+
+Activé par PerformanceMiddleware (PERFORMANCE_INSTRUMENTATION=True).
+"""
+
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+_mesure_courante = ContextVar('mesure_performance', default=None)
+
+
+class Mesure:
+    """Durées cumulées (en ms) d'une requête"""
+
+    def __init__(self):
+        self.debut = time.perf_counter()
+        self.fin = None
+        self.sql_nombre = 0
+        self.sql_ms = 0.0
+        # nom -> [durée cumulée en ms, nombre d'occurrences]
+        self.spans = {}
+
+    def ajouter(self, nom, duree_ms):
+        cumul = self.spans.setdefault(nom, [0.0, 0])
+        cumul[0] += duree_ms
+        cumul[1] += 1
+
+    @property
+    def total_ms(self):
+        return ((self.fin or time.perf_counter()) - self.debut) * 1000
+
+    def _enregistrer_sql(self, execute, sql, params, many, context):
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_nombre += 1
+            self.sql_ms += (time.perf_counter() - debut) * 1000
+
+    def server_timing(self):
+        """Valeur de l'en-tête Server-Timing"""
+        entrees = [
+            f'total;dur={self.total_ms:.1f}',
+            f'db;dur={self.sql_ms:.1f};desc="{self.sql_nombre} requetes SQL"',
+        ]
+        for nom, (duree, nombre) in self.spans.items():
+            entree = f'{nom};dur={duree:.1f}'
+            if nombre > 1:
+                entree += f';desc="x{nombre}"'
+            entrees.append(entree)
+        return ', '.join(entrees)
+
+    def en_dict(self):
+        return {
+            'total_ms': round(self.total_ms, 2),
+            'sql_nombre': self.sql_nombre,
+            'sql_ms': round(self.sql_ms, 2),
+            'spans': {nom: {'ms': round(duree, 2), 'nombre': nombre} for nom, (duree, nombre) in self.spans.items()},
+        }
+
+
+@contextmanager
+def mesurer():
+    """Mesure le bloc (une requête HTTP) : SQL sur toutes les connexions et spans"""
+    mesure = Mesure()
+    jeton = _mesure_courante.set(mesure)
+    try:
+        with ExitStack() as pile:
+            for alias in connections:
+                pile.enter_context(connections[alias].execute_wrapper(mesure._enregistrer_sql))
+            yield mesure
+    finally:
+        mesure.fin = time.perf_counter()
+        _mesure_courante.reset(jeton)
+
+
+def mesure_courante():
+    return _mesure_courante.get()
+
+
+@contextmanager
+def span(nom):
+    """Chronomètre un bloc sous le nom donné si la requête courante est mesurée"""
+    mesure = _mesure_courante.get()
+    if mesure is None:
+        yield
+        return
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        mesure.ajouter(nom, (time.perf_counter() - debut) * 1000)
+
+
+class _TemplateInstrumente(Template):
+    def render(self, context=None, request=None):
+        with span('template'):
+            return super().render(context, request)
+
+
+class DjangoTemplatesInstrumente(DjangoTemplates):
+    """Backend DjangoTemplates dont le rendu est compté dans le span 'template'"""
+
+    def from_string(self, template_code):
+        return _TemplateInstrumente(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return _TemplateInstrumente(template.template, self)
@@ -0,0 +1,165 @@
+"""
+Journalisation non bloquante (profil JOURNAL_PROFIL=production, voir settings.LOGGING)
+
+Les requêtes n'écrivent plus dans les fichiers : HandlerAsynchrone dépose
+l'enregistrement formaté dans une file bornée et un thread (QueueListener) se
+charge des écritures sur disque et sur la console. Si le disque n'écrit plus
+assez vite et que la file est pleine, les enregistrements sont perdus (et
+comptés) plutôt que de bloquer la requête.
+
+- FichierRotatif : rotation à une taille maximale ou au changement de période
+  (jour par défaut), le premier atteint ; plusieurs workers gunicorn peuvent
+  partager le même fichier.
+- FiltreEchantillonnage : ne garde qu'une fraction des enregistrements d'un
+  logger bavard en dessous de WARNING (JOURNAL_ECHANTILLONNAGE).
+"""
+
+import copy
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows : pas de verrou entre processus pour la rotation
+    fcntl = None
+
+
+class FichierRotatif(logging.handlers.RotatingFileHandler):
+    """
+    Rotation à maxBytes octets, ou dès la première écriture d'une nouvelle
+    période de `intervalle` secondes (alignée sur l'époque : minuit UTC pour
+    86400), le premier atteint. La taille et la date sont lues sur le fichier :
+    plusieurs processus peuvent y écrire, la rotation se fait sous verrou et
+    les autres processus rouvrent le nouveau fichier (comme WatchedFileHandler).
+    """
+
+    def __init__(self, filename, maxBytes=0, backupCount=0, intervalle=0, encoding='utf-8'):
+        super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount, encoding=encoding, delay=True)
+        self.intervalle = intervalle
+
+    def _rotation_necessaire(self, etat):
+        if self.maxBytes and etat.st_size >= self.maxBytes:
+            return True
+        if self.intervalle and etat.st_size:
+            maintenant = time.time()
+            return etat.st_mtime < maintenant - maintenant % self.intervalle
+        return False
+
+    def _rouvrir_si_tourne(self, etat):
+        # Fichier remplacé par la rotation d'un autre processus
+        if self.stream is not None and os.fstat(self.stream.fileno()).st_ino != etat.st_ino:
+            self.stream.close()
+            self.stream = self._open()
+
+    def shouldRollover(self, record):
+        try:
+            etat = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+            return False
+        self._rouvrir_si_tourne(etat)
+        return self._rotation_necessaire(etat)
+
+    def doRollover(self):
+        if fcntl is None:
+            return super().doRollover()
+        with open(self.baseFilename + '.lock', 'a') as verrou:
+            fcntl.flock(verrou, fcntl.LOCK_EX)
+            try:
+                # Un autre processus a pu tourner le fichier en attendant le verrou
+                etat = os.stat(self.baseFilename)
+                if self._rotation_necessaire(etat):
+                    super().doRollover()
+                else:
+                    self._rouvrir_si_tourne(etat)
+            finally:
+                fcntl.flock(verrou, fcntl.LOCK_UN)
+
+
+class _Ecrivain(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Attendre une place plutôt qu'échouer si la file est pleine à l'arrêt
+        self.queue.put(self._sentinel)
+
+
+class HandlerAsynchrone(logging.handlers.QueueHandler):
+    """
+    QueueHandler vers un FichierRotatif (et la console) écrits par un thread.
+    Seul le message est figé dans le thread appelant (ses arguments peuvent
+    changer après l'appel) : la mise en forme (date, exception) se fait dans le
+    thread d'écriture, avec le formatter configuré sur ce handler.
+
+    Un thread ne survit pas à un fork : avec preload_app, gunicorn configure la
+    journalisation dans le maître, chaque worker redémarre sa propre file.
+    """
+
+    def __init__(self, fichier, taille_max=0, intervalle=0, sauvegardes=5, console=True, taille_file=10000):
+        self.taille_file = taille_file
+        super().__init__(queue.Queue(taille_file))
+        os.makedirs(os.path.dirname(fichier), exist_ok=True)
+        self.destinations = [FichierRotatif(fichier, taille_max, sauvegardes, intervalle)]
+        if console:
+            self.destinations.append(logging.StreamHandler(sys.stderr))
+        self.perdus = 0
+        self.listener = None
+        self._demarrer()
+        os.register_at_fork(after_in_child=self._apres_fork)
+
+    def _demarrer(self):
+        self.listener = _Ecrivain(self.queue, *self.destinations, respect_handler_level=True)
+        self.listener.start()
+
+    def _apres_fork(self):
+        # listener hérité du parent : thread absent dans l'enfant, file copiée
+        if self.listener is not None:
+            self.queue = queue.Queue(self.taille_file)
+            self._demarrer()
+
+    def arreter(self):
+        """Vide la file et arrête le thread"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+            for destination in self.destinations:
+                destination.close()
+
+    def close(self):
+        # Appelé par logging.shutdown() à la fin du processus : rien ne reste dans la file
+        self.arreter()
+        super().close()
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        for destination in self.destinations:
+            destination.setFormatter(fmt)
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.perdus += 1
+
+
+class FiltreEchantillonnage(logging.Filter):
+    """Garde une fraction `taux` des enregistrements sous WARNING, tous les autres"""
+
+    def __init__(self, taux):
+        super().__init__()
+        self.taux = float(taux)
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.taux
@@ -3,16 +3,40 @@ Client API LigdiCash pour l'intégration des paiements
 Documentation: https://developers.ligdicash.com/
 """
 
-import requests
 import json
 import hashlib
 import time
 import decimal
 from django.conf import settings
 from django.urls import reverse
+from .circuit_breaker import CircuitBreaker
+from .instrumentation import span
+from .metrics import LIGDICASH_DUREE
 from .ligdicash_config import LIGDICASH_CONFIG
 
 
+def _creer_disjoncteur(endpoint):
+    return CircuitBreaker(
+        f'ligdicash_{endpoint}',
+        seuil_echec=LIGDICASH_CONFIG['CIRCUIT_SEUIL_ECHEC'],
+        min_appels=LIGDICASH_CONFIG['CIRCUIT_MIN_APPELS'],
+        fenetre=LIGDICASH_CONFIG['CIRCUIT_FENETRE'],
+        duree_ouverture=LIGDICASH_CONFIG['CIRCUIT_DUREE_OUVERTURE'],
+    )
+
+
+# Un disjoncteur par endpoint LigdiCash, partagé entre les workers via le cache
+DISJONCTEURS = {
+    'initiate': _creer_disjoncteur('initiate'),
+    'verify': _creer_disjoncteur('verify'),
+}
+
+MESSAGE_SERVICE_INDISPONIBLE = (
+    "Le service de paiement est momentanément indisponible. "
+    "Veuillez réessayer dans quelques minutes."
+)
+
+
 class DecimalEncoder(json.JSONEncoder):
     """Encodeur JSON personnalisé pour les objets Decimal"""
     def default(self, obj):
@@ -36,7 +60,25 @@ class LigdiCashClient:
         self.lang = LIGDICASH_CONFIG['LANG']
         self.test_mode = LIGDICASH_CONFIG['TEST_MODE']
     
-    def initier_paiement(self, montant, transaction_id, description, customer_name, customer_email, customer_phone=None):
+    def _poster(self, endpoint, url, **kwargs):
+        """POST vers LigdiCash, chronométré par endpoint et par résultat (métriques et Server-Timing)"""
+        # requests (et urllib3) : importé au premier appel, pas au démarrage des workers
+        import requests
+        debut = time.perf_counter()
+        resultat = 'error'
+        try:
+            with span('ligdicash_http'):
+                response = requests.post(url, **kwargs)
+            resultat = 'server_error' if response.status_code >= 500 else 'ok'
+            return response
+        except requests.exceptions.Timeout:
+            resultat = 'timeout'
+            raise
+        finally:
+            LIGDICASH_DUREE.labels(endpoint, resultat).observe(time.perf_counter() - debut)
+    
+    def initier_paiement(self, montant, transaction_id, description, customer_name, customer_email, customer_phone=None,
+                         autorise=False):
         """
         Initialise un paiement avec LigdiCash
         
@@ -47,10 +89,22 @@ class LigdiCashClient:
             customer_name: Nom du client
             customer_email: Email du client
             customer_phone: Téléphone du client (optionnel)
+            autorise: Appel déjà autorisé par l'appelant via DISJONCTEURS['initiate'].autoriser()
+                (l'appel d'essai du circuit semi-ouvert est alors déjà réservé)
             
         Returns:
             dict: Résultat de l'initialisation avec success, payment_url, token, etc.
         """
+        import requests
+        disjoncteur = DISJONCTEURS['initiate']
+        if not autorise and not disjoncteur.autoriser():
+            print("\n[ERREUR] Disjoncteur LigdiCash (initiate) ouvert: appel non tenté")
+            return {
+                'success': False,
+                'circuit_open': True,
+                'message': MESSAGE_SERVICE_INDISPONIBLE
+            }
+        
         try:
             # Convertir le montant en entier (LigdiCash utilise des centimes)
             montant_cents = int(round(float(montant), 0))
@@ -110,13 +164,20 @@ class LigdiCashClient:
             print(json.dumps(data, indent=2, cls=DecimalEncoder))
             
             # Envoyer la requête
-            response = requests.post(
+            response = self._poster(
+                'initiate',
                 self.api_url,
                 data=json_data,
                 headers=headers,
                 timeout=30
             )
             
+            # Une réponse 5xx compte comme une panne du service, le reste comme un succès d'appel
+            if response.status_code >= 500:
+                disjoncteur.echec()
+            else:
+                disjoncteur.succes()
+            
             print(f"\nRéponse HTTP: {response.status_code}")
             print(f"Contenu: {response.text}")
             
@@ -171,6 +232,7 @@ class LigdiCashClient:
                 }
                 
         except requests.exceptions.Timeout:
+            disjoncteur.echec()
             print("\n[ERREUR] Timeout de la requete (30 secondes)")
             return {
                 'success': False,
@@ -178,6 +240,7 @@ class LigdiCashClient:
             }
             
         except requests.exceptions.RequestException as e:
+            disjoncteur.echec()
             print(f"\n[ERREUR] Erreur de requete: {str(e)}")
             return {
                 'success': False,
@@ -203,6 +266,16 @@ class LigdiCashClient:
         Returns:
             dict: Résultat de la vérification avec success, status, etc.
         """
+        import requests
+        disjoncteur = DISJONCTEURS['verify']
+        if not disjoncteur.autoriser():
+            print("[ERREUR] Disjoncteur LigdiCash (verify) ouvert: appel non tenté")
+            return {
+                'success': False,
+                'status': 'CIRCUIT_OPEN',
+                'message': MESSAGE_SERVICE_INDISPONIBLE
+            }
+        
         try:
             print(f"\n=== LIGDICASH - Vérification du paiement ===")
             print(f"Token: {payment_token}")
@@ -223,13 +296,19 @@ class LigdiCashClient:
             print(f"URL de vérification: {self.verify_url}")
             
             # Envoyer la requête
-            response = requests.post(
+            response = self._poster(
+                'verify',
                 self.verify_url,
                 json=data,
                 headers=headers,
                 timeout=15
             )
             
+            if response.status_code >= 500:
+                disjoncteur.echec()
+            else:
+                disjoncteur.succes()
+            
             print(f"Réponse HTTP: {response.status_code}")
             print(f"Contenu: {response.text}")
             
@@ -278,6 +357,7 @@ class LigdiCashClient:
                 }
                 
         except requests.exceptions.RequestException as e:
+            disjoncteur.echec()
             print(f"[ERREUR] Erreur de requete: {str(e)}")
             return {
                 'success': False,
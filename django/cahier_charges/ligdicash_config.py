@@ -3,6 +3,7 @@ Configuration LigdiCash pour les paiements - SÉCURISÉE
 Documentation: https://developers.ligdicash.com/
 """
 import os
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -23,8 +24,29 @@ LIGDICASH_CONFIG = {
     'TEST_MODE': os.environ.get('LIGDICASH_TEST_MODE', 'True') == 'True',
     'DESCRIPTION': 'Abonnement Cahier de Charges',
     'CUSTOMER': 'Cahier de Charges App',
+    # Disjoncteur: taux d'échec (0-1) sur la fenêtre (s) déclenchant l'ouverture pour DUREE_OUVERTURE (s)
+    'CIRCUIT_SEUIL_ECHEC': float(os.environ.get('LIGDICASH_CIRCUIT_SEUIL_ECHEC', '0.5')),
+    'CIRCUIT_MIN_APPELS': int(os.environ.get('LIGDICASH_CIRCUIT_MIN_APPELS', '5')),
+    'CIRCUIT_FENETRE': int(os.environ.get('LIGDICASH_CIRCUIT_FENETRE', '60')),
+    'CIRCUIT_DUREE_OUVERTURE': int(os.environ.get('LIGDICASH_CIRCUIT_DUREE_OUVERTURE', '30')),
+    # Durée (s) pendant laquelle un paiement en attente identique est réutilisé au lieu d'être réinitialisé (0 = désactivé)
+    'REUTILISATION_FENETRE': int(os.environ.get('LIGDICASH_REUTILISATION_FENETRE', '600')),
+    # Simulateur local (python manage.py simulateur_ligdicash), vide pour l'API réelle
+    'SIMULATEUR_URL': os.environ.get('LIGDICASH_SIMULATEUR_URL', '').rstrip('/'),
 }
 
+# Rediriger l'initialisation et la vérification vers le simulateur si configuré.
+# Jamais hors mode test : verifier_paiement croirait les réponses du simulateur
+# et activerait des abonnements sans paiement réel.
+if LIGDICASH_CONFIG['SIMULATEUR_URL'] and not LIGDICASH_CONFIG['TEST_MODE']:
+    raise ImproperlyConfigured(
+        "LIGDICASH_SIMULATEUR_URL est défini avec LIGDICASH_TEST_MODE=False : "
+        "le vider en production, ou activer le mode test pour utiliser le simulateur"
+    )
+if LIGDICASH_CONFIG['SIMULATEUR_URL']:
+    LIGDICASH_CONFIG['API_URL'] = f"{LIGDICASH_CONFIG['SIMULATEUR_URL']}/pay/v01/straight/sdk/"
+    LIGDICASH_CONFIG['VERIFY_URL'] = f"{LIGDICASH_CONFIG['SIMULATEUR_URL']}/pay/v01/straight/check_payment/"
+
 # Vérification des clés en production
 if not LIGDICASH_CONFIG['TEST_MODE']:
     import warnings
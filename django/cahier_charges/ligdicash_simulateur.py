@@ -0,0 +1,294 @@
+"""
+Simulateur LigdiCash hors ligne pour les tests d'intégration et de charge
+
+Remplace localement les endpoints API_URL (initialisation) et VERIFY_URL
+(vérification), émet des tokens, simule la page de paiement et envoie des
+callbacks signés (HMAC SHA-256 avec WEBHOOK_SECRET) vers NOTIFY_URL.
+
+Activation: LIGDICASH_SIMULATEUR_URL=http://127.0.0.1:8765 dans .env, puis
+    python manage.py simulateur_ligdicash
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode, urlparse
+
+from .ligdicash_config import LIGDICASH_CONFIG
+
+logger = logging.getLogger(__name__)
+
+CHEMIN_API = '/pay/v01/straight/sdk/'
+CHEMIN_VERIFICATION = '/pay/v01/straight/check_payment/'
+CHEMIN_PAIEMENT = '/pay/checkout/'
+
+# Répartition par défaut des codes de réponse: 00 = réussi, 01 = en attente, 02 = échoué
+REPARTITION_DEFAUT = {'00': 80, '01': 10, '02': 10}
+
+
+def parser_repartition(valeur):
+    """Convertit '00=80,01=10,02=10' en dictionnaire de poids"""
+    repartition = {}
+    for element in valeur.split(','):
+        code, _, poids = element.partition('=')
+        code = code.strip()
+        if code not in ('00', '01', '02'):
+            raise ValueError(f"Code de réponse inconnu: {code!r} (attendu 00, 01 ou 02)")
+        repartition[code] = float(poids)
+    if not repartition or sum(repartition.values()) <= 0:
+        raise ValueError("La répartition des codes doit contenir au moins un poids positif")
+    return repartition
+
+
+def signer(corps, secret):
+    """Signature HMAC SHA-256 attendue par verify_ligdicash_signature"""
+    return hmac.new(secret.encode('utf-8'), corps, hashlib.sha256).hexdigest()
+
+
+class SimulateurLigdiCash:
+    """Serveur HTTP local imitant l'API LigdiCash"""
+
+    def __init__(self, hote='127.0.0.1', port=8765, latence_ms=(0, 0), taux_erreur=0.0,
+                 repartition=None, delai_callback=None, envoyer_callbacks=True,
+                 secret=None, graine=None):
+        self.hote = hote
+        self.port = port
+        self.latence_ms = latence_ms
+        self.taux_erreur = taux_erreur
+        self.repartition = repartition or dict(REPARTITION_DEFAUT)
+        self.delai_callback = delai_callback
+        self.envoyer_callbacks = envoyer_callbacks
+        self.secret = secret or LIGDICASH_CONFIG['WEBHOOK_SECRET']
+        self._aleatoire = random.Random(graine)
+        self._lock = threading.Lock()
+        self._paiements = {}
+        self._serveur = None
+        self._thread = None
+
+    # Cycle de vie
+
+    @property
+    def url(self):
+        return f'http://{self.hote}:{self.port}'
+
+    @property
+    def url_api(self):
+        return self.url + CHEMIN_API
+
+    @property
+    def url_verification(self):
+        return self.url + CHEMIN_VERIFICATION
+
+    def demarrer(self):
+        """Démarre le serveur dans un thread et retourne son URL de base"""
+        simulateur = self
+
+        class Handler(_HandlerSimulateur):
+            pass
+        Handler.simulateur = simulateur
+
+        self._serveur = ThreadingHTTPServer((self.hote, self.port), Handler)
+        self._serveur.daemon_threads = True
+        # Port 0: le système choisit un port libre
+        self.port = self._serveur.server_address[1]
+        self._thread = threading.Thread(target=self._serveur.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Simulateur LigdiCash démarré sur {self.url}")
+        return self.url
+
+    def servir(self):
+        """Démarre le serveur et bloque jusqu'à l'interruption"""
+        self.demarrer()
+        try:
+            self._thread.join()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.arreter()
+
+    def arreter(self):
+        if self._serveur:
+            self._serveur.shutdown()
+            self._serveur.server_close()
+            self._serveur = None
+
+    # Comportement simulé
+
+    def _attendre_latence(self):
+        minimum, maximum = self.latence_ms
+        if maximum > 0:
+            time.sleep(self._aleatoire.uniform(minimum, maximum) / 1000)
+
+    def _erreur_injectee(self):
+        return self.taux_erreur > 0 and self._aleatoire.random() < self.taux_erreur
+
+    def _tirer_code(self):
+        codes = list(self.repartition)
+        return self._aleatoire.choices(codes, weights=[self.repartition[c] for c in codes])[0]
+
+    def creer_paiement(self, commande):
+        """Enregistre un paiement et retourne la réponse d'initialisation"""
+        facture = commande.get('invoice', {})
+        actions = commande.get('actions', {})
+        token = f'sim_{uuid.uuid4().hex}'
+        with self._lock:
+            self._paiements[token] = {
+                'code': '01',
+                'finalise': False,
+                'montant': facture.get('total_amount'),
+                'external_id': facture.get('external_id'),
+                'callback_url': actions.get('callback_url') or LIGDICASH_CONFIG['NOTIFY_URL'],
+                'return_url': actions.get('return_url') or LIGDICASH_CONFIG['RETURN_URL'],
+                'cancel_url': actions.get('cancel_url') or LIGDICASH_CONFIG['CANCEL_URL'],
+            }
+
+        if self.delai_callback is not None:
+            # Mode charge: le "client" paie sans passer par la page de paiement
+            minuteur = threading.Timer(self.delai_callback, self.envoyer_callback, args=(token,))
+            minuteur.daemon = True
+            minuteur.start()
+
+        return {
+            'response_code': '00',
+            'token': token,
+            'response_text': f'{self.url}{CHEMIN_PAIEMENT}{token}/',
+            'description': 'Paiement simulé',
+        }
+
+    def statut_paiement(self, token):
+        with self._lock:
+            paiement = self._paiements.get(token)
+            if paiement is None:
+                return None
+            code = paiement['code']
+            montant = paiement['montant']
+            external_id = paiement['external_id']
+        textes = {'00': 'Paiement réussi', '01': 'Paiement en attente', '02': 'Paiement échoué'}
+        return {
+            'response_code': code,
+            'response_text': textes[code],
+            'token': token,
+            'amount': montant,
+            'external_id': external_id,
+        }
+
+    def finaliser(self, token):
+        """
+        Tire le résultat du paiement (une seule fois par token) et prépare le callback
+
+        Returns:
+            tuple: (url du callback, corps JSON en bytes, signature) ou None si le token est inconnu
+        """
+        with self._lock:
+            paiement = self._paiements.get(token)
+            if paiement is None:
+                return None
+            if not paiement['finalise']:
+                paiement['code'] = self._tirer_code()
+                paiement['finalise'] = True
+            callback_url = paiement['callback_url']
+
+        corps = json.dumps({
+            'token': token,
+            **{k: v for k, v in self.statut_paiement(token).items() if k != 'token'},
+        }).encode('utf-8')
+        return callback_url, corps, signer(corps, self.secret)
+
+    def envoyer_callback(self, token):
+        """Finalise le paiement et envoie le webhook signé vers NOTIFY_URL"""
+        prepare = self.finaliser(token)
+        if prepare is None or not self.envoyer_callbacks:
+            return None
+        callback_url, corps, signature = prepare
+        requete = urllib.request.Request(callback_url, data=corps, method='POST', headers={
+            'Content-Type': 'application/json',
+            'X-Ligdicash-Signature': signature,
+        })
+        try:
+            with urllib.request.urlopen(requete, timeout=30) as reponse:
+                return reponse.status
+        except Exception as e:
+            logger.warning(f"Callback du simulateur vers {callback_url} en échec: {e}")
+            return None
+
+    def url_retour(self, token):
+        with self._lock:
+            paiement = self._paiements.get(token)
+        if paiement is None:
+            return None
+        base = paiement['cancel_url'] if paiement['code'] == '02' else paiement['return_url']
+        return f"{base}?{urlencode({'token': token})}"
+
+
+class _HandlerSimulateur(BaseHTTPRequestHandler):
+    simulateur = None
+
+    def log_message(self, format, *args):
+        logger.debug("Simulateur LigdiCash: " + format % args)
+
+    def _repondre_json(self, donnees, statut=200):
+        corps = json.dumps(donnees).encode('utf-8')
+        self.send_response(statut)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corps)))
+        self.end_headers()
+        self.wfile.write(corps)
+
+    def _lire_json(self):
+        longueur = int(self.headers.get('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(longueur) or b'{}')
+        except json.JSONDecodeError:
+            return None
+
+    def do_POST(self):
+        chemin = urlparse(self.path).path
+        if chemin not in (CHEMIN_API, CHEMIN_VERIFICATION):
+            self._repondre_json({'response_code': '404', 'response_text': 'Not found'}, 404)
+            return
+
+        simulateur = self.simulateur
+        simulateur._attendre_latence()
+        donnees = self._lire_json()
+        if donnees is None:
+            self._repondre_json({'response_code': '400', 'response_text': 'Invalid JSON'}, 400)
+            return
+        if simulateur._erreur_injectee():
+            self._repondre_json({'response_code': '500', 'response_text': 'Erreur simulée'}, 500)
+            return
+
+        if chemin == CHEMIN_API:
+            self._repondre_json(simulateur.creer_paiement(donnees.get('commande', {})))
+            return
+
+        statut = simulateur.statut_paiement(donnees.get('token', ''))
+        if statut is None:
+            self._repondre_json({'response_code': '404', 'response_text': 'Token inconnu'}, 404)
+        else:
+            self._repondre_json(statut)
+
+    def do_GET(self):
+        # Page de paiement: le client "paie", le webhook est envoyé puis il est redirigé
+        chemin = urlparse(self.path).path
+        if not chemin.startswith(CHEMIN_PAIEMENT):
+            self._repondre_json({'response_code': '404', 'response_text': 'Not found'}, 404)
+            return
+
+        token = chemin[len(CHEMIN_PAIEMENT):].strip('/')
+        simulateur = self.simulateur
+        if simulateur.statut_paiement(token) is None:
+            self._repondre_json({'response_code': '404', 'response_text': 'Token inconnu'}, 404)
+            return
+
+        simulateur.envoyer_callback(token)
+        self.send_response(302)
+        self.send_header('Location', simulateur.url_retour(token))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
@@ -0,0 +1,115 @@
+"""
+Benchmark de la compression des réponses (CompressionMiddleware)
+
+Récupère le corps non compressé de pages représentatives (formulaire, liste
+des cahiers, réponses JSON) puis mesure, pour chaque encodage et chaque
+budget CPU (COMPRESSION_BUDGET_CPU), les octets économisés et le temps CPU
+ajouté par réponse. Le benchmark tourne dans une base de test jetable.
+
+Usage:
+    python manage.py bench_compression
+    python manage.py bench_compression --cahiers 50 --repetitions 200
+"""
+
+import contextlib
+import io
+import logging
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from cahier_charges import compression
+from cahier_charges.management.commands.bench_paiements import percentile
+from cahier_charges.models import CahierCharges
+
+# Page -> (nom d'URL, arguments)
+PAGES = {
+    'formulaire': ('creer_cahier_type', ['site_web']),
+    'mes_cahiers': ('mes_cahiers', []),
+    'mes_cahiers_page': ('mes_cahiers_page', []),
+    'verifier_limite': ('verifier_limite_cahiers', []),
+}
+
+
+class Command(BaseCommand):
+    help = 'Mesure les octets économisés et le temps CPU de la compression Brotli/gzip des réponses.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cahiers', type=int, default=30, help='Cahiers de l\'utilisateur (défaut: 30)')
+        parser.add_argument('--repetitions', type=int, default=100, help='Compressions par mesure (défaut: 100)')
+
+    def handle(self, *args, **options):
+        if options['repetitions'] < 1:
+            raise CommandError('--repetitions doit être positif')
+        encodages = ['gzip'] + (['br'] if compression.brotli is not None else [])
+        if compression.brotli is None:
+            self.stdout.write(self.style.WARNING('Brotli non installé (pip install Brotli) : gzip seulement'))
+
+        # Les logs SQL en DEBUG et les print des vues faussent les mesures
+        logging.disable(logging.ERROR)
+        nom_origine = self._creer_base_test()
+        try:
+            corps = self._recuperer_corps(options['cahiers'])
+        finally:
+            connection.creation.destroy_test_db(nom_origine, verbosity=0)
+            logging.disable(logging.NOTSET)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Compression par réponse (médiane sur {options['repetitions']} compressions, "
+            f"seuil {settings.COMPRESSION_TAILLE_MIN} octets)"
+        ))
+        self.stdout.write(
+            f"  {'Page':18} {'Origine':>8} {'Enc.':>5} {'Budget':>7} {'Compressé':>10} {'Gain':>6} {'CPU (ms)':>9}"
+        )
+        for page, contenu in corps.items():
+            if len(contenu) < settings.COMPRESSION_TAILLE_MIN:
+                self.stdout.write(f'  {page:18} {len(contenu):8} {"":>5} {"":>7} {"non compressé (sous le seuil)":>26}')
+                continue
+            for encodage in encodages:
+                for budget in compression.NIVEAUX:
+                    durees = []
+                    for _ in range(options['repetitions']):
+                        debut = time.process_time()
+                        compresse = compression.compresser(contenu, encodage, budget)
+                        durees.append((time.process_time() - debut) * 1000)
+                    self.stdout.write(
+                        f'  {page:18} {len(contenu):8} {encodage:>5} {budget:>7} {len(compresse):10} '
+                        f'{1 - len(compresse) / len(contenu):6.0%} {percentile(durees, 50):9.3f}'
+                    )
+
+    def _creer_base_test(self):
+        if connection.vendor == 'sqlite':
+            fd, chemin = tempfile.mkstemp(suffix='.sqlite3', prefix='bench_compression_')
+            os.close(fd)
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = chemin
+        nom_origine = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        return nom_origine
+
+    def _recuperer_corps(self, nombre_cahiers):
+        utilisateur = User.objects.create_user('bench_compression', 'bench_compression@example.com', 'motdepasse')
+        CahierCharges.objects.bulk_create([
+            CahierCharges(
+                utilisateur=utilisateur, type_projet='site_web', nom_projet=f'Projet {i}',
+                description='Plateforme de réservation en ligne avec paiement mobile et espace client. ' * 3,
+            )
+            for i in range(nombre_cahiers)
+        ])
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(utilisateur)
+        corps = {}
+        # Sans Accept-Encoding : corps non compressé
+        with contextlib.redirect_stdout(io.StringIO()):
+            for page, (nom_url, arguments) in PAGES.items():
+                reponse = client.get(reverse(nom_url, args=arguments))
+                if reponse.status_code != 200:
+                    raise CommandError(f'{page}: HTTP {reponse.status_code}')
+                corps[page] = reponse.content
+        return corps
@@ -0,0 +1,162 @@
+"""
+Test de charge des connexions à la base de données
+
+Des workers simultanés (threads : une connexion Django chacun, comme un worker
+gunicorn) enchaînent des requêtes HTTP simulées : signaux request_started et
+request_finished autour de quelques requêtes SQL en lecture. Le cycle de vie
+des connexions est donc celui des vues (CONN_MAX_AGE, CONN_HEALTH_CHECKS,
+pool). Le benchmark ne fait que des lectures sur la base configurée.
+
+Rapporte la latence par requête, le nombre de connexions ouvertes côté Django
+et, sur PostgreSQL, le nombre de connexions vues par le serveur
+(pg_stat_activity) pendant le test.
+
+Usage:
+    python manage.py bench_connexions_db --workers 16 --requetes 500
+    python manage.py bench_connexions_db --conn-max-age 0     # sans connexions persistantes
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+
+from cahier_charges.management.commands.bench_paiements import percentile
+from cahier_charges.models import PlanAbonnement
+
+
+class _Echantillonneur(threading.Thread):
+    """Compte périodiquement les connexions ouvertes sur le serveur PostgreSQL"""
+
+    def __init__(self, alias, intervalle=0.1):
+        super().__init__(daemon=True)
+        self.alias = alias
+        self.intervalle = intervalle
+        self.valeurs = []
+        self._arret = threading.Event()
+
+    def run(self):
+        connexion = connections[self.alias]
+        try:
+            while not self._arret.is_set():
+                with connexion.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT count(*) FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()"
+                    )
+                    self.valeurs.append(cursor.fetchone()[0])
+                self._arret.wait(self.intervalle)
+        finally:
+            connexion.close()
+
+    def arreter(self):
+        self._arret.set()
+        self.join()
+
+
+class Command(BaseCommand):
+    help = 'Mesure la latence et le nombre de connexions à la base sous charge concurrente.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Workers simultanés (défaut: 8)')
+        parser.add_argument('--requetes', type=int, default=200, help='Requêtes HTTP simulées par worker (défaut: 200)')
+        parser.add_argument('--sql-par-requete', type=int, default=3,
+                            help='Requêtes SQL par requête HTTP simulée (défaut: 3)')
+        parser.add_argument('--conn-max-age', type=int,
+                            help='Remplace CONN_MAX_AGE pendant le test (0: une connexion par requête)')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Alias de la base (défaut: default)')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['requetes'] < 1:
+            raise CommandError('--workers et --requetes doivent être positifs')
+        alias = options['database']
+        reglages = connections.settings[alias]
+        if options['conn_max_age'] is not None:
+            # Lu à l'ouverture de chaque connexion de thread
+            reglages['CONN_MAX_AGE'] = options['conn_max_age']
+
+        ouvertures = []
+        verrou = threading.Lock()
+
+        def compter_ouverture(sender, connection, **kwargs):
+            echantillonnage = echantillonneur is not None and threading.get_ident() == echantillonneur.ident
+            if connection.alias == alias and not echantillonnage:
+                with verrou:
+                    ouvertures.append(threading.get_ident())
+
+        echantillonneur = None
+        if connections[alias].vendor == 'postgresql':
+            echantillonneur = _Echantillonneur(alias)
+            echantillonneur.start()
+
+        # Les logs SQL en DEBUG faussent les mesures
+        logging.disable(logging.ERROR)
+        connection_created.connect(compter_ouverture)
+        debut = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executeur:
+                lots = list(executeur.map(
+                    lambda _: self._worker(alias, options['requetes'], options['sql_par_requete']),
+                    range(options['workers']),
+                ))
+        finally:
+            duree = time.perf_counter() - debut
+            connection_created.disconnect(compter_ouverture)
+            logging.disable(logging.NOTSET)
+            if echantillonneur:
+                echantillonneur.arreter()
+
+        latences = [latence for lot, _ in lots for latence in lot]
+        erreurs = [erreur for _, lot in lots for erreur in lot]
+        self._afficher(reglages, options, latences, erreurs, ouvertures, echantillonneur, duree)
+
+    def _worker(self, alias, nombre, sql_par_requete):
+        connexion = connections[alias]
+        latences, erreurs = [], []
+        try:
+            for _ in range(nombre):
+                debut = time.perf_counter()
+                # Même cycle que le gestionnaire WSGI : close_old_connections avant et après
+                request_started.send(sender=self.__class__)
+                try:
+                    for _ in range(sql_par_requete):
+                        list(PlanAbonnement.objects.using(alias).values_list('id', 'nom')[:5])
+                except Exception as e:
+                    erreurs.append(f'{type(e).__name__}: {e}')
+                finally:
+                    request_finished.send(sender=self.__class__)
+                latences.append((time.perf_counter() - debut) * 1000)
+        finally:
+            connexion.close()
+        return latences, erreurs
+
+    def _afficher(self, reglages, options, latences, erreurs, ouvertures, echantillonneur, duree):
+        options_base = reglages.get('OPTIONS', {})
+        self.stdout.write(self.style.MIGRATE_HEADING('Configuration'))
+        self.stdout.write(f"  Moteur              : {reglages['ENGINE']}")
+        self.stdout.write(f"  CONN_MAX_AGE        : {reglages.get('CONN_MAX_AGE')}")
+        self.stdout.write(f"  CONN_HEALTH_CHECKS  : {reglages.get('CONN_HEALTH_CHECKS')}")
+        if 'pool' in options_base:
+            self.stdout.write(f"  Pool                : {options_base['pool']}")
+        self.stdout.write(f"  Workers x requêtes  : {options['workers']} x {options['requetes']} "
+                          f"({options['sql_par_requete']} SQL par requête)")
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Résultats'))
+        total = len(latences)
+        self.stdout.write(f"  Débit               : {total / duree:.0f} requêtes/s ({total} en {duree:.2f} s)")
+        self.stdout.write(
+            f"  Latence (ms)        : p50 {percentile(latences, 50):.2f}  p95 {percentile(latences, 95):.2f}  "
+            f"p99 {percentile(latences, 99):.2f}  max {max(latences, default=0):.2f}"
+        )
+        self.stdout.write(f"  Connexions ouvertes : {len(ouvertures)} "
+                          f"({len(ouvertures) / max(total, 1):.2f} par requête, {len(set(ouvertures))} threads)")
+        if echantillonneur and echantillonneur.valeurs:
+            valeurs = echantillonneur.valeurs
+            self.stdout.write(f"  pg_stat_activity    : max {max(valeurs)}  moyenne {sum(valeurs) / len(valeurs):.1f} "
+                              f"({len(valeurs)} échantillons)")
+        if erreurs:
+            self.stdout.write(self.style.ERROR(f"  Erreurs             : {len(erreurs)} (première: {erreurs[0]})"))
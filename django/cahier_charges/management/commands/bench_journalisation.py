@@ -0,0 +1,93 @@
+"""
+Benchmark du coût de la journalisation dans le thread de la requête
+
+Émet des enregistrements au format du projet vers un fichier temporaire :
+- synchrone : logging.FileHandler (profil developpement), écriture pendant l'appel
+- asynchrone : HandlerAsynchrone (profil production), file + thread d'écriture
+et affiche la latence par appel vue par l'appelant (p50, p99, max). Les
+enregistrements sont émis à un débit fixe (--debit), la requête rendant la main
+entre deux appels (E/S, base de données) comme en production. --lenteur-ms
+simule un disque lent (volume réseau, disque saturé) en ajoutant une attente
+à chaque écriture.
+
+Usage:
+    python manage.py bench_journalisation
+    python manage.py bench_journalisation --enregistrements 50000
+    python manage.py bench_journalisation --lenteur-ms 2
+"""
+
+import logging
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cahier_charges.journalisation import HandlerAsynchrone
+from cahier_charges.management.commands.bench_paiements import percentile
+
+FORMAT = '{levelname} {asctime} {module} {message}'
+
+
+def _ralentir(handler, lenteur_ms):
+    emit = handler.emit
+
+    def emit_lent(record):
+        emit(record)
+        time.sleep(lenteur_ms / 1000)
+
+    handler.emit = emit_lent
+    return handler
+
+
+class Command(BaseCommand):
+    help = 'Compare la latence de journalisation synchrone (FileHandler) et asynchrone (HandlerAsynchrone).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--enregistrements', type=int, default=5000, help='Enregistrements par mode (défaut: 5000)')
+        parser.add_argument('--debit', type=int, default=2000, help='Enregistrements par seconde (défaut: 2000)')
+        parser.add_argument('--lenteur-ms', type=float, default=0, help='Attente ajoutée à chaque écriture sur disque')
+
+    def handle(self, *args, **options):
+        nombre = options['enregistrements']
+        if nombre < 1 or options['debit'] < 1:
+            raise CommandError('--enregistrements et --debit doivent être positifs')
+        intervalle = 1 / options['debit']
+        lenteur_ms = options['lenteur_ms']
+
+        with tempfile.TemporaryDirectory(prefix='bench_journalisation_') as repertoire:
+            modes = {
+                'synchrone': lambda: _ralentir(logging.FileHandler(os.path.join(repertoire, 'synchrone.log')), lenteur_ms),
+                'asynchrone': lambda: self._asynchrone(os.path.join(repertoire, 'asynchrone.log'), lenteur_ms),
+            }
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"Latence par appel ({nombre} enregistrements, {options['debit']}/s, "
+                f"écriture +{lenteur_ms:g} ms, µs)"
+            ))
+            self.stdout.write(f"  {'Mode':12} {'p50':>8} {'p99':>8} {'max':>9} {'total (ms)':>11} {'perdus':>7}")
+            for mode, creer in modes.items():
+                handler = creer()
+                handler.setFormatter(logging.Formatter(FORMAT, style='{'))
+                logger = logging.getLogger(f'bench_journalisation.{mode}')
+                logger.handlers = [handler]
+                logger.propagate = False
+                logger.setLevel(logging.INFO)
+
+                durees = []
+                for i in range(nombre):
+                    debut = time.perf_counter()
+                    logger.info('SELECT "cahier_charges_cahiercharges"."id" FROM ... WHERE "id" = %s', i)
+                    durees.append((time.perf_counter() - debut) * 1e6)
+                    time.sleep(intervalle)
+
+                handler.close()
+                self.stdout.write(
+                    f'  {mode:12} {percentile(durees, 50):8.1f} {percentile(durees, 99):8.1f} '
+                    f'{max(durees):9.1f} {sum(durees) / 1000:11.1f} {getattr(handler, "perdus", 0):7}'
+                )
+
+    def _asynchrone(self, chemin, lenteur_ms):
+        handler = HandlerAsynchrone(chemin, taille_max=50 * 1024 * 1024, console=False)
+        for destination in handler.destinations:
+            _ralentir(destination, lenteur_ms)
+        return handler
@@ -0,0 +1,125 @@
+"""
+Benchmark des pages mises en cache (cahier_charges.cache_pages)
+
+Mesure le débit (requêtes par seconde), la latence et les requêtes SQL de la
+page d'accueil anonyme, de la grille des types de projet et de la page des
+forfaits, sans cache (DummyCache) puis avec le cache mémoire local. Le
+benchmark tourne dans une base de test jetable, sur le client de test Django
+(sans serveur HTTP : seul le coût applicatif est mesuré).
+
+Usage:
+    python manage.py bench_pages
+    python manage.py bench_pages --requetes 500
+"""
+
+import contextlib
+import io
+import logging
+import os
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from cahier_charges.management.commands.bench_paiements import percentile
+
+PROFILS = {
+    'sans_cache': {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+    'cache': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench_pages'}},
+}
+
+# Page -> (nom d'URL, visiteur anonyme)
+PAGES = {
+    'accueil': ('index', True),
+    'types_projet': ('creer_cahier', False),
+    'forfaits': ('choix_abonnement', False),
+}
+
+
+class Command(BaseCommand):
+    help = 'Mesure le débit des pages publiques et des forfaits avec et sans cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requetes', type=int, default=200, help='Requêtes par page et par profil (défaut: 200)')
+
+    def handle(self, *args, **options):
+        if options['requetes'] < 1:
+            raise CommandError('--requetes doit être positif')
+
+        # Les logs SQL en DEBUG et les print des vues faussent les mesures
+        logging.disable(logging.ERROR)
+        nom_origine = self._creer_base_test()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                call_command('init_plans')
+            utilisateur = User.objects.create_user('bench_pages', 'bench_pages@example.com', 'motdepasse')
+            resultats = {}
+            for profil, caches in PROFILS.items():
+                with override_settings(CACHES=caches):
+                    resultats[profil] = self._mesurer(utilisateur, options['requetes'])
+        finally:
+            connection.creation.destroy_test_db(nom_origine, verbosity=0)
+            logging.disable(logging.NOTSET)
+        self._afficher(resultats, options)
+
+    def _creer_base_test(self):
+        if connection.vendor == 'sqlite':
+            fd, chemin = tempfile.mkstemp(suffix='.sqlite3', prefix='bench_pages_')
+            os.close(fd)
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = chemin
+        nom_origine = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        return nom_origine
+
+    # Mesure
+
+    def _mesurer(self, utilisateur, nombre):
+        anonyme = Client(HTTP_HOST='localhost', HTTP_ACCEPT_LANGUAGE='fr')
+        connecte = Client(HTTP_HOST='localhost', HTTP_ACCEPT_LANGUAGE='fr')
+        connecte.force_login(utilisateur)
+
+        mesures = {}
+        for page, (nom_url, est_anonyme) in PAGES.items():
+            client = anonyme if est_anonyme else connecte
+            url = reverse(nom_url)
+            durees, requetes = [], 0
+            with contextlib.redirect_stdout(io.StringIO()):
+                debut_total = time.perf_counter()
+                for _ in range(nombre):
+                    debut = time.perf_counter()
+                    with CaptureQueriesContext(connection) as capture:
+                        reponse = client.get(url)
+                    durees.append((time.perf_counter() - debut) * 1000)
+                    if reponse.status_code != 200:
+                        raise CommandError(f'{page}: HTTP {reponse.status_code}')
+                    requetes += len(capture.captured_queries)
+                total = time.perf_counter() - debut_total
+            mesures[page] = {
+                'rps': nombre / total,
+                'p50': percentile(durees, 50),
+                'p95': percentile(durees, 95),
+                'requetes': requetes / nombre,
+            }
+        return mesures
+
+    # Rapport
+
+    def _afficher(self, resultats, options):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Pages ({options['requetes']} requêtes par page)"))
+        self.stdout.write(
+            f"  {'Page':14} {'Profil':12} {'req/s':>8} {'p50 (ms)':>9} {'p95 (ms)':>9} {'SQL/req':>8}"
+        )
+        for page in PAGES:
+            for profil, mesures in resultats.items():
+                m = mesures[page]
+                self.stdout.write(
+                    f"  {page:14} {profil:12} {m['rps']:8.0f} {m['p50']:9.2f} {m['p95']:9.2f} {m['requetes']:8.1f}"
+                )
+            sans, avec = resultats['sans_cache'][page]['rps'], resultats['cache'][page]['rps']
+            self.stdout.write(f"  {'':14} {'gain':12} {avec / sans:7.1f}x")
@@ -0,0 +1,300 @@
+"""
+Benchmark de bout en bout du flux de paiement LigdiCash
+
+Des utilisateurs simulés parcourent en parallèle initialisation -> page de
+paiement -> webhook -> retour, contre views_paiement et le simulateur LigdiCash
+local. Le benchmark tourne dans une base de test jetable.
+
+Usage:
+    python manage.py bench_paiements --utilisateurs 200 --concurrence 16
+    python manage.py bench_paiements --sortie bench.json
+    python manage.py bench_paiements --comparer bench.json
+"""
+
+import contextlib
+import io
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from cahier_charges.ligdicash_config import LIGDICASH_CONFIG
+from cahier_charges.ligdicash_simulateur import SimulateurLigdiCash, parser_repartition
+from cahier_charges.models import Abonnement, PlanAbonnement
+from cahier_charges.models_paiement import TransactionLigdiCash
+
+ETAPES = ('initiation', 'redirection', 'webhook', 'retour')
+PREFIXES_ECRITURE = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def percentile(valeurs, p):
+    """Percentile par rang le plus proche"""
+    if not valeurs:
+        return 0.0
+    valeurs = sorted(valeurs)
+    rang = max(1, math.ceil(p / 100 * len(valeurs)))
+    return valeurs[rang - 1]
+
+
+class _SansRedirection(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Mesure le débit et la latence du flux de paiement complet contre le simulateur LigdiCash.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--utilisateurs', type=int, default=50, help='Nombre de paiements simulés (défaut: 50)')
+        parser.add_argument('--concurrence', type=int, default=8, help='Utilisateurs simultanés (défaut: 8)')
+        parser.add_argument('--plan', default='essentiel', help='Plan payé (défaut: essentiel)')
+        parser.add_argument('--latence-min', type=float, default=0, help='Latence min. du simulateur en ms')
+        parser.add_argument('--latence-max', type=float, default=0, help='Latence max. du simulateur en ms')
+        parser.add_argument('--codes', default='00=100', help='Répartition des résultats, ex: 00=90,02=10')
+        parser.add_argument('--sortie', help='Fichier JSON où enregistrer les résultats')
+        parser.add_argument('--comparer', help='Fichier JSON d\'un run précédent à comparer')
+        parser.add_argument('--seuil-regression', type=float, default=20.0,
+                            help='Écart (%%) au-delà duquel une métrique est signalée comme régression (défaut: 20)')
+        parser.add_argument('--seuil-absolu-ms', type=float, default=5.0,
+                            help='Écart minimal en ms pour signaler une régression de latence (défaut: 5)')
+
+    def handle(self, *args, **options):
+        if options['utilisateurs'] < 1 or options['concurrence'] < 1:
+            raise CommandError('--utilisateurs et --concurrence doivent être positifs')
+        try:
+            repartition = parser_repartition(options['codes'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        # Les logs SQL en DEBUG et les print des vues faussent les mesures
+        # (les erreurs du parcours sont collectées et affichées dans le rapport)
+        logging.disable(logging.ERROR)
+        base_test = self._creer_base_test()
+        simulateur = SimulateurLigdiCash(
+            port=0,
+            latence_ms=(options['latence_min'], options['latence_max']),
+            repartition=repartition,
+            envoyer_callbacks=False,
+        )
+        urls_origine = (LIGDICASH_CONFIG['API_URL'], LIGDICASH_CONFIG['VERIFY_URL'])
+        try:
+            simulateur.demarrer()
+            LIGDICASH_CONFIG['API_URL'] = simulateur.url_api
+            LIGDICASH_CONFIG['VERIFY_URL'] = simulateur.url_verification
+            resultats = self._executer(simulateur, options)
+        finally:
+            LIGDICASH_CONFIG['API_URL'], LIGDICASH_CONFIG['VERIFY_URL'] = urls_origine
+            simulateur.arreter()
+            self._detruire_base_test(base_test)
+            logging.disable(logging.NOTSET)
+
+        self._afficher(resultats)
+        if options['sortie']:
+            with open(options['sortie'], 'w', encoding='utf-8') as f:
+                json.dump(resultats, f, indent=2)
+            self.stdout.write(f"Résultats enregistrés dans {options['sortie']}")
+        if options['comparer']:
+            self._comparer(resultats, options['comparer'], options['seuil_regression'], options['seuil_absolu_ms'])
+
+    # Base de test
+
+    def _creer_base_test(self):
+        if connection.vendor == 'sqlite':
+            # Fichier plutôt que mémoire partagée: les threads écrivent en concurrence
+            fd, chemin = tempfile.mkstemp(suffix='.sqlite3', prefix='bench_paiements_')
+            os.close(fd)
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = chemin
+        nom_origine = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        return nom_origine
+
+    def _detruire_base_test(self, nom_origine):
+        connection.creation.destroy_test_db(nom_origine, verbosity=0)
+
+    # Exécution
+
+    def _executer(self, simulateur, options):
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_command('init_plans')
+        plan = PlanAbonnement.objects.get(nom=options['plan'])
+        utilisateurs = [
+            # Sans mot de passe: force_login suffit et évite le coût du hachage
+            User.objects.create_user(f'bench_{i}', f'bench_{i}@example.com')
+            for i in range(options['utilisateurs'])
+        ]
+
+        mesures = {etape: [] for etape in ETAPES}
+        requetes = {'total': 0, 'ecritures': 0}
+        erreurs = []
+        lock = threading.Lock()
+        ouvreur = urllib.request.build_opener(_SansRedirection)
+
+        def parcours(utilisateur):
+            client = Client(HTTP_HOST=urlparse(LIGDICASH_CONFIG['RETURN_URL']).hostname or 'localhost')
+            client.force_login(utilisateur)
+            durees = {}
+            nb_requetes = nb_ecritures = 0
+            try:
+                # 1. Initialisation du paiement
+                with CaptureQueriesContext(connection) as capture:
+                    debut = time.perf_counter()
+                    reponse = client.get(reverse('initier_paiement_ligdicash', args=[plan.id]))
+                    durees['initiation'] = time.perf_counter() - debut
+                nb_requetes, nb_ecritures = self._compter(capture, nb_requetes, nb_ecritures)
+                url_paiement = reponse.get('Location', '')
+                if not url_paiement.startswith(simulateur.url):
+                    raise RuntimeError(f"initiation: redirection inattendue vers {url_paiement!r}")
+                token = url_paiement.rstrip('/').rsplit('/', 1)[-1]
+
+                # 2. Redirection vers la page de paiement (côté fournisseur)
+                debut = time.perf_counter()
+                try:
+                    ouvreur.open(url_paiement, timeout=30)
+                except urllib.error.HTTPError as e:
+                    if e.code != 302:
+                        raise
+                durees['redirection'] = time.perf_counter() - debut
+
+                # 3. Webhook signé du fournisseur
+                _, corps, signature = simulateur.finaliser(token)
+                with CaptureQueriesContext(connection) as capture:
+                    debut = time.perf_counter()
+                    reponse = client.post(reverse('notification_ligdicash'), corps,
+                                          content_type='application/json',
+                                          HTTP_X_LIGDICASH_SIGNATURE=signature)
+                    durees['webhook'] = time.perf_counter() - debut
+                nb_requetes, nb_ecritures = self._compter(capture, nb_requetes, nb_ecritures)
+                if reponse.status_code != 200:
+                    raise RuntimeError(f"webhook: HTTP {reponse.status_code}")
+
+                # 4. Retour de l'utilisateur sur le site
+                with CaptureQueriesContext(connection) as capture:
+                    debut = time.perf_counter()
+                    client.get(reverse('retour_ligdicash'), {'token': token})
+                    durees['retour'] = time.perf_counter() - debut
+                nb_requetes, nb_ecritures = self._compter(capture, nb_requetes, nb_ecritures)
+            except Exception as e:
+                with lock:
+                    erreurs.append(f'{utilisateur.username}: {e}')
+                return
+            finally:
+                connection.close()
+
+            with lock:
+                for etape, duree in durees.items():
+                    mesures[etape].append(duree)
+                requetes['total'] += nb_requetes
+                requetes['ecritures'] += nb_ecritures
+
+        debut = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            with ThreadPoolExecutor(max_workers=options['concurrence']) as pool:
+                list(pool.map(parcours, utilisateurs))
+        duree_totale = time.perf_counter() - debut
+
+        reussies = TransactionLigdiCash.objects.filter(statut='successful').count()
+        abonnements = Abonnement.objects.filter(plan=plan, statut='actif').count()
+
+        return {
+            'parametres': {
+                'utilisateurs': options['utilisateurs'],
+                'concurrence': options['concurrence'],
+                'codes': options['codes'],
+                'latence_ms': [options['latence_min'], options['latence_max']],
+                'base': connection.vendor,
+            },
+            'duree_s': duree_totale,
+            'paiements_reussis': reussies,
+            'abonnements_actives': abonnements,
+            'transactions_par_seconde': reussies / duree_totale if duree_totale else 0.0,
+            'erreurs': erreurs,
+            'requetes_par_paiement': requetes['total'] / max(1, len(mesures['retour'])),
+            'ecritures_par_paiement': requetes['ecritures'] / max(1, len(mesures['retour'])),
+            'etapes': {
+                etape: {
+                    'n': len(durees),
+                    'p50_ms': percentile(durees, 50) * 1000,
+                    'p95_ms': percentile(durees, 95) * 1000,
+                    'p99_ms': percentile(durees, 99) * 1000,
+                    'max_ms': max(durees, default=0) * 1000,
+                }
+                for etape, durees in mesures.items()
+            },
+        }
+
+    @staticmethod
+    def _compter(capture, nb_requetes, nb_ecritures):
+        nb_requetes += len(capture.captured_queries)
+        nb_ecritures += sum(
+            1 for q in capture.captured_queries
+            if q['sql'].lstrip().upper().startswith(PREFIXES_ECRITURE)
+        )
+        return nb_requetes, nb_ecritures
+
+    # Rapport
+
+    def _afficher(self, r):
+        p = r['parametres']
+        self.stdout.write(self.style.SUCCESS(
+            f"Benchmark paiements: {p['utilisateurs']} utilisateurs, concurrence {p['concurrence']}, "
+            f"codes {p['codes']}, base {p['base']}"
+        ))
+        self.stdout.write(f"{'Étape':<12} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for etape in ETAPES:
+            e = r['etapes'][etape]
+            self.stdout.write(
+                f"{etape:<12} {e['n']:>5} {e['p50_ms']:>9.1f} {e['p95_ms']:>9.1f} {e['p99_ms']:>9.1f} {e['max_ms']:>9.1f}"
+            )
+        self.stdout.write(f"Durée totale           : {r['duree_s']:.2f} s")
+        self.stdout.write(f"Paiements réussis      : {r['paiements_reussis']} ({r['transactions_par_seconde']:.1f} transactions/s)")
+        self.stdout.write(f"Abonnements activés    : {r['abonnements_actives']}")
+        self.stdout.write(f"Requêtes SQL / paiement: {r['requetes_par_paiement']:.1f}")
+        self.stdout.write(f"Écritures / paiement   : {r['ecritures_par_paiement']:.1f}")
+        if r['erreurs']:
+            self.stdout.write(self.style.ERROR(f"Erreurs: {len(r['erreurs'])}"))
+            for erreur in r['erreurs'][:10]:
+                self.stdout.write(f"  {erreur}")
+
+    def _comparer(self, actuel, chemin, seuil, seuil_absolu_ms):
+        with open(chemin, encoding='utf-8') as f:
+            reference = json.load(f)
+
+        # (libellé, valeur de référence, valeur actuelle, plus grand = meilleur, écart absolu minimal)
+        metriques = [
+            ('transactions/s', reference['transactions_par_seconde'], actuel['transactions_par_seconde'], True, 0),
+            ('requêtes/paiement', reference['requetes_par_paiement'], actuel['requetes_par_paiement'], False, 0),
+            ('écritures/paiement', reference['ecritures_par_paiement'], actuel['ecritures_par_paiement'], False, 0),
+        ]
+        for etape in ETAPES:
+            metriques.append((f'{etape} p95 ms', reference['etapes'][etape]['p95_ms'],
+                              actuel['etapes'][etape]['p95_ms'], False, seuil_absolu_ms))
+
+        self.stdout.write(f"\nComparaison avec {chemin} (seuil {seuil:g}%)")
+        regressions = []
+        for libelle, avant, apres, plus_grand_meilleur, ecart_minimal in metriques:
+            ecart = ((apres - avant) / avant * 100) if avant else 0.0
+            degradation = -ecart if plus_grand_meilleur else ecart
+            ligne = f"  {libelle:<22} {avant:>10.2f} -> {apres:>10.2f} ({ecart:+.1f}%)"
+            if degradation > seuil and abs(apres - avant) >= ecart_minimal:
+                regressions.append(libelle)
+                self.stdout.write(self.style.ERROR(ligne + '  REGRESSION'))
+            else:
+                self.stdout.write(ligne)
+
+        if regressions:
+            raise CommandError(f"Régressions détectées: {', '.join(regressions)}")
@@ -0,0 +1,158 @@
+"""
+Benchmark des allers-retours en base liés aux sessions et aux messages flash
+
+Rejoue le parcours connexion -> création d'un cahier -> aperçu -> PDF avec
+plusieurs profils de stockage (SESSION_PROFIL / MESSAGES_COOKIE) et compte, par
+parcours, les requêtes SQL, les écritures et les requêtes sur django_session.
+Le benchmark tourne dans une base de test jetable.
+
+Usage:
+    python manage.py bench_sessions
+    python manage.py bench_sessions --parcours 50
+"""
+
+import contextlib
+import io
+import logging
+import os
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from cahier_charges.management.commands.bench_paiements import PREFIXES_ECRITURE, percentile
+from cahier_charges.models import Abonnement, PlanAbonnement
+
+MESSAGES_SESSION = 'django.contrib.messages.storage.fallback.FallbackStorage'
+MESSAGES_COOKIE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+# Profil -> (SESSION_ENGINE, MESSAGE_STORAGE)
+PROFILS = {
+    'db': ('django.contrib.sessions.backends.db', MESSAGES_SESSION),
+    'cached_db': ('django.contrib.sessions.backends.cached_db', MESSAGES_COOKIE),
+    'signed_cookies': ('django.contrib.sessions.backends.signed_cookies', MESSAGES_COOKIE),
+}
+
+ETAPES = ('page_connexion', 'connexion', 'mes_cahiers', 'creation', 'apercu', 'pdf')
+
+
+class Command(BaseCommand):
+    help = 'Compte les requêtes SQL du parcours connexion -> création -> aperçu -> PDF selon le stockage des sessions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--parcours', type=int, default=20, help='Parcours par profil (défaut: 20)')
+        parser.add_argument('--profil', choices=[*PROFILS, 'tous'], default='tous',
+                            help='Profil mesuré (défaut: tous ; db = comportement Django par défaut)')
+
+    def handle(self, *args, **options):
+        if options['parcours'] < 1:
+            raise CommandError('--parcours doit être positif')
+        profils = list(PROFILS) if options['profil'] == 'tous' else [options['profil']]
+
+        # Les logs SQL en DEBUG et les print des vues faussent les mesures
+        logging.disable(logging.ERROR)
+        nom_origine = self._creer_base_test()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                call_command('init_plans')
+            plan = PlanAbonnement.objects.get(nom='essentiel')
+            resultats = {}
+            for profil in profils:
+                moteur, stockage = PROFILS[profil]
+                # Hachage rapide : le coût de PBKDF2 n'est pas l'objet de la mesure
+                with override_settings(SESSION_ENGINE=moteur, MESSAGE_STORAGE=stockage,
+                                       PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']):
+                    resultats[profil] = self._mesurer(profil, plan, options['parcours'])
+        finally:
+            connection.creation.destroy_test_db(nom_origine, verbosity=0)
+            logging.disable(logging.NOTSET)
+        self._afficher(resultats, options)
+
+    def _creer_base_test(self):
+        if connection.vendor == 'sqlite':
+            fd, chemin = tempfile.mkstemp(suffix='.sqlite3', prefix='bench_sessions_')
+            os.close(fd)
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = chemin
+        nom_origine = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        return nom_origine
+
+    # Mesure
+
+    def _mesurer(self, profil, plan, nombre):
+        requetes = {etape: {'total': 0, 'ecritures': 0, 'session': 0} for etape in ETAPES}
+        durees = []
+        for i in range(nombre):
+            utilisateur = User.objects.create_user(f'{profil}_{i}', f'{profil}_{i}@example.com', 'motdepasse')
+            Abonnement.objects.filter(utilisateur=utilisateur).update(
+                plan=plan, date_fin=timezone.now().date() + timezone.timedelta(days=30),
+            )
+            debut = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                self._parcours(Client(HTTP_HOST='localhost'), requetes)
+            durees.append((time.perf_counter() - debut) * 1000)
+        return {'requetes': requetes, 'durees': durees, 'parcours': nombre}
+
+    def _parcours(self, client, requetes):
+        def etape(nom, methode, url, statut, **kwargs):
+            with CaptureQueriesContext(connection) as capture:
+                reponse = getattr(client, methode)(url, **kwargs)
+            if reponse.status_code != statut:
+                raise CommandError(f'{nom}: HTTP {reponse.status_code} au lieu de {statut}')
+            for requete in capture.captured_queries:
+                sql = requete['sql'].lstrip().upper()
+                requetes[nom]['total'] += 1
+                requetes[nom]['ecritures'] += sql.startswith(PREFIXES_ECRITURE)
+                requetes[nom]['session'] += 'DJANGO_SESSION' in sql
+            return reponse
+
+        etape('page_connexion', 'get', reverse('authentification'), 200)
+        nom_utilisateur = User.objects.order_by('-id').values_list('username', flat=True).first()
+        etape('connexion', 'post', reverse('authentification'), 302,
+              data={'action': 'login', 'username': nom_utilisateur, 'password': 'motdepasse'})
+        etape('mes_cahiers', 'get', reverse('mes_cahiers'), 200)
+        reponse = etape('creation', 'post', reverse('creer_cahier_type', args=['site_web']), 302, data={
+            'type_projet': 'site_web', 'nom_projet': 'Boutique en ligne',
+            'description': 'Vente de produits artisanaux avec paiement mobile.',
+            'technologies': 'Django',
+        })
+        etape('apercu', 'get', reponse['Location'], 200)
+        cahier_id = reponse['Location'].rstrip('/').rsplit('/', 1)[-1]
+        etape('pdf', 'get', reverse('generer_pdf', args=[cahier_id]), 200)
+
+    # Rapport
+
+    def _afficher(self, resultats, options):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Requêtes SQL par parcours (moyenne sur {options['parcours']} parcours)"
+        ))
+        self.stdout.write(f"  {'':16}" + ''.join(f'{profil:>16}' for profil in resultats))
+        for etape in ETAPES:
+            valeurs = []
+            for r in resultats.values():
+                compte = r['requetes'][etape]
+                n = r['parcours']
+                valeurs.append(f"{compte['total'] / n:.1f} ({compte['ecritures'] / n:.1f} é.)")
+            self.stdout.write(f'  {etape:16}' + ''.join(f'{valeur:>16}' for valeur in valeurs))
+
+        lignes = [
+            ('Total', 'total'),
+            ('Écritures', 'ecritures'),
+            ('django_session', 'session'),
+        ]
+        self.stdout.write('')
+        for libelle, cle in lignes:
+            valeurs = [
+                sum(compte[cle] for compte in r['requetes'].values()) / r['parcours']
+                for r in resultats.values()
+            ]
+            self.stdout.write(f'  {libelle:16}' + ''.join(f'{valeur:>16.1f}' for valeur in valeurs))
+        valeurs = [percentile(r['durees'], 50) for r in resultats.values()]
+        self.stdout.write(f"  {'Durée p50 (ms)':16}" + ''.join(f'{valeur:>16.1f}' for valeur in valeurs))
@@ -0,0 +1,213 @@
+"""
+Benchmark des écritures concurrentes sur SQLite
+
+Compare le backend SQLite de Django (journal DELETE, transactions DEFERRED)
+au profil de production (cahier_charges.backends.sqlite3 : BEGIN IMMEDIATE et
+settings.SQLITE_PRAGMAS). Des écrivains simultanés rejouent le chemin
+d'écriture de creer_cahier (lecture du compteur du mois, création du cahier,
+incrément du compteur, dans une transaction) pendant que des lecteurs
+parcourent la liste des cahiers. Chaque profil tourne sur une base jetable.
+
+Usage:
+    python manage.py bench_sqlite_ecritures
+    python manage.py bench_sqlite_ecritures --ecrivains 16 --operations 100 --profil production
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from cahier_charges.apps import MOTEUR_SQLITE_PRODUCTION
+from cahier_charges.management.commands.bench_paiements import percentile
+from cahier_charges.models import CahierCharges, CahierUtilisation
+
+PROFILS = {
+    'django': 'django.db.backends.sqlite3',
+    'production': MOTEUR_SQLITE_PRODUCTION,
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare les écritures concurrentes sur SQLite avant et après le profil de production.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ecrivains', type=int, default=8, help='Écrivains simultanés (défaut: 8)')
+        parser.add_argument('--lecteurs', type=int, default=2, help='Lecteurs simultanés (défaut: 2)')
+        parser.add_argument('--operations', type=int, default=50,
+                            help='Créations de cahier par écrivain (défaut: 50)')
+        parser.add_argument('--profil', choices=[*PROFILS, 'tous'], default='tous',
+                            help='Profil mesuré (défaut: tous)')
+
+    def handle(self, *args, **options):
+        if options['ecrivains'] < 1 or options['operations'] < 1 or options['lecteurs'] < 0:
+            raise CommandError('--ecrivains et --operations doivent être positifs')
+
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('Benchmark SQLite : la base configurée doit être SQLite (DB_ENGINE=sqlite3)')
+
+        profils = list(PROFILS) if options['profil'] == 'tous' else [options['profil']]
+        # Les logs SQL en DEBUG faussent les mesures
+        logging.disable(logging.ERROR)
+        nom_origine, modele = self._creer_modele()
+        try:
+            resultats = {profil: self._mesurer(profil, modele, options) for profil in profils}
+        finally:
+            connections['default'].creation.destroy_test_db(nom_origine, verbosity=0)
+            logging.disable(logging.NOTSET)
+        self._afficher(resultats, options)
+
+    # Bases jetables
+
+    def _creer_modele(self):
+        """Base migrée via la connexion 'default' (certaines migrations de données l'exigent), copiée pour chaque profil"""
+        fd, chemin = tempfile.mkstemp(suffix='.sqlite3', prefix='bench_sqlite_modele_')
+        os.close(fd)
+        connexion = connections['default']
+        connexion.settings_dict.setdefault('TEST', {})['NAME'] = chemin
+        nom_origine = connexion.settings_dict['NAME']
+        connexion.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        connexion.close()
+        return nom_origine, chemin
+
+    def _creer_base(self, profil, modele):
+        fd, chemin = tempfile.mkstemp(suffix='.sqlite3', prefix=f'bench_sqlite_{profil}_')
+        os.close(fd)
+        shutil.copyfile(modele, chemin)
+        alias = f'bench_sqlite_{profil}'
+        reglages = dict(connections.settings['default'])
+        reglages.update(ENGINE=PROFILS[profil], NAME=chemin, OPTIONS={}, TEST={})
+        connections.settings[alias] = reglages
+        return alias, chemin
+
+    def _detruire_base(self, alias, chemin):
+        connections[alias].close()
+        del connections.settings[alias]
+        for suffixe in ('', '-wal', '-shm'):
+            if os.path.exists(chemin + suffixe):
+                os.remove(chemin + suffixe)
+
+    # Mesure
+
+    def _mesurer(self, profil, modele, options):
+        alias, chemin = self._creer_base(profil, modele)
+        try:
+            # bulk_create : pas de signal post_save (profil et abonnement créés sur 'default')
+            utilisateurs = User.objects.using(alias).bulk_create([
+                User(username=f'bench_{i}', email=f'bench_{i}@example.com')
+                for i in range(options['ecrivains'])
+            ])
+            mois = timezone.now().date().replace(day=1)
+            CahierUtilisation.objects.using(alias).bulk_create([
+                CahierUtilisation(utilisateur=utilisateur, mois=mois) for utilisateur in utilisateurs
+            ])
+            connections[alias].close()
+
+            arret_lecteurs = threading.Event()
+            with ThreadPoolExecutor(max_workers=options['ecrivains'] + options['lecteurs']) as executeur:
+                lecteurs = [
+                    executeur.submit(self._lecteur, alias, utilisateurs[i % len(utilisateurs)], arret_lecteurs)
+                    for i in range(options['lecteurs'])
+                ]
+                debut = time.perf_counter()
+                ecrivains = [
+                    executeur.submit(self._ecrivain, alias, utilisateur, mois, options['operations'])
+                    for utilisateur in utilisateurs
+                ]
+                ecritures = [resultat for futur in ecrivains for resultat in futur.result()]
+                duree = time.perf_counter() - debut
+                arret_lecteurs.set()
+                lectures = [latence for futur in lecteurs for latence in futur.result()]
+
+            compteurs = sum(CahierUtilisation.objects.using(alias).values_list('nb_cahiers_crees', flat=True))
+            cahiers = CahierCharges.objects.using(alias).count()
+        finally:
+            self._detruire_base(alias, chemin)
+
+        latences = [latence for ok, latence, _ in ecritures if ok]
+        erreurs = [erreur for ok, _, erreur in ecritures if not ok]
+        return {
+            'reussies': len(latences),
+            'erreurs': len(erreurs),
+            'verrouillee': sum('locked' in erreur for erreur in erreurs),
+            'debit': len(latences) / duree,
+            'ecriture_p50': percentile(latences, 50),
+            'ecriture_p95': percentile(latences, 95),
+            'ecriture_max': max(latences, default=0),
+            'lecture_p95': percentile(lectures, 95),
+            'lectures': len(lectures),
+            'coherent': cahiers == compteurs == len(latences),
+        }
+
+    def _ecrivain(self, alias, utilisateur, mois, nombre):
+        resultats = []
+        try:
+            for i in range(nombre):
+                debut = time.perf_counter()
+                try:
+                    # Chemin d'écriture de creer_cahier
+                    with transaction.atomic(using=alias):
+                        CahierUtilisation.objects.using(alias).get(utilisateur=utilisateur, mois=mois)
+                        CahierCharges.objects.using(alias).create(
+                            utilisateur=utilisateur, type_projet='site_web',
+                            nom_projet=f'Projet {i}', description='Boutique en ligne avec paiement mobile. ' * 20,
+                            technologies='Django',
+                        )
+                        CahierUtilisation.objects.using(alias).filter(utilisateur=utilisateur, mois=mois).update(
+                            nb_cahiers_crees=F('nb_cahiers_crees') + 1
+                        )
+                    resultats.append((True, (time.perf_counter() - debut) * 1000, None))
+                except OperationalError as e:
+                    resultats.append((False, (time.perf_counter() - debut) * 1000, str(e)))
+        finally:
+            connections[alias].close()
+        return resultats
+
+    def _lecteur(self, alias, utilisateur, arret):
+        latences = []
+        try:
+            while not arret.is_set():
+                debut = time.perf_counter()
+                try:
+                    list(CahierCharges.objects.using(alias).filter(utilisateur=utilisateur)
+                         .only('id', 'nom_projet', 'date_creation').order_by('-date_creation', '-id')[:24])
+                except OperationalError:
+                    continue
+                latences.append((time.perf_counter() - debut) * 1000)
+        finally:
+            connections[alias].close()
+        return latences
+
+    # Rapport
+
+    def _afficher(self, resultats, options):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{options['ecrivains']} écrivains x {options['operations']} créations, {options['lecteurs']} lecteurs"
+        ))
+        lignes = [
+            ('Écritures réussies', 'reussies', '{:.0f}'),
+            ('Échecs (dont "database is locked")', None, None),
+            ('Débit (écritures/s)', 'debit', '{:.0f}'),
+            ('Écriture p50 (ms)', 'ecriture_p50', '{:.1f}'),
+            ('Écriture p95 (ms)', 'ecriture_p95', '{:.1f}'),
+            ('Écriture max (ms)', 'ecriture_max', '{:.1f}'),
+            ('Lecture p95 (ms)', 'lecture_p95', '{:.1f}'),
+            ('Lectures effectuées', 'lectures', '{:.0f}'),
+            ('Compteurs cohérents', 'coherent', '{}'),
+        ]
+        self.stdout.write(f"  {'':36}" + ''.join(f'{profil:>14}' for profil in resultats))
+        for libelle, cle, format_ in lignes:
+            if cle is None:
+                valeurs = [f"{r['erreurs']} ({r['verrouillee']})" for r in resultats.values()]
+            else:
+                valeurs = [format_.format(r[cle]) for r in resultats.values()]
+            self.stdout.write(f'  {libelle:36}' + ''.join(f'{valeur:>14}' for valeur in valeurs))
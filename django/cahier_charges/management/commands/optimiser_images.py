@@ -0,0 +1,71 @@
+"""
+Variantes responsives et optimisées des images statiques
+
+Pour chaque image de IMAGES, génère à côté de l'original des variantes à la
+hauteur d'affichage en 1x, 2x et 3x (écrans haute densité), en WebP et en PNG
+à palette de 256 couleurs (navigateurs sans WebP), pour un <picture> avec
+srcset (voir base.html). Les variantes sont versionnées avec les sources :
+relancer la commande après avoir modifié une image, puis collectstatic.
+
+Usage:
+    python manage.py optimiser_images
+"""
+
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Chemin relatif aux fichiers statiques de l'application -> hauteur affichée (px, CSS)
+IMAGES = {
+    'cahier_charges/images/logo.png': 45,
+}
+
+DENSITES = (1, 2, 3)
+QUALITE_WEBP = 85
+
+
+def nom_variante(chemin, densite, extension):
+    """cahier_charges/images/logo.png, 2, 'webp' -> cahier_charges/images/logo-2x.webp"""
+    chemin = Path(chemin)
+    return str(chemin.with_name(f'{chemin.stem}-{densite}x.{extension}'))
+
+
+class Command(BaseCommand):
+    help = 'Génère les variantes 1x/2x/3x (WebP et PNG à palette) des images statiques.'
+
+    def handle(self, *args, **options):
+        from PIL import Image
+
+        racine = Path(settings.BASE_DIR) / 'cahier_charges' / 'static'
+        for chemin, hauteur in IMAGES.items():
+            source = racine / chemin
+            if not source.exists():
+                raise CommandError(f'Image introuvable: {source}')
+            with Image.open(source) as image:
+                image.load()
+            taille_source = source.stat().st_size
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{chemin} ({image.width}x{image.height}, {taille_source} octets)'
+            ))
+
+            for densite in DENSITES:
+                # Jamais d'agrandissement : au-delà de la taille source, la densité n'apporte rien
+                hauteur_variante = min(hauteur * densite, image.height)
+                largeur_variante = round(image.width * hauteur_variante / image.height)
+                variante = image.resize((largeur_variante, hauteur_variante), Image.LANCZOS)
+                # MEDIANCUT ne gère pas la transparence
+                methode = Image.Quantize.FASTOCTREE if variante.mode == 'RGBA' else Image.Quantize.MEDIANCUT
+                palette = variante.quantize(colors=256, method=methode)
+
+                for extension, enregistrer in (
+                    ('webp', lambda f: variante.save(f, 'WEBP', quality=QUALITE_WEBP, method=6)),
+                    ('png', lambda f: palette.save(f, 'PNG', optimize=True)),
+                ):
+                    destination = racine / nom_variante(chemin, densite, extension)
+                    enregistrer(destination)
+                    taille = destination.stat().st_size
+                    self.stdout.write(
+                        f'  {destination.name:20} {largeur_variante:>4}x{hauteur_variante:<4} '
+                        f'{taille:>7} octets ({taille / taille_source:.0%})'
+                    )
@@ -0,0 +1,131 @@
+"""
+Profil du temps d'import au démarrage (python -X importtime)
+
+Lance un interpréteur neuf avec -X importtime pour une cible de démarrage,
+analyse la sortie et affiche le temps total, les paquets les plus coûteux
+(temps propre cumulé) et les imports les plus lents. Médiane sur plusieurs
+exécutions : le temps d'import varie d'un lancement à l'autre.
+
+Cibles :
+- setup  : django.setup() (toute commande manage.py)
+- worker : ce que charge un worker gunicorn avant sa première requête
+           (application WSGI et urlconf)
+- --commande "check" : une commande manage.py complète
+
+Usage:
+    python manage.py profil_imports
+    python manage.py profil_imports --cible setup --top 15
+    python manage.py profil_imports --commande check
+    python manage.py profil_imports --budget-ms 400     # code de sortie 1 si dépassé
+"""
+
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+PREAMBULE = (
+    "import os, django\n"
+    "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_project.settings')\n"
+)
+
+CIBLES = {
+    'setup': PREAMBULE + "django.setup()\n",
+    'worker': PREAMBULE + (
+        "from django_project.wsgi import application\n"
+        "from django.urls import get_resolver\n"
+        "get_resolver().url_patterns\n"
+    ),
+}
+
+LIGNE_IMPORT = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+
+def analyser(sortie):
+    """
+    Lignes de -X importtime -> liste de (module, temps propre µs, cumulé µs, profondeur)
+    """
+    imports = []
+    for ligne in sortie.splitlines():
+        correspondance = LIGNE_IMPORT.match(ligne)
+        if correspondance:
+            propre, cumule, retrait, module = correspondance.groups()
+            imports.append((module, int(propre), int(cumule), len(retrait) // 2))
+    return imports
+
+
+def mesurer(code=None, commande=None):
+    """
+    Exécute la cible dans un nouvel interpréteur et retourne ses imports (voir analyser)
+
+    Returns:
+        tuple: (imports, modules chargés)
+    """
+    if commande:
+        arguments = [sys.executable, '-X', 'importtime', str(settings.BASE_DIR / 'manage.py'), *commande.split()]
+    else:
+        # Liste des modules chargés en dernière ligne de stdout
+        code += "import sys\nprint(','.join(sorted(sys.modules)))\n"
+        arguments = [sys.executable, '-X', 'importtime', '-c', code]
+    env = dict(os.environ, PYTHONWARNINGS='ignore')
+    resultat = subprocess.run(arguments, capture_output=True, text=True, cwd=settings.BASE_DIR, env=env)
+    if resultat.returncode != 0:
+        raise CommandError(f"Échec de la cible (code {resultat.returncode}):\n{resultat.stderr[-2000:]}")
+    lignes = resultat.stdout.strip().splitlines()
+    modules = set(lignes[-1].split(',')) if lignes and not commande else set()
+    return analyser(resultat.stderr), modules
+
+
+def total_ms(imports):
+    return sum(cumule for _, _, cumule, profondeur in imports if profondeur == 0) / 1000
+
+
+class Command(BaseCommand):
+    help = 'Mesure le temps d\'import au démarrage (python -X importtime) et affiche les modules les plus coûteux.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cible', choices=CIBLES, default='worker', help='Démarrage mesuré (défaut: worker)')
+        parser.add_argument('--commande', help='Commande manage.py à mesurer à la place de --cible, ex: "check"')
+        parser.add_argument('--repetitions', type=int, default=5, help='Exécutions, médiane retenue (défaut: 5)')
+        parser.add_argument('--top', type=int, default=20, help='Lignes par tableau (défaut: 20)')
+        parser.add_argument('--budget-ms', type=float, help='Échoue si le temps d\'import médian dépasse ce budget')
+
+    def handle(self, *args, **options):
+        if options['repetitions'] < 1:
+            raise CommandError('--repetitions doit être positif')
+
+        executions = [
+            mesurer(code=None if options['commande'] else CIBLES[options['cible']], commande=options['commande'])
+            for _ in range(options['repetitions'])
+        ]
+        # Détail de l'exécution médiane
+        executions.sort(key=lambda execution: total_ms(execution[0]))
+        imports, modules = executions[len(executions) // 2]
+        totaux = [total_ms(execution[0]) for execution in executions]
+
+        libelle = f"manage.py {options['commande']}" if options['commande'] else options['cible']
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Imports au démarrage ({libelle})'))
+        self.stdout.write(
+            f"  Total médian : {statistics.median(totaux):.0f} ms "
+            f"(min {min(totaux):.0f}, max {max(totaux):.0f}, {len(imports)} modules)"
+        )
+
+        paquets = {}
+        for module, propre, _, _ in imports:
+            paquet = module.split('.')[0]
+            paquets[paquet] = paquets.get(paquet, 0) + propre
+        self.stdout.write(self.style.MIGRATE_HEADING('Paquets (temps propre cumulé)'))
+        for paquet, propre in sorted(paquets.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f'  {paquet:40} {propre / 1000:8.1f} ms')
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Imports les plus lents (cumulé, dépendances comprises)'))
+        for module, propre, cumule, _ in sorted(imports, key=lambda item: -item[2])[:options['top']]:
+            self.stdout.write(f'  {module:50} {cumule / 1000:8.1f} ms  (propre {propre / 1000:.1f})')
+
+        budget = options['budget_ms']
+        if budget is not None and statistics.median(totaux) > budget:
+            raise CommandError(f'Temps d\'import médian {statistics.median(totaux):.0f} ms > budget {budget:.0f} ms')
@@ -0,0 +1,57 @@
+"""
+Rétention de l'historique des versions des cahiers
+
+Conserve, pour chaque cahier, les N dernières versions et toutes celles des
+J derniers jours ; la plus ancienne version conservée devient un instantané.
+
+Usage:
+    python manage.py purger_versions
+    python manage.py purger_versions --garder 20 --jours 30 --dry-run
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from cahier_charges import versions
+from cahier_charges.models import VersionCahier
+
+
+class Command(BaseCommand):
+    help = 'Supprime les anciennes versions des cahiers selon la politique de rétention.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--garder', type=int, default=settings.VERSIONS_CONSERVEES,
+                            help=f'Versions conservées par cahier (défaut: {settings.VERSIONS_CONSERVEES})')
+        parser.add_argument('--jours', type=int, default=settings.VERSIONS_DUREE_JOURS,
+                            help='Versions plus récentes que ce nombre de jours toujours conservées, '
+                                 f'0 pour ignorer l\'âge (défaut: {settings.VERSIONS_DUREE_JOURS})')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Affiche les cahiers concernés sans rien supprimer')
+
+    def handle(self, *args, **options):
+        garder = max(options['garder'], 1)
+        avant = timezone.now() - timedelta(days=options['jours']) if options['jours'] > 0 else None
+
+        # Seuls les cahiers qui dépassent le nombre de versions conservées sont examinés
+        cahiers = (
+            VersionCahier.objects.values('cahier_id')
+            .annotate(nombre=Count('id'))
+            .filter(nombre__gt=garder)
+            .values_list('cahier_id', 'nombre')
+        )
+
+        total = 0
+        for cahier_id, nombre in cahiers.iterator():
+            if options['dry_run']:
+                self.stdout.write(f'Cahier {cahier_id}: {nombre} versions')
+                continue
+            total += versions.purger(cahier_id, garder, avant)
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Mode --dry-run: aucune version supprimée.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{total} versions supprimées.'))
@@ -0,0 +1,212 @@
+"""
+Réconciliation des transactions LigdiCash restées en attente
+
+Les transactions `pending` dont le webhook n'est jamais arrivé sont vérifiées
+auprès de LigdiCash en parallèle (pool de threads borné, débit limité par hôte),
+puis les résultats sont appliqués en base par lots depuis le thread principal.
+
+Usage:
+    python manage.py reconcile_ligdicash
+    python manage.py reconcile_ligdicash --age 30 --workers 16 --rate 10
+"""
+
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from urllib.parse import urlparse
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from cahier_charges.ligdicash_config import LIGDICASH_CONFIG
+from cahier_charges.models_paiement import TransactionLigdiCash
+
+LOCK_KEY = 'reconcile_ligdicash:lock'
+
+
+class _LimiteurDebit:
+    """Seau à jetons par hôte, partagé entre les threads du pool"""
+
+    def __init__(self, debit):
+        self.debit = float(debit)
+        self._lock = threading.Lock()
+        self._seaux = {}
+
+    def attendre(self, hote):
+        if self.debit <= 0:
+            return
+        while True:
+            with self._lock:
+                maintenant = time.monotonic()
+                jetons, dernier = self._seaux.get(hote, (self.debit, maintenant))
+                jetons = min(self.debit, jetons + (maintenant - dernier) * self.debit)
+                if jetons >= 1:
+                    self._seaux[hote] = (jetons - 1, maintenant)
+                    return
+                self._seaux[hote] = (jetons, maintenant)
+                delai = (1 - jetons) / self.debit
+            time.sleep(delai)
+
+
+class Command(BaseCommand):
+    help = 'Vérifie auprès de LigdiCash les transactions en attente dont le webhook n\'est jamais arrivé.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--age', type=int, default=15,
+                            help='Âge minimum (minutes) d\'une transaction en attente avant vérification (défaut: 15)')
+        parser.add_argument('--expiration', type=int, default=48,
+                            help='Âge (heures) au-delà duquel une transaction toujours en attente est expirée (défaut: 48)')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Nombre de vérifications simultanées (défaut: 8)')
+        parser.add_argument('--rate', type=float, default=5.0,
+                            help='Requêtes par seconde maximum vers chaque hôte LigdiCash, 0 pour illimité (défaut: 5)')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Nombre de résultats appliqués par transaction de base de données (défaut: 100)')
+        parser.add_argument('--limit', type=int, default=0,
+                            help='Nombre maximum de transactions à traiter, 0 pour toutes (défaut: 0)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Vérifie les transactions sans rien modifier en base')
+
+    def handle(self, *args, **options):
+        # Verrou partagé via le cache pour éviter deux exécutions simultanées (cron)
+        duree_verrou = 30 * 60
+        if not cache.add(LOCK_KEY, os.getpid(), duree_verrou):
+            self.stdout.write(self.style.WARNING('Une réconciliation est déjà en cours, abandon.'))
+            return
+
+        try:
+            self._reconcilier(options)
+        finally:
+            cache.delete(LOCK_KEY)
+
+    def _reconcilier(self, options):
+        maintenant = timezone.now()
+        seuil_age = maintenant - timedelta(minutes=options['age'])
+        seuil_expiration = maintenant - timedelta(hours=options['expiration'])
+        self.dry_run = options['dry_run']
+        self.seuil_expiration = seuil_expiration
+        self.compteurs = Counter()
+
+        # Parcours de l'index (statut, date_creation) : filtre et tri sans table temporaire
+        transactions = TransactionLigdiCash.objects.filter(
+            statut='pending',
+            date_creation__lt=seuil_age,
+        ).order_by('statut', 'date_creation').only(
+            'transaction_id', 'payment_token', 'date_creation'
+        )
+        if options['limit']:
+            transactions = transactions[:options['limit']]
+
+        limiteur = _LimiteurDebit(options['rate'])
+        hote = urlparse(LIGDICASH_CONFIG['VERIFY_URL']).netloc
+        max_en_vol = options['workers'] * 2
+        taille_lot = options['batch_size']
+        lot = []
+        debut = time.monotonic()
+
+        def verifier(tx):
+            limiteur.attendre(hote)
+            try:
+                return tx, tx.verifier_statut()
+            except Exception as e:
+                return tx, {'success': False, 'status': 'ERROR', 'message': str(e)}
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            en_vol = set()
+            for tx in transactions.iterator(chunk_size=taille_lot):
+                self.compteurs['examinees'] += 1
+                if not tx.payment_token:
+                    # Impossible à vérifier: initialisation interrompue avant l'obtention du token
+                    lot.append((tx, {'success': False, 'status': 'NO_TOKEN'}))
+                else:
+                    en_vol.add(pool.submit(verifier, tx))
+
+                # Garder un nombre borné de vérifications en vol
+                if len(en_vol) >= max_en_vol:
+                    termines, en_vol = wait(en_vol, return_when=FIRST_COMPLETED)
+                    lot.extend(f.result() for f in termines)
+
+                if len(lot) >= taille_lot:
+                    self._appliquer_lot(lot)
+                    lot = []
+
+            for f in en_vol:
+                lot.append(f.result())
+
+        for i in range(0, len(lot), taille_lot):
+            self._appliquer_lot(lot[i:i + taille_lot])
+
+        duree = time.monotonic() - debut
+        self._afficher_rapport(duree)
+
+    def _appliquer_lot(self, lot):
+        """Applique un lot de résultats de vérification en une transaction de base de données"""
+        if not lot:
+            return
+
+        reussies = []
+        echouees = []
+        expirees = []
+        for tx, statut in lot:
+            code = statut.get('status')
+            if statut.get('success') and code == 'SUCCESS':
+                reussies.append((tx, statut))
+            elif code == 'FAILED':
+                echouees.append(tx.pk)
+            elif code in ('PENDING', 'UNKNOWN', 'NO_TOKEN') and tx.date_creation < self.seuil_expiration:
+                expirees.append(tx.pk)
+            elif code in ('PENDING', 'UNKNOWN', 'NO_TOKEN'):
+                self.compteurs['toujours_en_attente'] += 1
+            else:
+                self.compteurs['erreurs'] += 1
+
+        if self.dry_run:
+            self.compteurs['reussies'] += len(reussies)
+            self.compteurs['echouees'] += len(echouees)
+            self.compteurs['expirees'] += len(expirees)
+            return
+
+        with db_transaction.atomic():
+            # Le filtre sur le statut évite d'écraser un webhook arrivé entre-temps
+            if echouees:
+                self.compteurs['echouees'] += TransactionLigdiCash.objects.filter(
+                    pk__in=echouees, statut='pending'
+                ).update(statut='failed', message='Paiement échoué (réconciliation)', date_mise_a_jour=timezone.now())
+            if expirees:
+                self.compteurs['expirees'] += TransactionLigdiCash.objects.filter(
+                    pk__in=expirees, statut='pending'
+                ).update(statut='expired', message='Transaction expirée sans confirmation', date_mise_a_jour=timezone.now())
+
+            # L'activation de l'abonnement reste unitaire: verrouiller la ligne puis réutiliser le modèle
+            for tx, statut in reussies:
+                verrouillee = TransactionLigdiCash.objects.select_for_update().filter(
+                    pk=tx.pk, statut='pending'
+                ).first()
+                if verrouillee is None:
+                    continue
+                verrouillee.marquer_comme_reussie(
+                    code_paiement=statut.get('transaction', {}).get('response_code', '00'),
+                    message='Paiement accepté (réconciliation)'
+                )
+                self.compteurs['reussies'] += 1
+
+    def _afficher_rapport(self, duree):
+        examinees = self.compteurs['examinees']
+        debit = examinees / duree if duree > 0 else 0
+
+        titre = 'Réconciliation LigdiCash terminée'
+        if self.dry_run:
+            titre += ' (simulation, aucune modification)'
+        self.stdout.write(self.style.SUCCESS(titre))
+        self.stdout.write(f"  Transactions examinées : {examinees}")
+        self.stdout.write(f"  Réussies               : {self.compteurs['reussies']}")
+        self.stdout.write(f"  Échouées               : {self.compteurs['echouees']}")
+        self.stdout.write(f"  Expirées               : {self.compteurs['expirees']}")
+        self.stdout.write(f"  Toujours en attente    : {self.compteurs['toujours_en_attente']}")
+        self.stdout.write(f"  Erreurs de vérification: {self.compteurs['erreurs']}")
+        self.stdout.write(f"  Durée                  : {duree:.2f} s ({debit:.1f} transactions/s)")
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cahier_charges.ligdicash_config import LIGDICASH_CONFIG
+from cahier_charges.ligdicash_simulateur import REPARTITION_DEFAUT, SimulateurLigdiCash, parser_repartition
+
+
+class Command(BaseCommand):
+    help = 'Lance un simulateur LigdiCash local (initialisation, vérification et callbacks signés).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Adresse d\'écoute (défaut: 127.0.0.1)')
+        parser.add_argument('--port', type=int, default=8765, help='Port d\'écoute (défaut: 8765)')
+        parser.add_argument('--latence-min', type=float, default=0,
+                            help='Latence minimale ajoutée aux réponses API, en ms (défaut: 0)')
+        parser.add_argument('--latence-max', type=float, default=0,
+                            help='Latence maximale ajoutée aux réponses API, en ms (défaut: 0)')
+        parser.add_argument('--taux-erreur', type=float, default=0.0,
+                            help='Proportion (0-1) de réponses HTTP 500 injectées (défaut: 0)')
+        parser.add_argument('--codes', default=','.join(f'{c}={p:g}' for c, p in REPARTITION_DEFAUT.items()),
+                            help='Répartition des résultats de paiement, ex: 00=80,01=10,02=10')
+        parser.add_argument('--delai-callback', type=float, default=None,
+                            help='Envoie le callback automatiquement N secondes après l\'initialisation '
+                                 '(tests de charge sans passer par la page de paiement)')
+        parser.add_argument('--sans-callback', action='store_true',
+                            help='N\'envoie aucun callback (simule un webhook perdu)')
+        parser.add_argument('--graine', type=int, default=None, help='Graine aléatoire pour des runs reproductibles')
+
+    def handle(self, *args, **options):
+        try:
+            repartition = parser_repartition(options['codes'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['latence_max'] < options['latence_min']:
+            raise CommandError('--latence-max doit être supérieure ou égale à --latence-min')
+
+        simulateur = SimulateurLigdiCash(
+            hote=options['host'],
+            port=options['port'],
+            latence_ms=(options['latence_min'], options['latence_max']),
+            taux_erreur=options['taux_erreur'],
+            repartition=repartition,
+            delai_callback=options['delai_callback'],
+            envoyer_callbacks=not options['sans_callback'],
+            graine=options['graine'],
+        )
+
+        self.stdout.write(self.style.SUCCESS(f'Simulateur LigdiCash sur http://{options["host"]}:{options["port"]}'))
+        self.stdout.write(f'  Initialisation : {simulateur.url_api}')
+        self.stdout.write(f'  Vérification   : {simulateur.url_verification}')
+        self.stdout.write(f'  Callbacks vers : {LIGDICASH_CONFIG["NOTIFY_URL"]}')
+        self.stdout.write(f'  Répartition    : {repartition}')
+        if LIGDICASH_CONFIG['SIMULATEUR_URL'] != simulateur.url:
+            self.stdout.write(self.style.WARNING(
+                f'Pensez à définir LIGDICASH_SIMULATEUR_URL={simulateur.url} pour le serveur Django.'
+            ))
+        self.stdout.write('Ctrl+C pour arrêter.')
+        simulateur.servir()
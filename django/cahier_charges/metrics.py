@@ -0,0 +1,147 @@
+"""
+Métriques Prometheus (format texte d'exposition) sur /metrics/
+
+Accessible aux membres du staff ou avec le jeton METRICS_TOKEN
+(en-tête `Authorization: Bearer <token>`).
+
+Sous gunicorn avec plusieurs workers, définir PROMETHEUS_MULTIPROC_DIR (un
+répertoire vide, propre à l'instance) avant le démarrage : chaque worker écrit
+ses compteurs dans ce répertoire et /metrics/ agrège tous les workers. Le hook
+child_exit de gunicorn.conf.py nettoie les fichiers des workers terminés.
+"""
+
+import hmac
+import os
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from .circuit_breaker import CircuitBreaker
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Requêtes HTTP, par nom de vue
+HTTP_DUREE = Histogram(
+    'cahier_http_request_duration_seconds',
+    'Durée des requêtes HTTP par vue',
+    ['vue', 'methode', 'statut'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+# Génération des PDF
+PDF_DUREE = Histogram(
+    'cahier_pdf_render_duration_seconds',
+    'Durée de génération des PDF',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+PDF_TAILLE = Histogram(
+    'cahier_pdf_size_bytes',
+    'Taille des PDF générés',
+    buckets=(10_000, 25_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000, 5_000_000),
+)
+
+# Appels à l'API LigdiCash (resultat: ok, server_error, timeout, error)
+LIGDICASH_DUREE = Histogram(
+    'ligdicash_request_duration_seconds',
+    'Durée des appels à l\'API LigdiCash',
+    ['endpoint', 'resultat'],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30),
+)
+
+# Abonnements (source: paiement, direct)
+ABONNEMENTS_ACTIVES = Counter(
+    'cahier_subscription_activations',
+    'Abonnements activés ou prolongés',
+    ['plan', 'source'],
+)
+ABONNEMENTS_EXPIRES = Counter(
+    'cahier_subscription_expirations',
+    'Abonnements passés au statut expiré',
+    ['plan'],
+)
+
+# Refus pour dépassement de quota (ressource: cahier, pdf)
+QUOTA_REJETS = Counter(
+    'cahier_quota_rejections',
+    'Actions refusées pour dépassement du quota du forfait',
+    ['ressource'],
+)
+
+VALEURS_ETAT = {
+    CircuitBreaker.FERME: 0,
+    CircuitBreaker.SEMI_OUVERT: 1,
+    CircuitBreaker.OUVERT: 2,
+}
+
+
+class CollecteurDisjoncteurs:
+    """Expose l'état des disjoncteurs LigdiCash, lu dans le cache partagé à chaque collecte"""
+
+    def collect(self):
+        from .ligdicash_client import DISJONCTEURS
+
+        etat = GaugeMetricFamily(
+            'ligdicash_circuit_state',
+            'Etat du disjoncteur LigdiCash (0=ferme, 1=semi-ouvert, 2=ouvert)',
+            labels=['endpoint'],
+        )
+        taux = GaugeMetricFamily(
+            'ligdicash_circuit_failure_ratio',
+            'Taux d\'echec sur la fenetre glissante du disjoncteur',
+            labels=['endpoint'],
+        )
+        appels = GaugeMetricFamily(
+            'ligdicash_circuit_calls',
+            'Appels comptes sur la fenetre glissante du disjoncteur',
+            labels=['endpoint', 'outcome'],
+        )
+        for endpoint, disjoncteur in DISJONCTEURS.items():
+            stats = disjoncteur.statistiques()
+            etat.add_metric([endpoint], VALEURS_ETAT[stats['etat']])
+            taux.add_metric([endpoint], stats['taux_echec'])
+            appels.add_metric([endpoint, 'success'], stats['succes'])
+            appels.add_metric([endpoint, 'failure'], stats['echecs'])
+        return [etat, taux, appels]
+
+
+REGISTRE_DISJONCTEURS = CollectorRegistry()
+REGISTRE_DISJONCTEURS.register(CollecteurDisjoncteurs())
+
+
+def _registre_application():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # Agrégation des fichiers écrits par chaque worker
+        registre = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registre)
+        return registre
+    return REGISTRY
+
+
+def statut_http(code):
+    return f'{code // 100}xx'
+
+
+def _acces_autorise(request):
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    jeton = settings.METRICS_TOKEN
+    entete = request.headers.get('Authorization', '')
+    return bool(jeton) and hmac.compare_digest(entete, f'Bearer {jeton}')
+
+
+def metrics(request):
+    """Expose les métriques de l'application"""
+    if not _acces_autorise(request):
+        return HttpResponseForbidden('Accès refusé')
+
+    contenu = generate_latest(_registre_application()) + generate_latest(REGISTRE_DISJONCTEURS)
+    return HttpResponse(contenu, content_type=CONTENT_TYPE)
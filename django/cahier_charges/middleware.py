@@ -4,50 +4,233 @@ from django.urls import reverse
 from django.contrib import messages
 from django.utils import timezone
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.cache import patch_vary_headers
 from .models import CahierUtilisation, Abonnement, PlanAbonnement
+from . import compression
+from . import instrumentation
+from . import metrics
+from . import replicas
+import fnmatch
+import json
 import logging
+import random
+import re
+import time
 
 logger = logging.getLogger(__name__)
+logger_performance = logging.getLogger('cahier_charges.performance')
 
-class CorsMiddleware:
+
+class PerformanceMiddleware:
+    """
+    Mesure une fraction des requêtes (PERFORMANCE_ECHANTILLONNAGE) : durée totale,
+    middlewares, SQL, templates et spans nommés. Le résultat est journalisé en JSON
+    sur le logger cahier_charges.performance et renvoyé dans l'en-tête Server-Timing
+    (en DEBUG ou pour le staff uniquement). À placer en tête de MIDDLEWARE.
+    """
     def __init__(self, get_response):
+        if not settings.PERFORMANCE_INSTRUMENTATION:
+            raise MiddlewareNotUsed()
         self.get_response = get_response
+        self.taux = settings.PERFORMANCE_ECHANTILLONNAGE
+
+    def __call__(self, request):
+        if random.random() >= self.taux:
+            return self.get_response(request)
+        
+        with instrumentation.mesurer() as mesure:
+            response = self.get_response(request)
+        
+        donnees = {
+            'methode': request.method,
+            'chemin': request.path,
+            'vue': request.resolver_match.view_name if request.resolver_match else None,
+            'statut': response.status_code,
+            **mesure.en_dict(),
+        }
+        logger_performance.info(json.dumps(donnees))
+        
+        utilisateur = getattr(request, 'user', None)
+        if settings.DEBUG or (utilisateur is not None and utilisateur.is_staff):
+            response['Server-Timing'] = mesure.server_timing()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Temps passé dans les middlewares avant la vue
+        mesure = instrumentation.mesure_courante()
+        if mesure is not None:
+            mesure.ajouter('middleware', (time.perf_counter() - mesure.debut) * 1000)
+        return None
+
+class CompressionMiddleware:
+    """
+    Compression Brotli ou gzip (selon Accept-Encoding) des réponses textuelles :
+    HTML, JSON, CSS, JS. Les StreamingHttpResponse sont compressées morceau par
+    morceau. Non compressées : réponses déjà encodées, types non textuels (PDF,
+    images), corps de moins de COMPRESSION_TAILLE_MIN octets, Cache-Control:
+    no-transform. COMPRESSION_BUDGET_CPU règle le niveau de compression et
+    COMPRESSION_REMPLISSAGE_MAX le remplissage aléatoire contre BREACH (voir
+    cahier_charges.compression). Les fichiers statiques sont servis
+    précompressés par WhiteNoise, placé avant dans MIDDLEWARE.
+    """
+    def __init__(self, get_response):
+        if not settings.COMPRESSION_REPONSES:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.taille_min = settings.COMPRESSION_TAILLE_MIN
+        self.budget = settings.COMPRESSION_BUDGET_CPU
+        self.remplissage_max = settings.COMPRESSION_REMPLISSAGE_MAX
+        if self.budget not in compression.NIVEAUX:
+            raise ImproperlyConfigured(
+                f"COMPRESSION_BUDGET_CPU={self.budget!r}: valeurs possibles {', '.join(compression.NIVEAUX)}"
+            )
 
     def __call__(self, request):
-        # Gérer d'abord les requêtes OPTIONS (prévol)
-        if request.method == 'OPTIONS':
-            response = HttpResponse()
-            response['Content-Length'] = '0'
-            response['Content-Type'] = 'text/plain'
-            
-            # Récupérer l'origine de la requête
-            origin = request.META.get('HTTP_ORIGIN', '')
-            
-            # Vérifier si l'origine est autorisée
-            allowed_origins = settings.CORS_ALLOWED_ORIGINS
-            if origin in allowed_origins or settings.DEBUG:
-                response['Access-Control-Allow-Origin'] = origin
-                response['Access-Control-Allow-Methods'] = ', '.join(settings.CORS_ALLOW_METHODS)
-                response['Access-Control-Allow-Headers'] = ', '.join(settings.CORS_ALLOW_HEADERS)
-                response['Access-Control-Allow-Credentials'] = 'true'
-                response['Access-Control-Max-Age'] = '86400'  # 24 heures
-            
-            return response
-            
-        # Pour les autres méthodes, laisser passer la requête
         response = self.get_response(request)
+        if (
+            response.has_header('Content-Encoding')
+            or not compression.type_compressible(response.get('Content-Type', ''))
+            or 'no-transform' in response.get('Cache-Control', '')
+            or (not response.streaming and len(response.content) < self.taille_min)
+        ):
+            return response
+        
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encodage = compression.choisir_encodage(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encodage is None:
+            return response
+        
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = compression.compresser_flux_async(
+                    response.streaming_content, encodage, self.budget, self.remplissage_max
+                )
+            else:
+                response.streaming_content = compression.compresser_flux(
+                    response.streaming_content, encodage, self.budget, self.remplissage_max
+                )
+            del response['Content-Length']
+        else:
+            contenu = compression.compresser(response.content, encodage, self.budget, self.remplissage_max)
+            if len(contenu) >= len(response.content):
+                return response
+            response.content = contenu
+            response['Content-Length'] = str(len(contenu))
+        
+        # Le corps encodé n'est plus identique octet pour octet à la ressource d'origine
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encodage
+        return response
+
+class CorsMiddleware:
+    """
+    CORS : origines de CORS_ALLOWED_ORIGINS, en-têtes calculés une fois au démarrage.
+    Les requêtes de prévol (OPTIONS avec Access-Control-Request-Method) reçoivent
+    leur réponse ici, sans passer par les middlewares suivants ni par la vue.
+    Toutes les réponses portent `Vary: Origin` : leurs en-têtes CORS dépendent de
+    l'origine, un cache ne doit pas servir à une origine la réponse d'une autre.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.toutes_origines = settings.CORS_ALLOW_ALL_ORIGINS
+        self.origines = frozenset(settings.CORS_ALLOWED_ORIGINS)
         
-        # Ajouter les en-têtes CORS à toutes les réponses
-        origin = request.META.get('HTTP_ORIGIN', '')
-        if origin in settings.CORS_ALLOWED_ORIGINS or settings.DEBUG:
-            response['Access-Control-Allow-Origin'] = origin
-            response['Access-Control-Allow-Methods'] = ', '.join(settings.CORS_ALLOW_METHODS)
-            response['Access-Control-Allow-Headers'] = ', '.join(settings.CORS_ALLOW_HEADERS)
-            response['Access-Control-Allow-Credentials'] = 'true'
-            response['Access-Control-Expose-Headers'] = ', '.join(settings.CORS_EXPOSE_HEADERS)
+        communs = {'Access-Control-Allow-Credentials': 'true'} if settings.CORS_ALLOW_CREDENTIALS else {}
+        self.entetes_prevol = {
+            **communs,
+            'Access-Control-Allow-Methods': ', '.join(settings.CORS_ALLOW_METHODS),
+            'Access-Control-Allow-Headers': ', '.join(settings.CORS_ALLOW_HEADERS),
+            'Access-Control-Max-Age': str(settings.CORS_PREFLIGHT_MAX_AGE),
+        }
+        self.entetes_reponse = dict(communs)
+        if settings.CORS_EXPOSE_HEADERS:
+            self.entetes_reponse['Access-Control-Expose-Headers'] = ', '.join(settings.CORS_EXPOSE_HEADERS)
+
+    def __call__(self, request):
+        origine = request.META.get('HTTP_ORIGIN')
+        autorisee = origine is not None and (self.toutes_origines or origine in self.origines)
+        
+        if request.method == 'OPTIONS' and 'HTTP_ACCESS_CONTROL_REQUEST_METHOD' in request.META:
+            # Prévol : réponse vide, sans en-têtes CORS si l'origine n'est pas autorisée
+            response = HttpResponse()
+            if autorisee:
+                response['Access-Control-Allow-Origin'] = origine
+                for nom, valeur in self.entetes_prevol.items():
+                    response[nom] = valeur
+        else:
+            response = self.get_response(request)
+            if autorisee:
+                response['Access-Control-Allow-Origin'] = origine
+                for nom, valeur in self.entetes_reponse.items():
+                    response[nom] = valeur
         
+        patch_vary_headers(response, ('Origin',))
         return response
 
+class MetriquesMiddleware:
+    """Histogramme de latence des requêtes par nom de vue (voir cahier_charges.metrics)"""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        debut = time.perf_counter()
+        response = self.get_response(request)
+        vue = request.resolver_match.view_name if request.resolver_match else 'non_resolue'
+        metrics.HTTP_DUREE.labels(vue, request.method, metrics.statut_http(response.status_code)).observe(
+            time.perf_counter() - debut
+        )
+        return response
+
+class ReplicaMiddleware:
+    """
+    Lectures des vues de settings.REPLICA_VUES (GET) sur un réplica, voir
+    cahier_charges.replicas. Inactif sans DB_REPLICAS. À placer en fin de
+    MIDDLEWARE : les middlewares précédents lisent sur la base principale.
+    """
+    COOKIE = 'lecture_primaire'
+    ECRITURES = ('INSERT', 'UPDATE', 'DELETE')
+
+    def __init__(self, get_response):
+        if not settings.REPLICA_ALIASES:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        # Motifs de noms de vue: 'mes_cahiers', 'admin:*_changelist'
+        self.vues = re.compile('|'.join(fnmatch.translate(vue) for vue in settings.REPLICA_VUES))
+
+    def __call__(self, request):
+        ecriture = []
+
+        def surveiller(execute, sql, params, many, context):
+            if not ecriture and sql.lstrip()[:6].upper() in self.ECRITURES:
+                ecriture.append(True)
+            return execute(sql, params, many, context)
+
+        with connections[DEFAULT_DB_ALIAS].execute_wrapper(surveiller):
+            try:
+                response = self.get_response(request)
+            finally:
+                replicas.utiliser(None)
+
+        # Lire ses propres écritures : base principale pendant REPLICA_EPINGLAGE secondes
+        if ecriture or request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            response.set_cookie(
+                self.COOKIE, '1', max_age=settings.REPLICA_EPINGLAGE,
+                httponly=True, samesite='Lax', secure=settings.SESSION_COOKIE_SECURE,
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in ('GET', 'HEAD') or self.COOKIE in request.COOKIES:
+            return None
+        if not self.vues.match(request.resolver_match.view_name):
+            return None
+        replicas.utiliser(replicas.choisir())
+        return None
+
 class SubscriptionMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
@@ -100,6 +283,7 @@ class SubscriptionMiddleware:
                     # Mettre à jour le statut de l'abonnement expiré
                     abonnement.statut = 'expire'
                     abonnement.save()
+                    metrics.ABONNEMENTS_EXPIRES.labels(abonnement.plan.nom if abonnement.plan else 'aucun').inc()
                     
                 # Créer un abonnement gratuit pour l'utilisateur
                 plan_gratuit = PlanAbonnement.objects.get(nom='gratuit')
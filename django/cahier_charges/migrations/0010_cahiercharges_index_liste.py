@@ -0,0 +1,19 @@
+# Generated by Django 5.0.1 on 2026-10-19 18:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cahier_charges', '0009_transactionligdicash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cahiercharges',
+            index=models.Index(fields=['utilisateur', '-date_creation', '-id'], name='cahier_util_date_id_idx'),
+        ),
+    ]
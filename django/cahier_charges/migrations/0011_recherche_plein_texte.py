@@ -0,0 +1,94 @@
+from django.db import OperationalError, migrations
+
+# SQL figé à la création de l'index : la migration ne dépend pas de
+# cahier_charges.recherche, qui peut évoluer ensuite. Tous les textes étaient
+# alors des colonnes de la table. Poids : nom (A), description et
+# fonctionnalités (B), champs propres au type de projet (C).
+
+TSVECTOR = (
+    "setweight(to_tsvector('french', coalesce(nom_projet, '')), 'A') || "
+    "setweight(to_tsvector('french', coalesce(description, '') || ' ' || coalesce(fonctionnalites, '')), 'B') || "
+    "setweight(to_tsvector('french', "
+    "coalesce(technologies, '') || ' ' || coalesce(public_cible, '') || ' ' || "
+    "coalesce(contraintes_techniques, '') || ' ' || coalesce(type_ia, '') || ' ' || "
+    "coalesce(donnees_requises, '') || ' ' || coalesce(performance_attendue, '') || ' ' || "
+    "coalesce(lieu_mariage, '') || ' ' || coalesce(style_mariage, '') || ' ' || "
+    "coalesce(services_requis, '') || ' ' || coalesce(type_construction, '') || ' ' || "
+    "coalesce(localisation, '') || ' ' || coalesce(materiaux, '') || ' ' || coalesce(normes, '')), 'C')"
+)
+
+# Valeurs des colonnes titre, texte, complements ; {p} : '' ou 'new.' dans les triggers
+VALEURS_FTS = (
+    "coalesce({p}nom_projet, ''), "
+    "coalesce({p}description, '') || ' ' || coalesce({p}fonctionnalites, ''), "
+    "coalesce({p}technologies, '') || ' ' || coalesce({p}public_cible, '') || ' ' || "
+    "coalesce({p}contraintes_techniques, '') || ' ' || coalesce({p}type_ia, '') || ' ' || "
+    "coalesce({p}donnees_requises, '') || ' ' || coalesce({p}performance_attendue, '') || ' ' || "
+    "coalesce({p}lieu_mariage, '') || ' ' || coalesce({p}style_mariage, '') || ' ' || "
+    "coalesce({p}services_requis, '') || ' ' || coalesce({p}type_construction, '') || ' ' || "
+    "coalesce({p}localisation, '') || ' ' || coalesce({p}materiaux, '') || ' ' || coalesce({p}normes, '')"
+)
+
+SQL_POSTGRESQL = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS cahier_recherche_gin ON cahier_charges_cahiercharges "
+    f"USING GIN (({TSVECTOR}))",
+]
+
+SQL_SQLITE = [
+    "CREATE VIRTUAL TABLE cahier_charges_recherche USING fts5("
+    "titre, texte, complements, tokenize='unicode61 remove_diacritics 2')",
+    "INSERT INTO cahier_charges_recherche(rowid, titre, texte, complements) "
+    f"SELECT id, {VALEURS_FTS.format(p='')} FROM cahier_charges_cahiercharges",
+    f"""CREATE TRIGGER cahier_charges_recherche_ai AFTER INSERT ON cahier_charges_cahiercharges BEGIN
+        INSERT INTO cahier_charges_recherche(rowid, titre, texte, complements) VALUES (new.id, {VALEURS_FTS.format(p='new.')});
+    END""",
+    """CREATE TRIGGER cahier_charges_recherche_ad AFTER DELETE ON cahier_charges_cahiercharges BEGIN
+        DELETE FROM cahier_charges_recherche WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER cahier_charges_recherche_au AFTER UPDATE ON cahier_charges_cahiercharges BEGIN
+        DELETE FROM cahier_charges_recherche WHERE rowid = old.id;
+        INSERT INTO cahier_charges_recherche(rowid, titre, texte, complements) VALUES (new.id, {VALEURS_FTS.format(p='new.')});
+    END""",
+]
+
+SQL_SUPPRESSION = {
+    'postgresql': ["DROP INDEX CONCURRENTLY IF EXISTS cahier_recherche_gin"],
+    'sqlite': [
+        "DROP TRIGGER IF EXISTS cahier_charges_recherche_ai",
+        "DROP TRIGGER IF EXISTS cahier_charges_recherche_ad",
+        "DROP TRIGGER IF EXISTS cahier_charges_recherche_au",
+        "DROP TABLE IF EXISTS cahier_charges_recherche",
+    ],
+}
+
+
+def creer_index(apps, schema_editor):
+    vendeur = schema_editor.connection.vendor
+    if vendeur == 'postgresql':
+        for requete in SQL_POSTGRESQL:
+            schema_editor.execute(requete)
+    elif vendeur == 'sqlite':
+        try:
+            for requete in SQL_SQLITE:
+                schema_editor.execute(requete)
+        except OperationalError:
+            # SQLite compilé sans FTS5 : la recherche se replie sur icontains
+            pass
+
+
+def supprimer_index(apps, schema_editor):
+    for requete in SQL_SUPPRESSION.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(requete)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY est interdit dans une transaction (PostgreSQL)
+    atomic = False
+
+    dependencies = [
+        ('cahier_charges', '0010_cahiercharges_index_liste'),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_index, supprimer_index),
+    ]
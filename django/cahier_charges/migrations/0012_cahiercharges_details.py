@@ -0,0 +1,188 @@
+from django.db import OperationalError, migrations, models
+
+# Colonnes déplacées dans le document `details` (figées : CHAMPS_DETAILS peut évoluer ensuite)
+CHAMPS_DETAILS = [
+    'fonctionnalites', 'technologies', 'public_cible', 'contraintes_techniques',
+    'type_ia', 'donnees_requises', 'performance_attendue',
+    'date_mariage', 'lieu_mariage', 'nombre_invites', 'style_mariage', 'services_requis',
+    'type_construction', 'surface', 'localisation', 'materiaux', 'normes',
+]
+
+# Index plein texte avant (colonnes, voir 0011) et après (clés de `details`) le
+# déplacement. SQL figé : la migration ne dépend pas de cahier_charges.recherche.
+TSVECTOR_COLONNES = (
+    "setweight(to_tsvector('french', coalesce(nom_projet, '')), 'A') || "
+    "setweight(to_tsvector('french', coalesce(description, '') || ' ' || coalesce(fonctionnalites, '')), 'B') || "
+    "setweight(to_tsvector('french', "
+    "coalesce(technologies, '') || ' ' || coalesce(public_cible, '') || ' ' || "
+    "coalesce(contraintes_techniques, '') || ' ' || coalesce(type_ia, '') || ' ' || "
+    "coalesce(donnees_requises, '') || ' ' || coalesce(performance_attendue, '') || ' ' || "
+    "coalesce(lieu_mariage, '') || ' ' || coalesce(style_mariage, '') || ' ' || "
+    "coalesce(services_requis, '') || ' ' || coalesce(type_construction, '') || ' ' || "
+    "coalesce(localisation, '') || ' ' || coalesce(materiaux, '') || ' ' || coalesce(normes, '')), 'C')"
+)
+
+TSVECTOR_DETAILS = (
+    "setweight(to_tsvector('french', coalesce(nom_projet, '')), 'A') || "
+    "setweight(to_tsvector('french', coalesce(description, '') || ' ' || coalesce(details->>'fonctionnalites', '')), 'B') || "
+    "setweight(to_tsvector('french', "
+    "coalesce(details->>'technologies', '') || ' ' || coalesce(details->>'public_cible', '') || ' ' || "
+    "coalesce(details->>'contraintes_techniques', '') || ' ' || coalesce(details->>'type_ia', '') || ' ' || "
+    "coalesce(details->>'donnees_requises', '') || ' ' || coalesce(details->>'performance_attendue', '') || ' ' || "
+    "coalesce(details->>'lieu_mariage', '') || ' ' || coalesce(details->>'style_mariage', '') || ' ' || "
+    "coalesce(details->>'services_requis', '') || ' ' || coalesce(details->>'type_construction', '') || ' ' || "
+    "coalesce(details->>'localisation', '') || ' ' || coalesce(details->>'materiaux', '') || ' ' || "
+    "coalesce(details->>'normes', '')), 'C')"
+)
+
+# Valeurs des colonnes FTS5 titre, texte, complements ; {p} : '' ou 'new.' dans les triggers
+VALEURS_FTS_COLONNES = (
+    "coalesce({p}nom_projet, ''), "
+    "coalesce({p}description, '') || ' ' || coalesce({p}fonctionnalites, ''), "
+    "coalesce({p}technologies, '') || ' ' || coalesce({p}public_cible, '') || ' ' || "
+    "coalesce({p}contraintes_techniques, '') || ' ' || coalesce({p}type_ia, '') || ' ' || "
+    "coalesce({p}donnees_requises, '') || ' ' || coalesce({p}performance_attendue, '') || ' ' || "
+    "coalesce({p}lieu_mariage, '') || ' ' || coalesce({p}style_mariage, '') || ' ' || "
+    "coalesce({p}services_requis, '') || ' ' || coalesce({p}type_construction, '') || ' ' || "
+    "coalesce({p}localisation, '') || ' ' || coalesce({p}materiaux, '') || ' ' || coalesce({p}normes, '')"
+)
+
+VALEURS_FTS_DETAILS = (
+    "coalesce({p}nom_projet, ''), "
+    "coalesce({p}description, '') || ' ' || coalesce(json_extract({p}details, '$.fonctionnalites'), ''), "
+    "coalesce(json_extract({p}details, '$.technologies'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.public_cible'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.contraintes_techniques'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.type_ia'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.donnees_requises'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.performance_attendue'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.lieu_mariage'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.style_mariage'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.services_requis'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.type_construction'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.localisation'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.materiaux'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.normes'), '')"
+)
+
+
+def _sql_sqlite(valeurs):
+    return [
+        "CREATE VIRTUAL TABLE cahier_charges_recherche USING fts5("
+        "titre, texte, complements, tokenize='unicode61 remove_diacritics 2')",
+        "INSERT INTO cahier_charges_recherche(rowid, titre, texte, complements) "
+        f"SELECT id, {valeurs.format(p='')} FROM cahier_charges_cahiercharges",
+        f"""CREATE TRIGGER cahier_charges_recherche_ai AFTER INSERT ON cahier_charges_cahiercharges BEGIN
+            INSERT INTO cahier_charges_recherche(rowid, titre, texte, complements) VALUES (new.id, {valeurs.format(p='new.')});
+        END""",
+        """CREATE TRIGGER cahier_charges_recherche_ad AFTER DELETE ON cahier_charges_cahiercharges BEGIN
+            DELETE FROM cahier_charges_recherche WHERE rowid = old.id;
+        END""",
+        f"""CREATE TRIGGER cahier_charges_recherche_au AFTER UPDATE ON cahier_charges_cahiercharges BEGIN
+            DELETE FROM cahier_charges_recherche WHERE rowid = old.id;
+            INSERT INTO cahier_charges_recherche(rowid, titre, texte, complements) VALUES (new.id, {valeurs.format(p='new.')});
+        END""",
+    ]
+
+
+def _installer(schema_editor, tsvector, valeurs_fts):
+    vendeur = schema_editor.connection.vendor
+    if vendeur == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS cahier_recherche_gin ON cahier_charges_cahiercharges "
+            f"USING GIN (({tsvector}))"
+        )
+    elif vendeur == 'sqlite':
+        try:
+            for requete in _sql_sqlite(valeurs_fts):
+                schema_editor.execute(requete)
+        except OperationalError:
+            # SQLite compilé sans FTS5 : la recherche se replie sur icontains
+            pass
+
+
+TAILLE_LOT = 1000
+
+
+def _par_lots(CahierCharges, champs, alias):
+    """Parcourt la table par lots de TAILLE_LOT, dans l'ordre des id (sans OFFSET)"""
+    dernier_id = 0
+    while True:
+        lot = list(
+            CahierCharges.objects.using(alias).filter(id__gt=dernier_id).order_by('id').only('id', *champs)[:TAILLE_LOT]
+        )
+        if not lot:
+            return
+        yield lot
+        dernier_id = lot[-1].id
+
+
+def supprimer_index(apps, schema_editor):
+    vendeur = schema_editor.connection.vendor
+    if vendeur == 'postgresql':
+        schema_editor.execute("DROP INDEX CONCURRENTLY IF EXISTS cahier_recherche_gin")
+    elif vendeur == 'sqlite':
+        for suffixe in ('ai', 'ad', 'au'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS cahier_charges_recherche_{suffixe}")
+        schema_editor.execute("DROP TABLE IF EXISTS cahier_charges_recherche")
+
+
+def creer_index_colonnes(apps, schema_editor):
+    _installer(schema_editor, TSVECTOR_COLONNES, VALEURS_FTS_COLONNES)
+
+
+def creer_index_details(apps, schema_editor):
+    _installer(schema_editor, TSVECTOR_DETAILS, VALEURS_FTS_DETAILS)
+
+
+def copier_vers_details(apps, schema_editor):
+    CahierCharges = apps.get_model('cahier_charges', 'CahierCharges')
+    for lot in _par_lots(CahierCharges, CHAMPS_DETAILS, schema_editor.connection.alias):
+        for cahier in lot:
+            details = {}
+            for champ in CHAMPS_DETAILS:
+                valeur = getattr(cahier, champ)
+                if valeur in (None, ''):
+                    continue
+                details[champ] = valeur.isoformat() if champ == 'date_mariage' else valeur
+            cahier.details = details
+        # Migration non atomique : chaque lot est validé séparément
+        CahierCharges.objects.using(schema_editor.connection.alias).bulk_update(lot, ['details'])
+
+
+def copier_vers_colonnes(apps, schema_editor):
+    CahierCharges = apps.get_model('cahier_charges', 'CahierCharges')
+    for lot in _par_lots(CahierCharges, ['details'], schema_editor.connection.alias):
+        for cahier in lot:
+            for champ in CHAMPS_DETAILS:
+                valeur = cahier.details.get(champ)
+                if champ in ('date_mariage', 'nombre_invites'):
+                    setattr(cahier, champ, valeur or None)
+                else:
+                    setattr(cahier, champ, valeur or '')
+        CahierCharges.objects.using(schema_editor.connection.alias).bulk_update(lot, CHAMPS_DETAILS)
+
+
+class Migration(migrations.Migration):
+    # Copie par lots et index PostgreSQL CONCURRENTLY : hors transaction
+    atomic = False
+
+    dependencies = [
+        ('cahier_charges', '0011_recherche_plein_texte'),
+    ]
+
+    operations = [
+        # L'index plein texte porte sur les colonnes supprimées plus bas
+        migrations.RunPython(supprimer_index, creer_index_colonnes),
+        migrations.AddField(
+            model_name='cahiercharges',
+            name='details',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(copier_vers_details, copier_vers_colonnes),
+        *[
+            migrations.RemoveField(model_name='cahiercharges', name=champ)
+            for champ in CHAMPS_DETAILS
+        ],
+        migrations.RunPython(creer_index_details, supprimer_index),
+    ]
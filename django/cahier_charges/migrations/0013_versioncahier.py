@@ -0,0 +1,37 @@
+# Generated by Django 5.0.1 on 2026-10-19 19:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cahier_charges', '0012_cahiercharges_details'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionCahier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero', models.PositiveIntegerField()),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('instantane', models.BooleanField(default=False)),
+                ('contenu', models.JSONField()),
+                ('champs_modifies', models.CharField(blank=True, max_length=500)),
+                ('taille', models.PositiveIntegerField(default=0)),
+                ('auteur', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('cahier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versions', to='cahier_charges.cahiercharges')),
+            ],
+            options={
+                'ordering': ['-numero'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='versioncahier',
+            constraint=models.UniqueConstraint(fields=('cahier', 'numero'), name='version_cahier_numero_unique'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-19 19:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cahier_charges', '0013_versioncahier'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cahiercharges',
+            name='brouillon',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='cahiercharges',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='cahiercharges',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(('brouillon', True)), fields=('utilisateur', 'type_projet'),
+                name='cahier_brouillon_unique_par_type',
+            ),
+        ),
+    ]
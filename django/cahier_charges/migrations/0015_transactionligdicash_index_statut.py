@@ -0,0 +1,19 @@
+# Generated by Django 5.0.1 on 2026-10-19 19:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cahier_charges', '0014_cahiercharges_brouillon'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transactionligdicash',
+            index=models.Index(fields=['statut', 'date_creation'], name='tx_ligdicash_statut_date_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+from django.db import migrations
+
+# SQLite reconstruit la table des cahiers pour certains changements de schéma
+# (0014 : AddField revision) et supprime alors ses triggers : l'index FTS5 de
+# 0012 n'était plus tenu à jour. Les triggers sont recréés et l'index
+# reconstruit. À refaire après toute migration qui reconstruit la table.
+# SQL figé ici : la migration ne dépend pas de cahier_charges.recherche.
+
+# Valeurs des colonnes titre, texte, complements ; {p} : '' ou 'new.' dans les triggers
+VALEURS_FTS = (
+    "coalesce({p}nom_projet, ''), "
+    "coalesce({p}description, '') || ' ' || coalesce(json_extract({p}details, '$.fonctionnalites'), ''), "
+    "coalesce(json_extract({p}details, '$.technologies'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.public_cible'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.contraintes_techniques'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.type_ia'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.donnees_requises'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.performance_attendue'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.lieu_mariage'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.style_mariage'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.services_requis'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.type_construction'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.localisation'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.materiaux'), '') || ' ' || "
+    "coalesce(json_extract({p}details, '$.normes'), '')"
+)
+
+SQL_SQLITE = [
+    "DROP TRIGGER IF EXISTS cahier_charges_recherche_ai",
+    "DROP TRIGGER IF EXISTS cahier_charges_recherche_ad",
+    "DROP TRIGGER IF EXISTS cahier_charges_recherche_au",
+    "DELETE FROM cahier_charges_recherche",
+    "INSERT INTO cahier_charges_recherche(rowid, titre, texte, complements) "
+    f"SELECT id, {VALEURS_FTS.format(p='')} FROM cahier_charges_cahiercharges",
+    f"""CREATE TRIGGER cahier_charges_recherche_ai AFTER INSERT ON cahier_charges_cahiercharges BEGIN
+        INSERT INTO cahier_charges_recherche(rowid, titre, texte, complements) VALUES (new.id, {VALEURS_FTS.format(p='new.')});
+    END""",
+    """CREATE TRIGGER cahier_charges_recherche_ad AFTER DELETE ON cahier_charges_cahiercharges BEGIN
+        DELETE FROM cahier_charges_recherche WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER cahier_charges_recherche_au AFTER UPDATE ON cahier_charges_cahiercharges BEGIN
+        DELETE FROM cahier_charges_recherche WHERE rowid = old.id;
+        INSERT INTO cahier_charges_recherche(rowid, titre, texte, complements) VALUES (new.id, {VALEURS_FTS.format(p='new.')});
+    END""",
+]
+
+
+def recreer_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cahier_charges_recherche'")
+        if cursor.fetchone() is None:
+            # SQLite compilé sans FTS5 : pas d'index, la recherche se replie sur icontains
+            return
+    for requete in SQL_SQLITE:
+        schema_editor.execute(requete)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cahier_charges', '0015_transactionligdicash_index_statut'),
+    ]
+
+    operations = [
+        migrations.RunPython(recreer_triggers, migrations.RunPython.noop),
+    ]
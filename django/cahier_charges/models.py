@@ -1,8 +1,12 @@
 
+import time
+from datetime import date
+
+from django.core.cache import cache
 from django.db import models
 from django.utils import timezone
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 class PlanAbonnement(models.Model):
@@ -141,6 +145,25 @@ class PlanAbonnement(models.Model):
         return self.get_nom_display()
 
 
+# Version du catalogue des forfaits : clé des fragments de template mis en cache
+# (abonnement/carte_plan.html), changée à chaque modification d'un plan.
+# Les QuerySet.update() n'envoient pas de signal : ne pas les utiliser sur les plans.
+CLE_VERSION_CATALOGUE = 'catalogue_plans:version'
+
+
+def version_catalogue():
+    # Valeur initiale horodatée : une clé évincée du cache ne retombe pas sur une ancienne version
+    return cache.get_or_set(CLE_VERSION_CATALOGUE, time.time_ns, None)
+
+
+@receiver([post_save, post_delete], sender=PlanAbonnement)
+def invalider_catalogue(sender, **kwargs):
+    try:
+        cache.incr(CLE_VERSION_CATALOGUE)
+    except ValueError:
+        cache.set(CLE_VERSION_CATALOGUE, time.time_ns(), None)
+
+
 class Abonnement(models.Model):
     STATUT_CHOICES = [
         ('actif', 'Actif'),
@@ -162,8 +185,10 @@ class Abonnement(models.Model):
         if self.statut != 'actif':
             return False
         if self.date_fin and self.date_fin < timezone.now().date():
+            from .metrics import ABONNEMENTS_EXPIRES
             self.statut = 'expire'
             self.save()
+            ABONNEMENTS_EXPIRES.labels(self.plan.nom if self.plan else 'aucun').inc()
             return False
         return True
     
@@ -219,6 +244,57 @@ class TypeProjet(models.TextChoices):
     MARIAGE = 'mariage', 'Cahier de charges Mariage'
     CONSTRUCTION = 'construction', 'Chantier de Construction'
 
+
+# Champs propres à chaque type de projet, stockés dans CahierCharges.details.
+# Seules les valeurs renseignées sont stockées : le document reste compact.
+CHAMPS_DETAILS = {
+    # Site Web / App Mobile
+    'fonctionnalites': 'texte',
+    'technologies': 'texte',
+    'public_cible': 'texte',
+    'contraintes_techniques': 'texte',
+    # IA
+    'type_ia': 'texte',
+    'donnees_requises': 'texte',
+    'performance_attendue': 'texte',
+    # Mariage
+    'date_mariage': 'date',
+    'lieu_mariage': 'texte',
+    'nombre_invites': 'entier',
+    'style_mariage': 'texte',
+    'services_requis': 'texte',
+    # Construction
+    'type_construction': 'texte',
+    'surface': 'texte',
+    'localisation': 'texte',
+    'materiaux': 'texte',
+    'normes': 'texte',
+}
+
+
+def _champ_detail(nom, type_valeur):
+    """Propriété donnant accès à details[nom] comme à une colonne (chaîne vide ou None si absent)"""
+    def lire(self):
+        valeur = self.details.get(nom)
+        if type_valeur == 'texte':
+            return valeur or ''
+        if valeur in (None, ''):
+            return None
+        if type_valeur == 'date' and isinstance(valeur, str):
+            return date.fromisoformat(valeur)
+        return valeur
+
+    def ecrire(self, valeur):
+        if valeur in (None, ''):
+            self.details.pop(nom, None)
+        elif type_valeur == 'date' and isinstance(valeur, date):
+            self.details[nom] = valeur.isoformat()
+        else:
+            self.details[nom] = valeur
+
+    return property(lire, ecrire)
+
+
 class CahierCharges(models.Model):
     utilisateur = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     type_projet = models.CharField(max_length=20, choices=TypeProjet.choices)
@@ -226,32 +302,63 @@ class CahierCharges(models.Model):
     description = models.TextField()
     date_creation = models.DateTimeField(auto_now_add=True)
     
-    # Champs pour Site Web / App Mobile
-    fonctionnalites = models.TextField(blank=True)
-    technologies = models.TextField(blank=True)
     budget = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     delai = models.CharField(max_length=100, blank=True)
-    public_cible = models.TextField(blank=True)
-    contraintes_techniques = models.TextField(blank=True)
     
-    # Champs pour IA
-    type_ia = models.CharField(max_length=200, blank=True)
-    donnees_requises = models.TextField(blank=True)
-    performance_attendue = models.TextField(blank=True)
+    # Champs propres au type de projet (voir CHAMPS_DETAILS), lus et écrits
+    # via les propriétés du même nom : cahier.technologies, cahier.date_mariage...
+    details = models.JSONField(default=dict, blank=True)
     
-    # Champs pour Mariage
-    date_mariage = models.DateField(null=True, blank=True)
-    lieu_mariage = models.CharField(max_length=200, blank=True)
-    nombre_invites = models.IntegerField(null=True, blank=True)
-    style_mariage = models.CharField(max_length=200, blank=True)
-    services_requis = models.TextField(blank=True)
+    # Sauvegarde automatique : un brouillon n'apparaît pas dans les listes tant
+    # que le formulaire n'est pas validé ; `revision` est incrémentée à chaque
+    # écriture (concurrence optimiste, voir views.sauvegarder_brouillon)
+    brouillon = models.BooleanField(default=False)
+    revision = models.PositiveIntegerField(default=0)
     
-    # Champs pour Construction
-    type_construction = models.CharField(max_length=200, blank=True)
-    surface = models.CharField(max_length=100, blank=True)
-    localisation = models.CharField(max_length=200, blank=True)
-    materiaux = models.TextField(blank=True)
-    normes = models.TextField(blank=True)
+    class Meta:
+        indexes = [
+            # Pagination par curseur de la liste "Mes cahiers"
+            models.Index(fields=['utilisateur', '-date_creation', '-id'], name='cahier_util_date_id_idx'),
+        ]
+        constraints = [
+            # Deux fenêtres qui créent le brouillon en même temps : la seconde obtient un 409
+            models.UniqueConstraint(
+                fields=['utilisateur', 'type_projet'], condition=models.Q(brouillon=True),
+                name='cahier_brouillon_unique_par_type',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.nom_projet} - {self.get_type_projet_display()}"
+
+
+# Propriétés déclarées comme des `property` : acceptées par CahierCharges(technologies=...)
+for _nom, _type_valeur in CHAMPS_DETAILS.items():
+    setattr(CahierCharges, _nom, _champ_detail(_nom, _type_valeur))
+
+
+class VersionCahier(models.Model):
+    """
+    Version d'un cahier de charges (historique_versions)
+
+    `contenu` est soit le document complet (instantane=True), soit le delta
+    par rapport à la version précédente : voir cahier_charges/versions.py.
+    """
+    cahier = models.ForeignKey(CahierCharges, on_delete=models.CASCADE, related_name='versions')
+    numero = models.PositiveIntegerField()
+    auteur = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    instantane = models.BooleanField(default=False)
+    contenu = models.JSONField()
+    # Champs modifiés et taille du contenu, pour lister les versions sans lire `contenu`
+    champs_modifies = models.CharField(max_length=500, blank=True)
+    taille = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-numero']
+        constraints = [
+            models.UniqueConstraint(fields=['cahier', 'numero'], name='version_cahier_numero_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.cahier_id} v{self.numero}"
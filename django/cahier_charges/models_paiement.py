@@ -6,6 +6,7 @@ from django.db import models
 from django.conf import settings
 from django.utils import timezone
 from .models import PlanAbonnement, Abonnement
+from .metrics import ABONNEMENTS_ACTIVES
 import uuid
 
 
@@ -52,6 +53,8 @@ class TransactionLigdiCash(models.Model):
             models.Index(fields=['-date_creation']),
             models.Index(fields=['utilisateur', 'statut']),
             models.Index(fields=['payment_token']),
+            # Réconciliation des transactions en attente (reconcile_ligdicash)
+            models.Index(fields=['statut', 'date_creation'], name='tx_ligdicash_statut_date_idx'),
         ]
     
     def __str__(self):
@@ -68,6 +71,7 @@ class TransactionLigdiCash(models.Model):
         # Créer ou mettre à jour l'abonnement
         if self.plan:
             self._creer_ou_mettre_a_jour_abonnement()
+            ABONNEMENTS_ACTIVES.labels(self.plan.nom, 'paiement').inc()
     
     def marquer_comme_echouee(self, message='Paiement échoué'):
         """Marque la transaction comme échouée"""
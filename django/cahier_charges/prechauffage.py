@@ -0,0 +1,90 @@
+"""
+Préchauffage des workers avant leur première requête (gunicorn.conf.py :
+une fois dans le maître avec preload_app, sinon dans chaque worker)
+
+Sans préchauffage, la première requête de chaque worker paie : l'import de
+ReportLab et le chargement des polices (premier PDF), la compilation des
+templates (chargeur en cache hors DEBUG), la construction de l'urlconf et le
+rendu des cartes de forfaits (fragments {% cache %} de abonnement/carte_plan.html,
+un par plan et par langue). Ces fragments sont écrits dans le cache de
+settings.CACHES : partagé avec Redis, hérité par les workers après le fork avec
+preload_app et le cache mémoire.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.template.loader import get_template, render_to_string
+from django.urls import get_resolver
+from django.utils import timezone, translation
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES = [
+    'cahier_charges/index.html',
+    'cahier_charges/mes_cahiers.html',
+    'cahier_charges/formulaire.html',
+    'cahier_charges/preview.html',
+    'cahier_charges/abonnement/choix.html',
+    'cahier_charges/abonnement/carte_plan.html',
+    'cahier_charges/abonnement/tableau_de_bord.html',
+]
+
+
+@contextmanager
+def _etape(durees, nom):
+    debut = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        # Un préchauffage raté ne doit pas empêcher le worker de démarrer
+        logger.warning("Préchauffage '%s' ignoré: %s", nom, e)
+    finally:
+        durees[nom] = (time.perf_counter() - debut) * 1000
+
+
+def _pdf():
+    from .models import CahierCharges
+    from .pdf_generator import generate_pdf
+
+    # Cahier non enregistré : polices, styles et mise en page, sans écrire en base
+    cahier = CahierCharges(
+        type_projet='site_web', nom_projet='Préchauffage', description='Préchauffage du worker.',
+        fonctionnalites='Recherche', technologies='Django', date_creation=timezone.now(),
+    )
+    generate_pdf(cahier)
+
+
+def _plans():
+    from .models import PlanAbonnement, version_catalogue
+
+    try:
+        contexte = {'version_catalogue': version_catalogue()}
+        for plan in PlanAbonnement.objects.order_by('ordre_affichage'):
+            for langue, _ in settings.LANGUAGES:
+                with translation.override(langue):
+                    render_to_string('cahier_charges/abonnement/carte_plan.html', {**contexte, 'plan': plan})
+    finally:
+        # Connexion du thread principal : les threads de requêtes ouvrent la leur
+        connections.close_all()
+
+
+def prechauffer():
+    """
+    Returns:
+        dict: durée (ms) de chaque étape
+    """
+    durees = {}
+    with _etape(durees, 'urls'):
+        get_resolver().url_patterns
+    with _etape(durees, 'templates'):
+        for nom in TEMPLATES:
+            get_template(nom)
+    with _etape(durees, 'reportlab'):
+        _pdf()
+    with _etape(durees, 'plans'):
+        _plans()
+    return durees
@@ -0,0 +1,229 @@
+"""
+Recherche plein texte dans les cahiers de charges
+
+- PostgreSQL : expression tsvector pondérée (configuration 'french') couverte
+  par un index GIN, requêtes websearch_to_tsquery, classement ts_rank et
+  surlignage ts_headline.
+- SQLite : table FTS5 fantôme (cahier_charges_recherche, rowid = id du cahier)
+  tenue à jour par triggers, classement bm25 et surlignage snippet().
+- Autres bases, ou SQLite sans FTS5 : repli sur icontains.
+
+Les textes indexés sont décrits par SOURCES : colonnes de la table ou clés
+du document `details` (CHAMPS_DETAILS). L'index est créé par les migrations
+(0012, 0016), avec un SQL figé dans chaque migration : si SOURCES ou
+CHAMPS_DETAILS changent, une nouvelle migration doit recréer l'index avec la
+même expression que _tsvector_sql() (PostgreSQL) et les mêmes colonnes FTS5.
+Sur SQLite, une migration qui reconstruit la table des cahiers supprime ses
+triggers : les recréer dans la même migration.
+"""
+
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Substr
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import CHAMPS_DETAILS
+
+TABLE_CAHIERS = 'cahier_charges_cahiercharges'
+TABLE_FTS = 'cahier_charges_recherche'
+
+# Textes indexés, par poids (A = le plus important)
+SOURCES = {
+    'A': ['nom_projet'],
+    'B': ['description', 'fonctionnalites'],
+    'C': [
+        'technologies', 'public_cible', 'contraintes_techniques',
+        'type_ia', 'donnees_requises', 'performance_attendue',
+        'lieu_mariage', 'style_mariage', 'services_requis',
+        'type_construction', 'localisation', 'materiaux', 'normes',
+    ],
+}
+
+# Colonnes de la table FTS5 et poids bm25 correspondants
+COLONNES_FTS = {'A': 'titre', 'B': 'texte', 'C': 'complements'}
+POIDS_BM25 = {'A': 10.0, 'B': 4.0, 'C': 1.0}
+
+# Marqueurs de surlignage insérés par la base, remplacés par <mark> après échappement HTML
+DEBUT_SURLIGNAGE = '\x02'
+FIN_SURLIGNAGE = '\x03'
+
+
+# Expressions SQL
+
+def _expression(nom, vendeur):
+    if nom not in CHAMPS_DETAILS:
+        return nom
+    if vendeur == 'postgresql':
+        return f"details->>'{nom}'"
+    return f"json_extract(details, '$.{nom}')"
+
+
+def _concatenation(noms, vendeur):
+    return " || ' ' || ".join(f"coalesce({_expression(nom, vendeur)}, '')" for nom in noms)
+
+
+def _tsvector_sql(sources):
+    """Expression tsvector pondérée ; doit être identique dans l'index (migrations) et dans les requêtes"""
+    return ' || '.join(
+        f"setweight(to_tsvector('french', {_concatenation(noms, 'postgresql')}), '{poids}')"
+        for poids, noms in sources.items()
+    )
+
+
+# Requêtes
+
+def _fts_disponible(connexion):
+    with connexion.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [TABLE_FTS])
+        return cursor.fetchone() is not None
+
+
+def _requete_fts5(texte):
+    """
+    Transforme une saisie libre en requête FTS5 sûre : chaque mot est cité
+    (pas d'opérateurs injectés) et le dernier est un préfixe pour la saisie en cours
+    """
+    mots = re.findall(r'\w+', texte)
+    if not mots:
+        return None
+    termes = [f'"{mot}"' for mot in mots]
+    termes[-1] += '*'
+    return ' '.join(termes)
+
+
+def _mode(queryset):
+    connexion = connections[queryset.db]
+    if connexion.vendor == 'postgresql':
+        return 'postgresql'
+    if connexion.vendor == 'sqlite' and _fts_disponible(connexion):
+        return 'sqlite'
+    return None
+
+
+def _filtre_icontains(texte):
+    condition = Q()
+    for noms in SOURCES.values():
+        for nom in noms:
+            champ = f'details__{nom}' if nom in CHAMPS_DETAILS else nom
+            condition |= Q(**{f'{champ}__icontains': texte})
+    return condition
+
+
+def filtrer(queryset, texte):
+    """Restreint un queryset de CahierCharges aux cahiers correspondant au texte (sans classement)"""
+    mode = _mode(queryset)
+    if mode == 'postgresql':
+        return queryset.filter(RawSQL(
+            f"({_tsvector_sql(SOURCES)}) @@ websearch_to_tsquery('french', %s)",
+            [texte], output_field=BooleanField(),
+        ))
+    if mode == 'sqlite':
+        requete = _requete_fts5(texte)
+        if requete is None:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT rowid FROM {TABLE_FTS} WHERE {TABLE_FTS} MATCH %s", [requete]
+        ))
+    return queryset.filter(_filtre_icontains(texte))
+
+
+def _surligner(extrait):
+    html = escape(extrait.strip()).replace(DEBUT_SURLIGNAGE, '<mark>').replace(FIN_SURLIGNAGE, '</mark>')
+    return mark_safe(html)
+
+
+def _resultats_postgresql(queryset, texte, limite):
+    connexion = connections[queryset.db]
+    tsvector = _tsvector_sql(SOURCES)
+    ids = queryset.filter(RawSQL(
+        f"({tsvector}) @@ websearch_to_tsquery('french', %s)", [texte], output_field=BooleanField(),
+    )).annotate(
+        rang=RawSQL(f"ts_rank({tsvector}, websearch_to_tsquery('french', %s))", [texte])
+    ).order_by('-rang', '-id').values_list('id', 'rang')[:limite]
+    ids = list(ids)
+    if not ids:
+        return []
+
+    # ts_headline est coûteux : calculé uniquement pour la page de résultats
+    options = f'StartSel={DEBUT_SURLIGNAGE}, StopSel={FIN_SURLIGNAGE}, MaxWords=30, MinWords=12'
+    with connexion.cursor() as cursor:
+        cursor.execute(
+            f"SELECT id, ts_headline('french', {_concatenation(SOURCES['A'] + SOURCES['B'], 'postgresql')}, "
+            f"websearch_to_tsquery('french', %s), %s) FROM {TABLE_CAHIERS} WHERE id = ANY(%s)",
+            [texte, options, [cahier_id for cahier_id, _ in ids]],
+        )
+        extraits = dict(cursor.fetchall())
+    return [(cahier_id, rang, extraits.get(cahier_id, '')) for cahier_id, rang in ids]
+
+
+def _resultats_sqlite(queryset, texte, limite):
+    requete = _requete_fts5(texte)
+    if requete is None:
+        return []
+    connexion = connections[queryset.db]
+    poids = ', '.join(str(POIDS_BM25[p]) for p in SOURCES)
+    candidats = queryset.order_by().values('id').query
+    sql_candidats, params_candidats = candidats.sql_with_params()
+    with connexion.cursor() as cursor:
+        # "+rowid" empêche SQLite de relancer la recherche FTS5 pour chaque cahier candidat
+        cursor.execute(
+            f"SELECT rowid, bm25({TABLE_FTS}, {poids}) AS rang "
+            f"FROM {TABLE_FTS} WHERE {TABLE_FTS} MATCH %s AND +rowid IN ({sql_candidats}) "
+            f"ORDER BY rang LIMIT %s",
+            [requete, *params_candidats, limite],
+        )
+        # bm25 est négatif (plus petit = plus pertinent)
+        rangs = [(cahier_id, -rang) for cahier_id, rang in cursor.fetchall()]
+        if not rangs:
+            return []
+
+        # snippet() calculé uniquement pour la page de résultats
+        ids = [cahier_id for cahier_id, _ in rangs]
+        cursor.execute(
+            f"SELECT rowid, snippet({TABLE_FTS}, -1, %s, %s, '…', 24) FROM {TABLE_FTS} "
+            f"WHERE {TABLE_FTS} MATCH %s AND +rowid IN ({', '.join(['%s'] * len(ids))})",
+            [DEBUT_SURLIGNAGE, FIN_SURLIGNAGE, requete, *ids],
+        )
+        extraits = dict(cursor.fetchall())
+    return [(cahier_id, rang, extraits.get(cahier_id, '')) for cahier_id, rang in rangs]
+
+
+def rechercher(queryset, texte, limite=50):
+    """
+    Recherche classée par pertinence dans un queryset de CahierCharges
+
+    Returns:
+        list: cahiers (colonnes de la liste uniquement) avec les attributs
+        `rang` et `surlignage` (HTML sûr, termes entourés de <mark>)
+    """
+    texte = (texte or '').strip()
+    if not texte:
+        return []
+
+    mode = _mode(queryset)
+    if mode == 'postgresql':
+        resultats = _resultats_postgresql(queryset, texte, limite)
+    elif mode == 'sqlite':
+        resultats = _resultats_sqlite(queryset, texte, limite)
+    else:
+        resultats = [
+            (cahier_id, 0, '') for cahier_id in
+            queryset.filter(_filtre_icontains(texte)).order_by('-date_creation').values_list('id', flat=True)[:limite]
+        ]
+
+    cahiers = queryset.model.objects.only(
+        'id', 'type_projet', 'nom_projet', 'date_creation', 'budget'
+    ).annotate(extrait=Substr('description', 1, 300)).in_bulk([cahier_id for cahier_id, _, _ in resultats])
+    liste = []
+    for cahier_id, rang, extrait in resultats:
+        cahier = cahiers.get(cahier_id)
+        if cahier is None:
+            continue
+        cahier.rang = rang
+        cahier.surlignage = _surligner(extrait) if extrait else None
+        liste.append(cahier)
+    return liste
@@ -0,0 +1,122 @@
+"""
+Lectures sur les réplicas de la base (DB_REPLICAS)
+
+Les vues en lecture seule listées dans settings.REPLICA_VUES (requêtes GET)
+lisent sur un réplica ; tout le reste, écritures comprises, reste sur la base
+principale. ReplicaMiddleware choisit le réplica au début de la vue et
+l'attache à la requête courante via une ContextVar ; RouteurReplicas
+(DATABASE_ROUTERS) la consulte pour chaque lecture.
+
+- Lecture de ses propres écritures : après une écriture (requête POST ou SQL
+  INSERT/UPDATE/DELETE sur la base principale), le navigateur lit sur la base
+  principale pendant REPLICA_EPINGLAGE secondes (cookie).
+- Retard de réplication : un réplica en retard de plus de REPLICA_RETARD_MAX
+  secondes, ou injoignable, est écarté (vérifié au plus toutes les
+  INTERVALLE_VERIFICATION secondes par processus) ; sans réplica disponible,
+  la vue lit sur la base principale.
+"""
+
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+_replica_courante = ContextVar('replica_courante', default=None)
+
+INTERVALLE_VERIFICATION = 2
+
+# Lues sur la base principale même dans une vue routée : une session créée
+# à la connexion doit être visible immédiatement
+APPLICATIONS_PRIMAIRE = {'sessions'}
+
+SQL_RETARD_POSTGRESQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        -- Tout le WAL reçu est rejoué : à jour, même si le primaire n'écrit plus depuis longtemps
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+# alias -> (instant de la vérification, réplica utilisable)
+_etat = {}
+
+
+def retard(alias):
+    """Retard de réplication en secondes, None si le réplica est injoignable"""
+    connexion = connections[alias]
+    if connexion.vendor != 'postgresql':
+        return 0.0
+    try:
+        with connexion.cursor() as cursor:
+            cursor.execute(SQL_RETARD_POSTGRESQL)
+            return float(cursor.fetchone()[0])
+    except DatabaseError as e:
+        logger.warning("Réplica %s injoignable: %s", alias, e)
+        connexion.close()
+        return None
+
+
+def _utilisable(alias):
+    maintenant = time.monotonic()
+    verification = _etat.get(alias)
+    if verification and maintenant - verification[0] < INTERVALLE_VERIFICATION:
+        return verification[1]
+    valeur = retard(alias)
+    utilisable = valeur is not None and valeur <= settings.REPLICA_RETARD_MAX
+    if valeur is not None and not utilisable:
+        logger.warning("Réplica %s en retard de %.1f s: lectures sur la base principale", alias, valeur)
+    _etat[alias] = (maintenant, utilisable)
+    return utilisable
+
+
+def choisir():
+    """Alias d'un réplica à jour, ou None pour lire sur la base principale"""
+    candidats = [alias for alias in settings.REPLICA_ALIASES if _utilisable(alias)]
+    return random.choice(candidats) if candidats else None
+
+
+def utiliser(alias):
+    """Lectures de la requête courante sur `alias` (None : base principale)"""
+    _replica_courante.set(alias)
+
+
+def replica_courante():
+    return _replica_courante.get()
+
+
+class RouteurReplicas:
+    """Routeur (DATABASE_ROUTERS) : lectures sur le réplica de la requête courante"""
+
+    def _primaire_si_replica(self, hints):
+        # Objet lu sur un réplica : ses écritures et relations passent par la base principale
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in settings.REPLICA_ALIASES:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_read(self, model, **hints):
+        alias = _replica_courante.get()
+        if alias is not None and model._meta.app_label not in APPLICATIONS_PRIMAIRE:
+            return alias
+        return self._primaire_si_replica(hints)
+
+    def db_for_write(self, model, **hints):
+        return self._primaire_si_replica(hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        bases = {DEFAULT_DB_ALIAS, *settings.REPLICA_ALIASES}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Les réplicas reçoivent le schéma par la réplication
+        if db in settings.REPLICA_ALIASES:
+            return False
+        return None
@@ -1,3 +1,1066 @@
-from django.test import TestCase
+import contextlib
+import gzip
+import io
+import json
+import logging
+import os
+import runpy
+import sys
+import tempfile
+import time
+import warnings
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.db.utils import load_backend
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import compression, journalisation, prechauffage, recherche, replicas, versions
+from . import urls as cahier_urls
+from .apps import MOTEUR_SQLITE_PRODUCTION
+from .circuit_breaker import CircuitBreaker
+from .forms import FORMULAIRES
+from .ligdicash_client import DISJONCTEURS
+from .ligdicash_config import LIGDICASH_CONFIG
+from .ligdicash_simulateur import signer
+from .management.commands import profil_imports, reconcile_ligdicash
+from .middleware import CompressionMiddleware
+from .models import (
+    Abonnement,
+    CahierCharges,
+    CahierUtilisation,
+    PlanAbonnement,
+    TypeProjet,
+    VersionCahier,
+    version_catalogue,
+)
+from .models_paiement import TransactionLigdiCash
+
+# Budget par nom d'URL de cahier_charges/urls.py : (requêtes SQL max, durée max en ms).
+# Les données de test donnent 200 cahiers et 100 transactions à l'utilisateur : une
+# requête N+1 fait exploser le compte. Ajuster un budget doit être une décision consciente.
+BUDGETS = {
+    'index': (3, 250),
+    'mes_cahiers': (6, 250),
+    'mes_cahiers_page': (4, 250),
+    'recherche_cahiers': (7, 250),
+    'creer_cahier': (3, 250),
+    'creer_cahier_type': (6, 250),
+    'verifier_limite_cahiers': (6, 250),
+    'creer_brouillon': (7, 250),
+    'sauvegarder_brouillon': (5, 250),
+    'supprimer_cahier': (5, 250),
+    'historique_cahier': (6, 250),
+    'version_cahier': (6, 250),
+    'formulaire': (6, 250),
+    'preview': (7, 250),
+    'generer_pdf': (8, 500),
+    'authentification': (0, 250),
+    'authentification_cahier': (4, 250),
+    'deconnexion': (5, 250),
+    'choix_abonnement': (5, 250),
+    'abonnement': (5, 250),
+    'creer_abonnement': (10, 250),
+    'annuler_abonnement': (4, 250),
+    'tableau_de_bord': (7, 250),
+    'initier_paiement_ligdicash': (10, 250),
+    'notification_ligdicash': (10, 250),
+    'retour_ligdicash': (10, 250),
+    'annulation_ligdicash': (5, 250),
+    'metrics': (3, 250),
+}
+
+# Multiplicateur des budgets de temps pour les machines lentes (BUDGET_TEMPS_FACTEUR=3)
+FACTEUR_TEMPS = float(os.environ.get('BUDGET_TEMPS_FACTEUR', '1'))
+
+# Temps d'import maximal (ms) au démarrage d'un worker, voir manage.py profil_imports
+BUDGET_DEMARRAGE_MS = 800
+
+NB_CAHIERS = 200
+NB_TRANSACTIONS = 100
+NB_VERSIONS = 45
+
+
+# Profil de sessions de production avec Redis (REDIS_URL) : sessions lues depuis le cache
+SESSIONS_EN_CACHE = override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+
+
+@SESSIONS_EN_CACHE
+class BudgetRequetesTests(TestCase):
+    """Nombre de requêtes SQL et durée maximales pour chaque URL de l'application"""
+
+    @classmethod
+    def setUpTestData(cls):
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_command('init_plans')
+        cls.plan_pro = PlanAbonnement.objects.get(nom='pro_mensuel')
+        cls.plan_essentiel = PlanAbonnement.objects.get(nom='essentiel')
+
+        cls.utilisateur = User.objects.create_user('charge', 'charge@example.com', 'motdepasse')
+        Abonnement.objects.filter(utilisateur=cls.utilisateur).update(
+            plan=cls.plan_essentiel, date_fin=timezone.now().date() + timedelta(days=30),
+            paiement_recurrent=True,
+        )
+        cls.abonnement = Abonnement.objects.get(utilisateur=cls.utilisateur)
+        CahierUtilisation.objects.create(
+            utilisateur=cls.utilisateur, mois=timezone.now().date().replace(day=1),
+            nb_cahiers_crees=5, nb_pdf_generes=0,
+        )
+
+        types = ['site_web', 'app_mobile', 'ia', 'mariage', 'construction']
+        CahierCharges.objects.bulk_create([
+            CahierCharges(
+                utilisateur=cls.utilisateur,
+                type_projet=types[i % len(types)],
+                nom_projet=f'Projet {i}',
+                description='Plateforme de réservation en ligne avec paiement mobile. ' * 20,
+                fonctionnalites='Authentification, tableau de bord, notifications',
+                technologies='Django, PostgreSQL',
+                budget=Decimal('1500.00') + i,
+                materiaux='béton, acier',
+            )
+            for i in range(NB_CAHIERS)
+        ])
+        cls.cahier = CahierCharges.objects.filter(utilisateur=cls.utilisateur).first()
+        cls.brouillon = CahierCharges.objects.create(
+            utilisateur=cls.utilisateur, type_projet='ia', nom_projet='Brouillon',
+            description='Assistant de tri des courriels. ' * 200, brouillon=True, revision=3,
+        )
+
+        TransactionLigdiCash.objects.bulk_create([
+            TransactionLigdiCash(
+                utilisateur=cls.utilisateur,
+                plan=cls.plan_essentiel,
+                montant=Decimal('6000'),
+                statut=['successful', 'failed', 'pending'][i % 3],
+                payment_token=f'jeton_{i}',
+            )
+            for i in range(NB_TRANSACTIONS)
+        ])
+        cls.transaction = TransactionLigdiCash.objects.filter(statut='pending').first()
+
+        # Un utilisateur Pro (historique des versions) et un cahier souvent modifié
+        cls.utilisateur_pro = User.objects.create_user('pro', 'pro@example.com', 'motdepasse')
+        Abonnement.objects.filter(utilisateur=cls.utilisateur_pro).update(plan=cls.plan_pro)
+        cls.cahier_versionne = CahierCharges.objects.create(
+            utilisateur=cls.utilisateur_pro, type_projet='construction', nom_projet='Immeuble',
+            description='Construction d\'un immeuble de bureaux. ' * 50,
+        )
+        for i in range(NB_VERSIONS):
+            cls.cahier_versionne.description += f' Révision {i}.'
+            cls.cahier_versionne.surface = f'{1000 + i} m²'
+            versions.enregistrer_version(cls.cahier_versionne, auteur=cls.utilisateur_pro)
+
+        # Un autre utilisateur, pour vérifier que les listes restent filtrées
+        autre = User.objects.create_user('autre', 'autre@example.com', 'motdepasse')
+        CahierCharges.objects.bulk_create([
+            CahierCharges(utilisateur=autre, type_projet='site_web', nom_projet=f'Autre {i}', description='x')
+            for i in range(50)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.utilisateur)
+
+    def _scenarios(self):
+        """Requête représentative pour chaque nom d'URL : (méthode, url, options)"""
+        corps_webhook = json.dumps({'token': self.transaction.payment_token, 'response_code': '00'}).encode()
+        return {
+            'index': ('get', reverse('index'), {}),
+            'mes_cahiers': ('get', reverse('mes_cahiers'), {}),
+            'mes_cahiers_page': ('get', reverse('mes_cahiers_page'), {}),
+            'recherche_cahiers': ('get', reverse('recherche_cahiers'), {'data': {'q': 'réservation'}}),
+            'creer_cahier': ('get', reverse('creer_cahier'), {}),
+            'creer_cahier_type': ('get', reverse('creer_cahier_type', args=['site_web']), {}),
+            'verifier_limite_cahiers': ('get', reverse('verifier_limite_cahiers'), {}),
+            'creer_brouillon': ('post', reverse('creer_brouillon', args=['site_web']), {
+                'data': {'champs': {'nom_projet': 'Boutique', 'technologies': 'Django'}},
+                'content_type': 'application/json',
+            }),
+            'sauvegarder_brouillon': ('patch', reverse('sauvegarder_brouillon', args=[self.brouillon.id]), {
+                'data': {'revision': 3, 'champs': {'budget': '2500', 'type_ia': 'Classification'}},
+                'content_type': 'application/json',
+            }),
+            'supprimer_cahier': ('get', reverse('supprimer_cahier', args=[self.cahier.id]), {}),
+            'historique_cahier': ('get', reverse('historique_cahier', args=[self.cahier_versionne.id]), {'pro': True}),
+            'version_cahier': ('get', reverse('version_cahier', args=[self.cahier_versionne.id, NB_VERSIONS - 5]), {'pro': True}),
+            'formulaire': ('get', reverse('formulaire', args=['site_web']), {}),
+            'preview': ('get', reverse('preview', args=[self.cahier.id]), {}),
+            'generer_pdf': ('get', reverse('generer_pdf', args=[self.cahier.id]), {}),
+            'authentification': ('get', reverse('authentification'), {'anonyme': True}),
+            'authentification_cahier': ('get', reverse('authentification_cahier', args=[self.cahier.id]), {'anonyme': True}),
+            'deconnexion': ('get', reverse('deconnexion'), {}),
+            'choix_abonnement': ('get', reverse('choix_abonnement'), {}),
+            'abonnement': ('get', reverse('abonnement'), {}),
+            'creer_abonnement': ('get', reverse('creer_abonnement', args=[self.plan_pro.id]), {}),
+            'annuler_abonnement': ('get', reverse('annuler_abonnement', args=[self.abonnement.id]), {}),
+            'tableau_de_bord': ('get', reverse('tableau_de_bord'), {}),
+            'initier_paiement_ligdicash': ('post', reverse('initier_paiement_ligdicash', args=[self.plan_pro.id]), {}),
+            'notification_ligdicash': ('post', reverse('notification_ligdicash'), {
+                'data': corps_webhook,
+                'content_type': 'application/json',
+                'HTTP_X_LIGDICASH_SIGNATURE': signer(corps_webhook, LIGDICASH_CONFIG['WEBHOOK_SECRET']),
+            }),
+            'retour_ligdicash': ('get', reverse('retour_ligdicash'), {'data': {'token': self.transaction.payment_token}}),
+            'annulation_ligdicash': ('get', reverse('annulation_ligdicash'), {'data': {'token': self.transaction.payment_token}}),
+            'metrics': ('get', reverse('metrics'), {'HTTP_AUTHORIZATION': 'Bearer jeton-test'}),
+        }
+
+    def _client_ligdicash(self):
+        """Client LigdiCash factice : aucun appel réseau pendant les mesures"""
+        client = mock.Mock()
+        client.initier_paiement.return_value = {
+            'success': True,
+            'payment_token': 'jeton_budget',
+            'payment_url': 'https://ligdicash.invalid/pay/jeton_budget/',
+        }
+        client.verifier_paiement.return_value = {
+            'success': True,
+            'status': 'SUCCESS',
+            'transaction': {'response_code': '00'},
+        }
+        return mock.Mock(return_value=client)
+
+    def _mesurer(self, nom):
+        methode, url, options = self._scenarios()[nom]
+        options = dict(options)
+        if options.pop('anonyme', False):
+            self.client.logout()
+        if options.pop('pro', False):
+            self.client.force_login(self.utilisateur_pro)
+
+        with mock.patch('cahier_charges.views_paiement.LigdiCashClient', self._client_ligdicash()), \
+                override_settings(METRICS_TOKEN='jeton-test'), \
+                contextlib.redirect_stdout(io.StringIO()), \
+                CaptureQueriesContext(connection) as requetes:
+            debut = time.perf_counter()
+            reponse = getattr(self.client, methode)(url, **options)
+            duree_ms = (time.perf_counter() - debut) * 1000
+        return reponse, requetes.captured_queries, duree_ms
+
+    def _verifier_budget(self, nom):
+        max_requetes, max_ms = BUDGETS[nom]
+        reponse, requetes, duree_ms = self._mesurer(nom)
+        self.assertLess(reponse.status_code, 500, f"{nom}: erreur {reponse.status_code}")
+
+        if len(requetes) > max_requetes:
+            detail = '\n'.join(f"  {i}. {requete['sql']}" for i, requete in enumerate(requetes, 1))
+            self.fail(f"{nom}: {len(requetes)} requêtes SQL pour un budget de {max_requetes}\n{detail}")
+        self.assertLessEqual(
+            duree_ms, max_ms * FACTEUR_TEMPS,
+            f"{nom}: {duree_ms:.0f} ms pour un budget de {max_ms} ms ({len(requetes)} requêtes)",
+        )
+
+    def test_chaque_url_a_un_budget(self):
+        noms = {motif.name for motif in cahier_urls.urlpatterns if motif.name}
+        self.assertEqual(noms - set(BUDGETS), set(), "URL sans budget de requêtes dans BUDGETS")
+        self.assertEqual(set(BUDGETS) - noms, set(), "Budget pour une URL qui n'existe plus")
+
+
+def _creer_test_budget(nom):
+    def test(self):
+        self._verifier_budget(nom)
+    test.__doc__ = f"Budget de requêtes et de temps de l'URL {nom}"
+    return test
+
+
+# Un test par URL : chaque mesure part des mêmes données (transaction annulée entre les tests)
+for _nom in BUDGETS:
+    setattr(BudgetRequetesTests, f'test_budget_{_nom}', _creer_test_budget(_nom))
+
+
+class ReconciliationTests(TestCase):
+    """Commande reconcile_ligdicash : seules les transactions encore en attente changent"""
+
+    # Jeton -> statut renvoyé par LigdiCash
+    STATUTS = {
+        'jeton_reussi': {'success': True, 'status': 'SUCCESS', 'transaction': {'response_code': '00'}},
+        'jeton_echoue': {'success': False, 'status': 'FAILED'},
+        'jeton_attente': {'success': False, 'status': 'PENDING'},
+        'jeton_recent': {'success': True, 'status': 'SUCCESS', 'transaction': {'response_code': '00'}},
+        'jeton_deja_paye': {'success': False, 'status': 'FAILED'},
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_command('init_plans')
+        utilisateur = User.objects.create_user('reconciliation', 'reconciliation@example.com', 'motdepasse')
+        plan = PlanAbonnement.objects.get(nom='pro_mensuel')
+        transactions = {
+            jeton: TransactionLigdiCash.objects.create(
+                utilisateur=utilisateur, plan=plan, montant=plan.prix_mensuel, payment_token=jeton,
+                statut='successful' if jeton == 'jeton_deja_paye' else 'pending',
+            )
+            for jeton in cls.STATUTS
+        }
+        transactions['sans_jeton'] = TransactionLigdiCash.objects.create(
+            utilisateur=utilisateur, plan=plan, montant=plan.prix_mensuel,
+        )
+        # date_creation est en auto_now_add : vieillir les transactions après coup
+        maintenant = timezone.now()
+        TransactionLigdiCash.objects.exclude(payment_token='jeton_recent').update(date_creation=maintenant - timedelta(hours=1))
+        TransactionLigdiCash.objects.filter(payment_token=None).update(date_creation=maintenant - timedelta(days=3))
+        cls.transactions = {cle: tx.pk for cle, tx in transactions.items()}
+
+    def _reconcilier(self):
+        client = mock.Mock()
+        client.verifier_paiement.side_effect = lambda jeton: self.STATUTS[jeton]
+        with mock.patch('cahier_charges.ligdicash_client.LigdiCashClient', return_value=client):
+            call_command('reconcile_ligdicash', rate=0, stdout=io.StringIO())
+        return client
+
+    def _statuts(self):
+        return {
+            cle: TransactionLigdiCash.objects.get(pk=pk).statut
+            for cle, pk in self.transactions.items()
+        }
+
+    def test_seules_les_transactions_en_attente_changent(self):
+        client = self._reconcilier()
+        self.assertEqual(self._statuts(), {
+            'jeton_reussi': 'successful',
+            'jeton_echoue': 'failed',
+            'jeton_attente': 'pending',
+            'jeton_recent': 'pending',
+            'jeton_deja_paye': 'successful',
+            'sans_jeton': 'expired',
+        })
+        verifies = {appel.args[0] for appel in client.verifier_paiement.call_args_list}
+        self.assertEqual(verifies, {'jeton_reussi', 'jeton_echoue', 'jeton_attente'})
+        reussie = TransactionLigdiCash.objects.get(pk=self.transactions['jeton_reussi'])
+        self.assertEqual(reussie.abonnement.plan.nom, 'pro_mensuel')
+
+    def test_execution_deja_en_cours(self):
+        cache.add(reconcile_ligdicash.LOCK_KEY, 1)
+        self.addCleanup(cache.delete, reconcile_ligdicash.LOCK_KEY)
+        client = self._reconcilier()
+        client.verifier_paiement.assert_not_called()
+        self.assertEqual(self._statuts()['jeton_reussi'], 'pending')
+
+    def test_requete_sur_l_index_statut(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Plan de requête propre à SQLite')
+        requete, parametres = TransactionLigdiCash.objects.filter(
+            statut='pending', date_creation__lt=timezone.now(),
+        ).order_by('statut', 'date_creation').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {requete}', parametres)
+            plan = ' '.join(str(ligne[-1]) for ligne in cursor.fetchall())
+        self.assertIn('tx_ligdicash_statut_date_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class DisjoncteurTests(TestCase):
+    """Disjoncteur LigdiCash : ouverture, appel d'essai unique, fermeture"""
+
+    def setUp(self):
+        cache.clear()
+        self.disjoncteur = CircuitBreaker('test', seuil_echec=0.5, min_appels=4, fenetre=60, duree_ouverture=30)
+        horloge = mock.patch('cahier_charges.circuit_breaker.time')
+        self.horloge = horloge.start()
+        self.addCleanup(horloge.stop)
+        self.horloge.time.return_value = 1000.0
+
+    def _ouvrir(self):
+        with self.assertLogs('cahier_charges.circuit_breaker', 'WARNING'):
+            for _ in range(4):
+                self.disjoncteur.echec()
+
+    def test_ouverture_au_seuil_d_echec(self):
+        for _ in range(3):
+            self.disjoncteur.echec()
+        self.assertEqual(self.disjoncteur.etat(), CircuitBreaker.FERME)
+        self.disjoncteur.succes()
+        with self.assertLogs('cahier_charges.circuit_breaker', 'WARNING'):
+            self.disjoncteur.echec()
+        # 4 échecs sur 5 appels, au-delà de min_appels
+        self.assertEqual(self.disjoncteur.etat(), CircuitBreaker.OUVERT)
+        self.assertFalse(self.disjoncteur.autoriser())
+
+    def test_un_seul_appel_d_essai(self):
+        self._ouvrir()
+        self.horloge.time.return_value += 31
+        self.assertEqual(self.disjoncteur.etat(), CircuitBreaker.SEMI_OUVERT)
+        self.assertTrue(self.disjoncteur.autoriser())
+        self.assertFalse(self.disjoncteur.autoriser())
+        with self.assertLogs('cahier_charges.circuit_breaker', 'WARNING'):
+            self.disjoncteur.echec()
+        self.assertEqual(self.disjoncteur.etat(), CircuitBreaker.OUVERT)
+
+    def test_fermeture_apres_un_essai_reussi(self):
+        self._ouvrir()
+        self.horloge.time.return_value += 31
+        self.assertTrue(self.disjoncteur.autoriser())
+        with self.assertLogs('cahier_charges.circuit_breaker', 'INFO'):
+            self.disjoncteur.succes()
+        self.assertEqual(self.disjoncteur.etat(), CircuitBreaker.FERME)
+        # Nouvelle génération : les échecs d'avant la fermeture ne comptent plus
+        self.assertEqual(self.disjoncteur.statistiques()['echecs'], 0)
+        self.assertTrue(self.disjoncteur.autoriser())
+
+    def test_pas_de_transaction_sans_l_appel_d_essai(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_command('init_plans')
+        utilisateur = User.objects.create_user('essai', 'essai@example.com', 'motdepasse')
+        self.client.force_login(utilisateur)
+        disjoncteur = DISJONCTEURS['initiate']
+        cache.set(disjoncteur._cle('ouvert'), 1000.0 - disjoncteur.duree_ouverture - 1, None)
+        self.assertTrue(disjoncteur.autoriser())
+
+        client_ligdicash = mock.Mock()
+        url = reverse('initier_paiement_ligdicash', args=[PlanAbonnement.objects.get(nom='pro_mensuel').id])
+        with mock.patch('cahier_charges.views_paiement.LigdiCashClient', return_value=client_ligdicash), \
+                contextlib.redirect_stdout(io.StringIO()):
+            reponse = self.client.post(url)
+        self.assertRedirects(reponse, reverse('choix_abonnement'), fetch_redirect_response=False)
+        client_ligdicash.initier_paiement.assert_not_called()
+        self.assertFalse(TransactionLigdiCash.objects.filter(utilisateur=utilisateur).exists())
+
+
+class ReutilisationPaiementTests(TestCase):
+    """Double clic sur « Payer » : une seule transaction en attente par utilisateur et par plan"""
+
+    @classmethod
+    def setUpTestData(cls):
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_command('init_plans')
+        cls.utilisateur = User.objects.create_user('double_clic', 'double_clic@example.com', 'motdepasse')
+        cls.plan = PlanAbonnement.objects.get(nom='pro_mensuel')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.utilisateur)
+        self.url = reverse('initier_paiement_ligdicash', args=[self.plan.id])
+        self.ligdicash = mock.Mock()
+        self.ligdicash.initier_paiement.return_value = {
+            'success': True, 'payment_token': 'jeton_unique',
+            'payment_url': 'https://ligdicash.invalid/pay/jeton_unique/',
+        }
+        client = mock.patch('cahier_charges.views_paiement.LigdiCashClient', return_value=self.ligdicash)
+        client.start()
+        self.addCleanup(client.stop)
+
+    def _payer(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.client.post(self.url)
+
+    def test_transaction_en_attente_reutilisee(self):
+        premiere = self._payer()
+        seconde = self._payer()
+        self.assertEqual(premiere['Location'], 'https://ligdicash.invalid/pay/jeton_unique/')
+        self.assertEqual(seconde['Location'], premiere['Location'])
+        self.assertEqual(self.ligdicash.initier_paiement.call_count, 1)
+        self.assertEqual(TransactionLigdiCash.objects.filter(utilisateur=self.utilisateur).count(), 1)
+
+    def test_initialisation_concurrente_sans_attente(self):
+        cache.add(f'ligdicash:initiation:{self.utilisateur.id}:{self.plan.id}', 1, 60)
+        with mock.patch('time.sleep') as attente:
+            reponse = self._payer()
+        attente.assert_not_called()
+        self.assertRedirects(reponse, reverse('choix_abonnement'), fetch_redirect_response=False)
+        self.ligdicash.initier_paiement.assert_not_called()
+        self.assertFalse(TransactionLigdiCash.objects.filter(utilisateur=self.utilisateur).exists())
+
+
+class ConfigurationLigdiCashTests(TestCase):
+    """Simulateur LigdiCash : accepté en mode test, refusé en production"""
+
+    def _configuration(self, **environnement):
+        with mock.patch.dict(os.environ, environnement), mock.patch('dotenv.load_dotenv'), \
+                warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            return runpy.run_path(str(settings.BASE_DIR / 'cahier_charges' / 'ligdicash_config.py'))
+
+    def test_simulateur_en_mode_test(self):
+        configuration = self._configuration(LIGDICASH_TEST_MODE='True', LIGDICASH_SIMULATEUR_URL='http://127.0.0.1:8765/')
+        self.assertEqual(configuration['LIGDICASH_CONFIG']['VERIFY_URL'],
+                         'http://127.0.0.1:8765/pay/v01/straight/check_payment/')
+
+    def test_simulateur_refuse_en_production(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self._configuration(LIGDICASH_TEST_MODE='False', LIGDICASH_SIMULATEUR_URL='http://127.0.0.1:8765')
+
+
+class RechercheTests(TestCase):
+    """Recherche plein texte : index FTS5 tenu à jour par les triggers (SQLite)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.utilisateur = User.objects.create_user('chercheur', 'chercheur@example.com', 'motdepasse')
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Index FTS5 propre à SQLite')
+        self.assertTrue(recherche._fts_disponible(connection), 'Table FTS5 absente : SQLite sans FTS5 ?')
+        self.client.force_login(self.utilisateur)
+
+    def _rechercher(self, texte):
+        reponse = self.client.get(reverse('recherche_cahiers'), {'q': texte}, HTTP_ACCEPT='application/json')
+        return reponse.json()['resultats']
+
+    def test_cahier_enregistre_retrouve(self):
+        cahier = CahierCharges.objects.create(
+            utilisateur=self.utilisateur, type_projet='site_web', nom_projet='Boutique artisanale',
+            description='Vente en ligne de poteries émaillées',
+        )
+        resultat, = self._rechercher('poteries emaillees')
+        self.assertEqual(resultat['id'], cahier.id)
+        self.assertIn('<mark>', resultat['surlignage'])
+        # Préfixe pour la saisie en cours, nom du projet classé avant la description
+        autre = CahierCharges.objects.create(
+            utilisateur=self.utilisateur, type_projet='site_web', nom_projet='Vitrine',
+            description='Présentation de la boutique',
+        )
+        self.assertEqual([r['id'] for r in self._rechercher('boutiq')], [cahier.id, autre.id])
+
+    def test_index_suit_les_details(self):
+        cahier = CahierCharges.objects.create(
+            utilisateur=self.utilisateur, type_projet='app_mobile', nom_projet='Livraison',
+            description='Suivi des coursiers', technologies='Flutter',
+        )
+        self.assertEqual([r['id'] for r in self._rechercher('flutter')], [cahier.id])
+        cahier.technologies = 'Kotlin'
+        cahier.save()
+        self.assertEqual(self._rechercher('flutter'), [])
+        self.assertEqual([r['id'] for r in self._rechercher('kotlin')], [cahier.id])
+        cahier.delete()
+        self.assertEqual(self._rechercher('kotlin'), [])
+
+
+class BrouillonTests(TestCase):
+    """Sauvegarde automatique : écritures partielles et concurrence optimiste"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.utilisateur = User.objects.create_user('redacteur', 'redacteur@example.com', 'motdepasse')
+
+    def setUp(self):
+        self.client.force_login(self.utilisateur)
+        self.brouillon = CahierCharges.objects.create(
+            utilisateur=self.utilisateur, type_projet='mariage', nom_projet='Noces',
+            description='Réception', brouillon=True, revision=1, lieu_mariage='Bobo-Dioulasso',
+        )
+        self.url = reverse('sauvegarder_brouillon', args=[self.brouillon.id])
+
+    def _patch(self, revision, champs):
+        return self.client.patch(self.url, {'revision': revision, 'champs': champs}, content_type='application/json')
+
+    def test_seuls_les_champs_envoyes_sont_ecrits(self):
+        with CaptureQueriesContext(connection) as requetes:
+            reponse = self._patch(1, {'nombre_invites': '120'})
+        self.assertEqual(reponse.json(), {'revision': 2})
+        mise_a_jour, = [r['sql'] for r in requetes.captured_queries if r['sql'].startswith('UPDATE "cahier_charges_cahiercharges"')]
+        self.assertNotIn('"description"', mise_a_jour)
+        self.brouillon.refresh_from_db()
+        self.assertEqual((self.brouillon.nombre_invites, self.brouillon.lieu_mariage), (120, 'Bobo-Dioulasso'))
+
+    def test_revision_perimee_refusee(self):
+        self._patch(1, {'description': 'Fenêtre A'})
+        reponse = self._patch(1, {'description': 'Fenêtre B'})
+        self.assertEqual(reponse.status_code, 409)
+        self.assertEqual(reponse.json()['revision'], 2)
+        self.brouillon.refresh_from_db()
+        self.assertEqual(self.brouillon.description, 'Fenêtre A')
+
+    def test_valeur_invalide(self):
+        reponse = self._patch(1, {'nombre_invites': 'beaucoup', 'inconnu': 'x'})
+        self.assertEqual(reponse.status_code, 400)
+        self.assertEqual(set(reponse.json()['erreurs']), {'nombre_invites', 'inconnu'})
+
+    def test_un_seul_brouillon_par_type(self):
+        # Première sauvegarde simultanée dans deux fenêtres : la contrainte départage
+        reponse = self.client.post(reverse('creer_brouillon', args=['mariage']),
+                                   {'champs': {'nom_projet': 'Autre fenêtre'}}, content_type='application/json')
+        self.assertEqual(reponse.status_code, 409)
+        self.assertEqual(reponse.json()['revision'], 1)
+        self.assertEqual(CahierCharges.objects.filter(utilisateur=self.utilisateur, brouillon=True).count(), 1)
+
+    def test_brouillon_refuse_au_dela_du_quota(self):
+        CahierUtilisation.objects.create(
+            utilisateur=self.utilisateur, mois=timezone.now().date().replace(day=1), nb_cahiers_crees=3,
+        )
+        Abonnement.objects.filter(utilisateur=self.utilisateur).delete()
+        reponse = self.client.post(reverse('creer_brouillon', args=['ia']),
+                                   {'champs': {'nom_projet': 'Assistant'}}, content_type='application/json')
+        self.assertEqual(reponse.status_code, 403)
+        self.assertFalse(CahierCharges.objects.filter(utilisateur=self.utilisateur, type_projet='ia').exists())
+
+    def test_brouillon_absent_des_listes_puis_valide(self):
+        self.assertNotContains(self.client.get(reverse('mes_cahiers')), 'Noces')
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.client.post(reverse('creer_cahier_type', args=['mariage']), {
+                'type_projet': 'mariage', 'nom_projet': 'Noces', 'description': 'Réception',
+                'brouillon_id': self.brouillon.id,
+            })
+        self.brouillon.refresh_from_db()
+        self.assertFalse(self.brouillon.brouillon)
+        self.assertEqual(CahierCharges.objects.filter(utilisateur=self.utilisateur).count(), 1)
+
+
+class FormulaireTests(TestCase):
+    """Une classe de formulaire par type de projet, limitée à ses champs"""
+
+    def test_champs_du_type(self):
+        self.assertEqual(set(FORMULAIRES), set(TypeProjet.values))
+        self.assertEqual(set(FORMULAIRES['ia'].base_fields), {
+            'nom_projet', 'description', 'budget', 'delai',
+            'type_ia', 'donnees_requises', 'performance_attendue', 'contraintes_techniques',
+        })
+
+    def test_type_lu_dans_l_url(self):
+        utilisateur = User.objects.create_user('formulaire', 'formulaire@example.com', 'motdepasse')
+        self.client.force_login(utilisateur)
+        url = reverse('creer_cahier_type', args=['construction'])
+        reponse = self.client.get(url)
+        self.assertContains(reponse, 'name="surface"')
+        self.assertNotContains(reponse, 'name="date_mariage"')
+        self.assertNotContains(reponse, 'name="type_projet"')
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.client.post(url, {'type_projet': 'mariage', 'nom_projet': 'Entrepôt',
+                                   'description': 'Hangar', 'surface': '400'})
+        cahier = CahierCharges.objects.get(utilisateur=utilisateur)
+        self.assertEqual((cahier.type_projet, cahier.surface), ('construction', '400'))
+        self.assertEqual(cahier.details, {'surface': '400'})
+
+class VersionsTests(TestCase):
+    """Historique des versions : deltas, instantanés et rétention"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cahier = CahierCharges.objects.create(
+            type_projet='mariage', nom_projet='Mariage', description='Cérémonie et réception. ' * 100,
+        )
+
+    def _modifier(self, nombre):
+        documents = {}
+        for i in range(nombre):
+            self.cahier.description += f'Ajout {i}. '
+            self.cahier.nombre_invites = 100 + i
+            if i % 7 == 0:
+                self.cahier.lieu_mariage = f'Salle {i}'
+            version = versions.enregistrer_version(self.cahier)
+            documents[version.numero] = versions.document(self.cahier)
+        return documents
+
+    def test_reconstruction_de_chaque_version(self):
+        documents = self._modifier(50)
+        for numero, document in documents.items():
+            self.assertEqual(versions.reconstruire(self.cahier.id, numero), document)
+
+    def test_instantanes_periodiques(self):
+        self._modifier(50)
+        instantanes = list(VersionCahier.objects.filter(cahier=self.cahier, instantane=True).values_list('numero', flat=True))
+        self.assertEqual(instantanes, [41, 21, 1])
+        with self.assertNumQueries(1):
+            versions.reconstruire(self.cahier.id, 40)
+
+    def test_taille_proportionnelle_a_la_modification(self):
+        self._modifier(2)
+        instantane, delta = VersionCahier.objects.filter(cahier=self.cahier).order_by('numero')
+        self.assertLess(delta.taille, 100)
+        self.assertGreater(instantane.taille, 2000)
+
+    def test_sans_modification_pas_de_version(self):
+        versions.enregistrer_version(self.cahier)
+        self.assertIsNone(versions.enregistrer_version(self.cahier))
+
+    def test_retention_garde_les_versions_reconstructibles(self):
+        documents = self._modifier(30)
+        supprimees = versions.purger(self.cahier.id, garder=12)
+        self.assertEqual(supprimees, 18)
+        self.assertTrue(VersionCahier.objects.get(cahier=self.cahier, numero=19).instantane)
+        for numero in range(19, 31):
+            self.assertEqual(versions.reconstruire(self.cahier.id, numero), documents[numero])
+        self.assertIsNone(versions.reconstruire(self.cahier.id, 18))
+
+
+class SqliteProductionTests(TestCase):
+    """Profil SQLite de production (backend cahier_charges.backends.sqlite3, SQLITE_PRODUCTION=True)"""
+
+    def setUp(self):
+        # Connexion à part sur un fichier temporaire : le profil est désactivé par défaut
+        repertoire = tempfile.TemporaryDirectory()
+        self.addCleanup(repertoire.cleanup)
+        moteur = load_backend(MOTEUR_SQLITE_PRODUCTION)
+        self.connexion = moteur.DatabaseWrapper(
+            {**connection.settings_dict, 'ENGINE': MOTEUR_SQLITE_PRODUCTION,
+             'NAME': os.path.join(repertoire.name, 'production.sqlite3')},
+            alias='sqlite_production',
+        )
+        self.addCleanup(self.connexion.close)
+
+    def test_pragmas_appliques(self):
+        with self.connexion.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+            cursor.execute('PRAGMA temp_store')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+    def test_profil_sur_demande(self):
+        self.assertEqual(charger_settings(DB_ENGINE='', SQLITE_PRODUCTION='')['DATABASES']['default']['ENGINE'],
+                         'django.db.backends.sqlite3')
+        self.assertEqual(charger_settings(DB_ENGINE='', SQLITE_PRODUCTION='True')['DATABASES']['default']['ENGINE'],
+                         MOTEUR_SQLITE_PRODUCTION)
+
+
+class DemarrageTests(TestCase):
+    """Démarrage d'un worker : dépendances lourdes chargées à la première utilisation"""
+
+    def test_imports_au_demarrage(self):
+        imports, modules = profil_imports.mesurer(profil_imports.CIBLES['worker'])
+        self.assertFalse({'reportlab', 'requests', 'dateutil'} & modules)
+        self.assertLess(profil_imports.total_ms(imports), BUDGET_DEMARRAGE_MS * FACTEUR_TEMPS)
+
+    def test_prechauffage(self):
+        with self.assertNumQueries(1):
+            durees = prechauffage.prechauffer()
+        self.assertEqual(set(durees), {'urls', 'templates', 'reportlab', 'plans'})
+        self.assertIn('reportlab', sys.modules)
+        # Cartes des forfaits déjà en cache : la page de choix ne les recalcule pas
+        plan = PlanAbonnement.objects.order_by('ordre_affichage').first()
+        for langue, _ in settings.LANGUAGES:
+            cle = make_template_fragment_key('carte_plan', [plan.id, version_catalogue(), langue])
+            self.assertIn('pricing-card-title', cache.get(cle, ''))
+
+    def test_configuration_gunicorn(self):
+        with mock.patch.dict(os.environ, {'GUNICORN_WORKER_CLASS': 'uvicorn', 'GUNICORN_WORKERS': '3'}):
+            configuration = runpy.run_path(str(settings.BASE_DIR / 'gunicorn.conf.py'))
+        self.assertEqual(configuration['worker_class'], 'uvicorn.workers.UvicornWorker')
+        self.assertEqual(configuration['wsgi_app'], 'django_project.asgi:application')
+        self.assertEqual((configuration['workers'], configuration['threads']), (3, 1))
+        self.assertGreater(configuration['max_requests'], 0)
+
+
+def charger_settings(**environnement):
+    """Exécute settings.py avec ces variables d'environnement ('' : variable absente)"""
+    with mock.patch.dict(os.environ, {k: v for k, v in environnement.items() if v}), \
+            mock.patch('dotenv.load_dotenv'), warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for nom, valeur in environnement.items():
+            if not valeur:
+                os.environ.pop(nom, None)
+        return runpy.run_path(str(settings.BASE_DIR / 'django_project' / 'settings.py'))
+
+
+class SessionsTests(TestCase):
+    """Profils de sessions : lues depuis le cache avec Redis, en base sinon ; messages en cookie"""
+
+    def _settings(self, **environnement):
+        return charger_settings(**{'SESSION_PROFIL': '', 'REDIS_URL': '', **environnement})
+
+    def test_profil_selon_le_cache(self):
+        self.assertEqual(self._settings()['SESSION_ENGINE'], 'django.contrib.sessions.backends.db')
+        self.assertEqual(self._settings(REDIS_URL='redis://127.0.0.1:6379/1')['SESSION_ENGINE'],
+                         'django.contrib.sessions.backends.cached_db')
+        # Cache mémoire propre à chaque worker : une déconnexion ne serait pas vue par les autres
+        with self.assertRaises(ImproperlyConfigured):
+            self._settings(SESSION_PROFIL='cached_db')
+
+    @SESSIONS_EN_CACHE
+    def test_session_lue_depuis_le_cache(self):
+        utilisateur = User.objects.create_user('session', 'session@example.com', 'motdepasse')
+        self.client.force_login(utilisateur)
+        with CaptureQueriesContext(connection) as requetes:
+            self.client.get(reverse('tableau_de_bord'))
+        self.assertFalse([r for r in requetes.captured_queries if 'django_session' in r['sql']])
+
+    @SESSIONS_EN_CACHE
+    def test_message_flash_sans_ecriture_de_session(self):
+        utilisateur = User.objects.create_user('flash', 'flash@example.com', 'motdepasse')
+        self.client.force_login(utilisateur)
+        with CaptureQueriesContext(connection) as requetes:
+            reponse = self.client.get(reverse('annuler_abonnement', args=[utilisateur.abonnement.id]))
+        self.assertIn('messages', reponse.cookies)
+        self.assertFalse([r for r in requetes.captured_queries if 'django_session' in r['sql']])
+
+
+class CachePagesTests(TestCase):
+    """Page d'accueil anonyme en cache, fragments des forfaits versionnés par le catalogue"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_accueil_anonyme_en_cache(self):
+        reponse = self.client.get(reverse('index'), HTTP_ACCEPT_LANGUAGE='fr')
+        self.assertIn(f'max-age={settings.CACHE_PAGES_DUREE}', reponse['Cache-Control'])
+        self.assertTrue({'Accept-Language', 'Cookie'} <= {v.strip() for v in reponse['Vary'].split(',')})
+        # Une seule entrée par URL : autres cookies et langues du navigateur sans effet sur la clé
+        self.client.cookies['mesure_audience'] = 'visiteur-42'
+        with mock.patch('cahier_charges.views.render') as rendu:
+            self.assertEqual(self.client.get(reverse('index'), HTTP_ACCEPT_LANGUAGE='es').content, reponse.content)
+        rendu.assert_not_called()
+
+    def test_accueil_connecte_hors_cache(self):
+        self.client.get(reverse('index'))
+        self.client.force_login(User.objects.create_user('membre_connecte', 'membre@example.com', 'motdepasse'))
+        reponse = self.client.get(reverse('index'))
+        self.assertContains(reponse, 'membre_connecte')
+        self.assertIn('private', reponse['Cache-Control'])
+
+    def test_fragment_des_forfaits(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_command('init_plans')
+        self.client.force_login(User.objects.create_user('forfaits', 'forfaits@example.com', 'motdepasse'))
+        reponse = self.client.get(reverse('choix_abonnement'))
+        self.assertContains(reponse, 'csrfmiddlewaretoken')
+        plan = PlanAbonnement.objects.get(nom='essentiel')
+        plan.max_cahiers = 42
+        plan.save()
+        self.assertContains(self.client.get(reverse('choix_abonnement')), "Jusqu'à 42 cahiers/mois")
+
+class CompressionTests(TestCase):
+    """Compression Brotli/gzip des réponses selon Accept-Encoding"""
+
+    def _reponse(self, reponse, accept_encoding='gzip, deflate, br'):
+        requete = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda r: reponse)(requete)
+
+    def test_page_html_en_brotli(self):
+        if compression.brotli is None:
+            self.skipTest('Brotli non installé')
+        self.client.force_login(User.objects.create_user('compression', 'compression@example.com', 'motdepasse'))
+        url = reverse('creer_cahier_type', args=['site_web'])
+        original = self.client.get(url)
+        reponse = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(reponse['Content-Encoding'], 'br')
+        self.assertIn('Accept-Encoding', reponse['Vary'])
+        # Jeton CSRF masqué différemment à chaque réponse : comparaison de la taille
+        self.assertEqual(len(compression.brotli.decompress(reponse.content)), len(original.content))
+        self.assertLess(len(reponse.content), len(original.content) / 3)
+
+    def test_negociation(self):
+        json = JsonResponse({'cahiers': ['Boutique en ligne'] * 100})
+        reponse = self._reponse(json, 'br;q=0, gzip;q=0.5')
+        self.assertEqual(reponse['Content-Encoding'], 'gzip')
+        self.assertEqual(reponse['Content-Length'], str(len(reponse.content)))
+        self.assertIn(b'Boutique en ligne', gzip.decompress(reponse.content))
+        self.assertFalse(self._reponse(JsonResponse({'x': 1})).has_header('Content-Encoding'))
+        self.assertFalse(self._reponse(HttpResponse(b'%PDF' * 500, content_type='application/pdf')).has_header('Content-Encoding'))
+        self.assertFalse(self._reponse(JsonResponse({'a': 'b' * 1000}), 'identity').has_header('Content-Encoding'))
+
+    def test_reponse_en_flux(self):
+        morceaux = [f'<li>Cahier {i}</li>'.encode() for i in range(200)]
+        reponse = self._reponse(StreamingHttpResponse(iter(morceaux), content_type='text/html'), 'gzip')
+        self.assertEqual(reponse['Content-Encoding'], 'gzip')
+        self.assertFalse(reponse.has_header('Content-Length'))
+        self.assertEqual(gzip.decompress(b''.join(reponse.streaming_content)), b''.join(morceaux))
+
+    def test_remplissage_contre_breach(self):
+        contenu = b'<input name="csrfmiddlewaretoken" value="secret"><p>Recherche : secret</p>' * 20
+        encodages = ['gzip'] + (['br'] if compression.brotli is not None else [])
+        decompresser = {'gzip': gzip.decompress, 'br': getattr(compression.brotli, 'decompress', None)}
+        for encodage in encodages:
+            with self.subTest(encodage=encodage):
+                tailles = set()
+                for _ in range(20):
+                    compresse = compression.compresser(contenu, encodage, remplissage_max=100)
+                    self.assertEqual(decompresser[encodage](compresse), contenu)
+                    tailles.add(len(compresse))
+                # Même corps, tailles différentes : la taille ne révèle plus le contenu
+                self.assertGreater(len(tailles), 1)
+                # Remplissage plus en-têtes des méta-blocs Brotli (quelques octets)
+                self.assertLessEqual(max(tailles) - min(tailles), 100 + 8)
+                flux = compression.compresser_flux([contenu[:500], contenu[500:]], encodage, remplissage_max=300)
+                self.assertEqual(decompresser[encodage](b''.join(flux)), contenu)
+
+class CorsTests(TestCase):
+    """CORS : prévols traités par le middleware, en-têtes selon l'origine"""
+
+    def _prevol(self, origine):
+        return self.client.options(reverse('notification_ligdicash'), HTTP_ORIGIN=origine,
+                                   HTTP_ACCESS_CONTROL_REQUEST_METHOD='POST')
+
+    def test_prevol_sans_la_pile(self):
+        with mock.patch('django.contrib.sessions.middleware.SessionMiddleware.process_request') as session:
+            reponse = self._prevol('http://localhost:8000')
+        session.assert_not_called()
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse['Access-Control-Allow-Origin'], 'http://localhost:8000')
+        self.assertIn('POST', reponse['Access-Control-Allow-Methods'])
+        self.assertEqual(reponse['Access-Control-Max-Age'], str(settings.CORS_PREFLIGHT_MAX_AGE))
+        self.assertFalse(self._prevol('https://inconnu.example').has_header('Access-Control-Allow-Origin'))
+
+    def test_entetes_des_reponses(self):
+        reponse = self.client.get(reverse('index'), HTTP_ORIGIN='http://127.0.0.1:8000')
+        self.assertEqual(reponse['Access-Control-Allow-Origin'], 'http://127.0.0.1:8000')
+        self.assertEqual(reponse['Access-Control-Allow-Credentials'], 'true')
+        self.assertIn('Content-Type', reponse['Access-Control-Expose-Headers'])
+        self.assertIn('Origin', reponse['Vary'])
+        self.assertFalse(self.client.get(reverse('index')).has_header('Access-Control-Allow-Origin'))
+
+class JournalisationTests(TestCase):
+    """Profil de journalisation de production : file, thread d'écriture, rotation, échantillonnage"""
+
+    def setUp(self):
+        repertoire = tempfile.TemporaryDirectory()
+        self.addCleanup(repertoire.cleanup)
+        self.chemin = os.path.join(repertoire.name, 'django.log')
+
+    def _handler(self, **options):
+        handler = journalisation.HandlerAsynchrone(self.chemin, console=False, **options)
+        handler.setFormatter(logging.Formatter('{levelname} {message}', style='{'))
+        self.addCleanup(handler.close)
+        return handler
+
+    def _enregistrement(self, message, *args, niveau=logging.INFO):
+        return logging.LogRecord('cahier_charges', niveau, __file__, 1, message, args, None)
+
+    def _lire(self, chemin=None):
+        with open(chemin or self.chemin, encoding='utf-8') as fichier:
+            return fichier.read().splitlines()
+
+    def test_ecriture_par_le_thread(self):
+        handler = self._handler()
+        projets = ['Boutique']
+        handler.handle(self._enregistrement('Projets %s', projets))
+        # Message figé à l'appel, même si l'argument change avant l'écriture
+        projets.append('Vision')
+        handler.close()
+        self.assertEqual(self._lire(), ["INFO Projets ['Boutique']"])
+
+    def test_rotation_par_taille_et_par_periode(self):
+        handler = self._handler(taille_max=200, sauvegardes=2)
+        for i in range(10):
+            handler.handle(self._enregistrement('Cahier %s ' + 'x' * 40, i))
+        handler.close()
+        self.assertTrue(os.path.exists(self.chemin + '.1'))
+        self.assertLessEqual(os.path.getsize(self.chemin), 200)
+
+        handler = self._handler(intervalle=24 * 3600)
+        hier = time.time() - 2 * 24 * 3600
+        os.utime(self.chemin, (hier, hier))
+        handler.handle(self._enregistrement('Nouvelle journée'))
+        handler.close()
+        self.assertEqual(self._lire(), ['INFO Nouvelle journée'])
+
+    def test_worker_apres_fork(self):
+        if not hasattr(os, 'fork'):
+            self.skipTest('fork indisponible')
+        handler = self._handler()
+        pid = os.fork()
+        if pid == 0:
+            handler.handle(self._enregistrement('Worker'))
+            handler.close()
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(self._lire(), ['INFO Worker'])
+
+    def test_echantillonnage(self):
+        filtre = journalisation.FiltreEchantillonnage(0)
+        self.assertFalse(filtre.filter(self._enregistrement('SELECT 1', niveau=logging.DEBUG)))
+        self.assertTrue(filtre.filter(self._enregistrement('Requête lente', niveau=logging.WARNING)))
+
+    def test_echantillonnage_sans_niveau(self):
+        configuration = charger_settings(JOURNAL_NIVEAUX='', JOURNAL_ECHANTILLONNAGE='django.db.backends=0.01')
+        self.assertEqual(configuration['LOGGING']['loggers']['django.db.backends'],
+                         {'filters': ['echantillon_django.db.backends']})
+        self.assertEqual(configuration['LOGGING']['filters']['echantillon_django.db.backends']['taux'], 0.01)
+
+class FichiersStatiquesTests(TestCase):
+    """Fichiers statiques de production : noms hachés, précompressés, cache immuable"""
+
+    def setUp(self):
+        racine = tempfile.TemporaryDirectory()
+        self.addCleanup(racine.cleanup)
+        reglages = override_settings(
+            STATIC_ROOT=racine.name, WHITENOISE_USE_FINDERS=False, WHITENOISE_AUTOREFRESH=False,
+            STORAGES={**settings.STORAGES, 'staticfiles': {
+                'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+            }},
+        )
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        staticfiles_storage._setup()
+        self.addCleanup(staticfiles_storage._setup)
+        call_command('collectstatic', interactive=False, ignore_patterns=['admin'], verbosity=0)
+        self.racine = racine.name
+
+    def test_css_precompresse_et_immuable(self):
+        nom = staticfiles_storage.stored_name('cahier_charges/css/style.css')
+        self.assertNotEqual(nom, 'cahier_charges/css/style.css')
+        reponse = self.client.get(settings.STATIC_URL + nom, HTTP_ACCEPT_ENCODING='br, gzip')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse['Content-Encoding'], 'br')
+        self.assertIn('immutable', reponse['Cache-Control'])
+        self.assertIn('Accept-Encoding', reponse['Vary'])
+        taille_origine = os.path.getsize(os.path.join(self.racine, nom))
+        self.assertLess(int(reponse['Content-Length']), taille_origine / 2)
+
+    def test_variantes_du_logo(self):
+        taille_logo = os.path.getsize(os.path.join(self.racine, 'cahier_charges/images/logo.png'))
+        for densite in (1, 2, 3):
+            variante = os.path.join(self.racine, f'cahier_charges/images/logo-{densite}x.webp')
+            self.assertLess(os.path.getsize(variante), taille_logo)
+
+
+@override_settings(REPLICA_ALIASES=['default'])
+class ReplicaTests(TestCase):
+    """Lectures sur réplica (la base de test joue le rôle du réplica)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.utilisateur = User.objects.create_user('lecteur', 'lecteur@example.com', 'motdepasse')
+        CahierUtilisation.objects.create(utilisateur=cls.utilisateur, mois=timezone.now().date().replace(day=1))
+
+    def setUp(self):
+        replicas._etat.clear()
+        self.client.force_login(self.utilisateur)
+
+    def _replicas_utilises(self, *args, **kwargs):
+        with mock.patch('cahier_charges.replicas.utiliser', wraps=replicas.utiliser) as utiliser:
+            reponse = self.client.get(*args, **kwargs)
+        self.assertEqual(reponse.status_code, 200)
+        return reponse, [appel.args[0] for appel in utiliser.call_args_list if appel.args[0]]
+
+    def test_vue_en_lecture_sur_replica(self):
+        reponse, utilises = self._replicas_utilises(reverse('mes_cahiers'))
+        self.assertEqual(utilises, ['default'])
+        self.assertNotIn('lecture_primaire', reponse.cookies)
+        self.assertIsNone(replicas.replica_courante())
+
+    def test_autres_vues_sur_la_base_principale(self):
+        _, utilises = self._replicas_utilises(reverse('creer_cahier'))
+        self.assertEqual(utilises, [])
+
+    def test_lecture_de_ses_ecritures(self):
+        reponse = self.client.post(reverse('creer_brouillon', args=['ia']), {'champs': {'nom_projet': 'Vision'}},
+                                   content_type='application/json')
+        self.assertEqual(reponse.status_code, 201)
+        self.assertIn('lecture_primaire', reponse.cookies)
+        _, utilises = self._replicas_utilises(reverse('mes_cahiers'))
+        self.assertEqual(utilises, [])
+
+    def test_replica_en_retard_ecarte(self):
+        with mock.patch('cahier_charges.replicas.retard', return_value=30.0):
+            _, utilises = self._replicas_utilises(reverse('tableau_de_bord'))
+        self.assertEqual(utilises, [])
+
+    @override_settings(REPLICA_ALIASES=['replica_1'])
+    def test_routeur(self):
+        routeur = replicas.RouteurReplicas()
+        cahier = CahierCharges(utilisateur=self.utilisateur)
+        cahier._state.db = 'replica_1'
+        replicas.utiliser('replica_1')
+        try:
+            self.assertEqual(routeur.db_for_read(CahierCharges), 'replica_1')
+            self.assertIsNone(routeur.db_for_read(Session))
+        finally:
+            replicas.utiliser(None)
+        self.assertEqual(routeur.db_for_write(CahierCharges, instance=cahier), 'default')
+        self.assertFalse(routeur.allow_migrate('replica_1', 'cahier_charges'))
@@ -4,17 +4,24 @@ from django.contrib.auth.decorators import login_required
 from . import views
 from . import views_abonnement
 from . import views_paiement
+from . import metrics
 
 urlpatterns = [
     # URLs principales
     path('', views.index, name='index'),
     path('mes-cahiers/', views.mes_cahiers, name='mes_cahiers'),
+    path('mes-cahiers/page/', views.mes_cahiers_page, name='mes_cahiers_page'),
+    path('mes-cahiers/recherche/', views.recherche_cahiers, name='recherche_cahiers'),
     
     # Gestion des cahiers
     path('cahier/nouveau/', login_required(views.creer_cahier), name='creer_cahier'),
     path('cahier/nouveau/<str:type_projet>/', login_required(views.creer_cahier), name='creer_cahier_type'),
     path('cahier/verifier-limite/', login_required(views.verifier_limite_cahiers), name='verifier_limite_cahiers'),
+    path('cahier/brouillon/<str:type_projet>/', views.creer_brouillon, name='creer_brouillon'),
+    path('cahier/<int:cahier_id>/brouillon/', views.sauvegarder_brouillon, name='sauvegarder_brouillon'),
     path('cahier/supprimer/<int:cahier_id>/', login_required(views.supprimer_cahier), name='supprimer_cahier'),
+    path('cahier/<int:cahier_id>/historique/', views.historique_cahier, name='historique_cahier'),
+    path('cahier/<int:cahier_id>/historique/<int:numero>/', views.version_cahier, name='version_cahier'),
     
     # Anciennes URLs maintenues pour compatibilité
     path('formulaire/<str:type_projet>/', views.creer_cahier, name='formulaire'),
@@ -38,4 +45,7 @@ urlpatterns = [
     path('paiement/ligdicash/notify/', views_paiement.notification_ligdicash, name='notification_ligdicash'),
     path('paiement/ligdicash/retour/', views_paiement.retour_ligdicash, name='retour_ligdicash'),
     path('paiement/ligdicash/annulation/', views_paiement.annulation_ligdicash, name='annulation_ligdicash'),
+    
+    # Supervision
+    path('metrics/', metrics.metrics, name='metrics'),
 ]
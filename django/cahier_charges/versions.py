@@ -0,0 +1,222 @@
+"""
+Historique des versions des cahiers de charges (fonctionnalité historique_versions)
+
+Chaque enregistrement stocke le delta par rapport à la version précédente ;
+un instantané complet est stocké toutes les INTERVALLE_INSTANTANES versions,
+ou plus tôt si le delta n'est pas nettement plus petit que le document.
+Reconstruire une version lit donc au plus INTERVALLE_INSTANTANES lignes.
+
+Format d'un delta (JSON), par champ modifié du document :
+- {"valeur": v}              nouvelle valeur complète (champs courts, nombres)
+- {"supprime": true}         champ retiré du document
+- {"segments": [[i, j, [...]], ...]}
+                             texte long : les segments i à j (mots et espaces)
+                             de l'ancien texte sont remplacés par la liste donnée
+"""
+
+import json
+import re
+from difflib import SequenceMatcher
+
+from django.db import IntegrityError, transaction
+
+from .models import Abonnement, VersionCahier
+
+INTERVALLE_INSTANTANES = 20
+
+# En dessous de cette longueur, un texte modifié est stocké en entier
+LONGUEUR_MIN_DIFF = 200
+
+CHAMPS_PRINCIPAUX = ['type_projet', 'nom_projet', 'description', 'budget', 'delai']
+
+
+def document(cahier):
+    """Contenu versionné d'un cahier : champs principaux et document details"""
+    contenu = {champ: getattr(cahier, champ) for champ in CHAMPS_PRINCIPAUX}
+    if contenu['budget'] is not None:
+        contenu['budget'] = str(contenu['budget'])
+    contenu.update(cahier.details)
+    return contenu
+
+
+def historique_disponible(utilisateur):
+    """Le forfait actif de l'utilisateur inclut-il l'historique des versions ?"""
+    abonnement = Abonnement.objects.filter(
+        utilisateur=utilisateur, statut='actif'
+    ).select_related('plan').first()
+    return bool(abonnement and abonnement.plan and abonnement.plan.historique_versions)
+
+
+# Deltas
+
+def _segments(texte):
+    # Mots suivis de leurs espaces : ''.join(segments) == texte
+    return re.findall(r'\S+\s*|\s+', texte)
+
+
+def calculer_delta(ancien, nouveau):
+    delta = {}
+    for champ in sorted(ancien.keys() | nouveau.keys()):
+        valeur_ancienne = ancien.get(champ)
+        valeur = nouveau.get(champ)
+        if champ in ancien and champ in nouveau and valeur_ancienne == valeur:
+            continue
+        if champ not in nouveau:
+            delta[champ] = {'supprime': True}
+        elif isinstance(valeur_ancienne, str) and isinstance(valeur, str) and len(valeur) >= LONGUEUR_MIN_DIFF:
+            segments_anciens = _segments(valeur_ancienne)
+            segments = _segments(valeur)
+            operations = [
+                [i1, i2, segments[j1:j2]]
+                for etiquette, i1, i2, j1, j2
+                in SequenceMatcher(None, segments_anciens, segments, autojunk=False).get_opcodes()
+                if etiquette != 'equal'
+            ]
+            delta[champ] = {'segments': operations}
+        else:
+            delta[champ] = {'valeur': valeur}
+    return delta
+
+
+def appliquer_delta(contenu, delta):
+    contenu = dict(contenu)
+    for champ, modification in delta.items():
+        if 'supprime' in modification:
+            contenu.pop(champ, None)
+        elif 'segments' in modification:
+            segments = _segments(contenu.get(champ) or '')
+            # Les positions se réfèrent à l'ancien texte : appliquer de la fin vers le début
+            for debut, fin, remplacement in reversed(modification['segments']):
+                segments[debut:fin] = remplacement
+            contenu[champ] = ''.join(segments)
+        else:
+            contenu[champ] = modification['valeur']
+    return contenu
+
+
+def _taille(contenu):
+    return len(json.dumps(contenu, ensure_ascii=False).encode())
+
+
+# Lecture
+
+def _reconstruire(versions):
+    """versions : de la plus récente à la plus ancienne, jusqu'à un instantané inclus"""
+    contenu = None
+    for version in reversed(versions):
+        contenu = version.contenu if version.instantane else appliquer_delta(contenu, version.contenu)
+    return contenu
+
+
+def _chaine(cahier_id, numero=None):
+    """Versions nécessaires pour reconstruire `numero` (la dernière si None)"""
+    versions = VersionCahier.objects.filter(cahier_id=cahier_id)
+    if numero is not None:
+        versions = versions.filter(numero__lte=numero)
+    chaine = []
+    # Un instantané existe au plus tous les INTERVALLE_INSTANTANES : une seule requête suffit
+    for version in versions.order_by('-numero').only('numero', 'instantane', 'contenu')[:INTERVALLE_INSTANTANES]:
+        chaine.append(version)
+        if version.instantane:
+            break
+    return chaine
+
+
+def reconstruire(cahier_id, numero):
+    """Document complet de la version demandée, ou None si elle n'existe pas"""
+    chaine = _chaine(cahier_id, numero)
+    if not chaine or chaine[0].numero != numero:
+        return None
+    return _reconstruire(chaine)
+
+
+def lister(cahier_id):
+    """Versions d'un cahier, de la plus récente à la plus ancienne, sans leur contenu"""
+    return VersionCahier.objects.filter(cahier_id=cahier_id).only(
+        'numero', 'date_creation', 'instantane', 'champs_modifies', 'taille', 'auteur__username'
+    ).select_related('auteur').order_by('-numero')
+
+
+# Écriture
+
+def enregistrer_version(cahier, auteur=None):
+    """
+    Ajoute une version si le contenu du cahier a changé depuis la dernière
+
+    Returns:
+        VersionCahier ou None si rien n'a changé
+    """
+    nouveau = document(cahier)
+    for _ in range(3):
+        chaine = _chaine(cahier.id)
+        if chaine:
+            precedent = _reconstruire(chaine)
+            numero = chaine[0].numero + 1
+            # chaine se termine par le dernier instantané
+            depuis_instantane = numero - chaine[-1].numero
+        else:
+            precedent, numero, depuis_instantane = None, 1, 0
+
+        if precedent is None:
+            contenu, instantane, champs = nouveau, True, sorted(nouveau)
+        else:
+            delta = calculer_delta(precedent, nouveau)
+            if not delta:
+                return None
+            champs = sorted(delta)
+            instantane = (
+                depuis_instantane >= INTERVALLE_INSTANTANES
+                or _taille(delta) * 2 >= _taille(nouveau)
+            )
+            contenu = nouveau if instantane else delta
+
+        try:
+            with transaction.atomic():
+                return VersionCahier.objects.create(
+                    cahier=cahier,
+                    numero=numero,
+                    auteur=auteur,
+                    instantane=instantane,
+                    contenu=contenu,
+                    champs_modifies=', '.join(champs)[:500],
+                    taille=_taille(contenu),
+                )
+        except IntegrityError:
+            # Enregistrement concurrent du même numéro : recalculer sur la nouvelle dernière version
+            continue
+    raise RuntimeError(f"Impossible d'enregistrer une version du cahier {cahier.id}")
+
+
+def purger(cahier_id, garder, avant=None):
+    """
+    Politique de rétention : conserve les `garder` dernières versions, plus
+    celles créées depuis `avant` (datetime) si précisé
+
+    La plus ancienne version conservée devient un instantané pour que les
+    suivantes restent reconstructibles.
+
+    Returns:
+        int: nombre de versions supprimées
+    """
+    numeros = list(
+        VersionCahier.objects.filter(cahier_id=cahier_id).order_by('-numero').values_list('numero', 'date_creation')
+    )
+    conserves = numeros[:garder]
+    if avant is not None:
+        conserves += [(numero, date) for numero, date in numeros[garder:] if date >= avant]
+    if len(conserves) == len(numeros):
+        return 0
+    if not conserves:
+        supprimees, _ = VersionCahier.objects.filter(cahier_id=cahier_id).delete()
+        return supprimees
+
+    plus_ancienne = conserves[-1][0]
+    with transaction.atomic():
+        version = VersionCahier.objects.select_for_update().get(cahier_id=cahier_id, numero=plus_ancienne)
+        if not version.instantane:
+            version.contenu = reconstruire(cahier_id, plus_ancienne)
+            version.instantane = True
+            version.taille = _taille(version.contenu)
+            version.save(update_fields=['contenu', 'instantane', 'taille'])
+        supprimees, _ = VersionCahier.objects.filter(cahier_id=cahier_id, numero__lt=plus_ancienne).delete()
+    return supprimees
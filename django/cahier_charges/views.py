@@ -1,5 +1,6 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.http import HttpResponse, JsonResponse, Http404
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate, login as auth_login, logout as auth_logout
@@ -8,13 +9,25 @@ from django.utils.translation import gettext_lazy as _
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
-from .models import CahierCharges, TypeProjet, PlanAbonnement, Abonnement, CahierUtilisation
-from .forms import CahierChargesForm, UtilisateurForm
-from .pdf_generator import generate_pdf
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.template.loader import render_to_string
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Substr
+from .models import CahierCharges, TypeProjet, PlanAbonnement, Abonnement, CahierUtilisation, CHAMPS_DETAILS
+from .forms import UtilisateurForm, formulaire_cahier
+from . import recherche
+from . import versions
+from .instrumentation import span
+from . import metrics
+from .cache_pages import cache_anonyme
 from datetime import datetime, date
 import json
+import time
 
 
+@cache_anonyme
 def index(request):
     """Page d'accueil avec choix du type de projet"""
     return render(request, 'cahier_charges/index.html', {
@@ -28,13 +41,13 @@ def formulaire(request, type_projet):
         return redirect('index')
     
     if request.method == 'POST':
-        form = CahierChargesForm(request.POST, type_projet=type_projet)
+        form = formulaire_cahier(type_projet)(request.POST)
         if form.is_valid():
             cahier = form.save()
             messages.success(request, "Cahier de charges créé avec succès!")
             return redirect('preview', cahier_id=cahier.id)
     else:
-        form = CahierChargesForm(type_projet=type_projet)
+        form = formulaire_cahier(type_projet)()
     
     return render(request, 'cahier_charges/formulaire.html', {
         'form': form,
@@ -120,15 +133,22 @@ def generer_pdf(request, cahier_id):
             message_erreur = "La version gratuite est limitée à 1 PDF par mois. Passez à un forfait payant pour plus de fonctionnalités."
     
     if not peut_generer_pdf:
+        metrics.QUOTA_REJETS.labels('pdf').inc()
         messages.error(request, message_erreur)
         return redirect('choix_abonnement')
     
-    # Génération du PDF
-    pdf_buffer = generate_pdf(cahier)
-    
-    # Mettre à jour le compteur de PDF générés
-    utilisation.nb_pdf_generes += 1
-    utilisation.save()
+    # Génération du PDF (ReportLab n'est importé qu'ici, pas au démarrage des workers)
+    from .pdf_generator import generate_pdf
+    debut = time.perf_counter()
+    with span('pdf_build'):
+        pdf_buffer = generate_pdf(cahier)
+    metrics.PDF_DUREE.observe(time.perf_counter() - debut)
+    metrics.PDF_TAILLE.observe(pdf_buffer.getbuffer().nbytes)
+    
+    # Mettre à jour le compteur de PDF générés (incrément en base)
+    CahierUtilisation.objects.filter(pk=utilisation.pk).update(
+        nb_pdf_generes=F('nb_pdf_generes') + 1
+    )
     
     # Retour de la réponse HTTP avec le PDF
     response = HttpResponse(pdf_buffer.getvalue(), content_type='application/pdf')
@@ -136,13 +156,67 @@ def generer_pdf(request, cahier_id):
     
     return response
 
+# Nombre de cahiers par page dans "Mes cahiers"
+TAILLE_PAGE_CAHIERS = 24
+# Longueur de l'extrait de description chargé pour la liste (truncatewords:20 en affiche moins)
+LONGUEUR_EXTRAIT = 300
+
+
+def _encoder_curseur(cahier):
+    """Curseur opaque désignant la position (date_creation, id) d'un cahier"""
+    valeur = f"{cahier.date_creation.isoformat()}|{cahier.id}"
+    return urlsafe_base64_encode(valeur.encode('utf-8'))
+
+
+def _decoder_curseur(curseur):
+    """Retourne (date_creation, id) ou None si le curseur est absent ou invalide"""
+    if not curseur:
+        return None
+    try:
+        date_iso, _, cahier_id = urlsafe_base64_decode(curseur).decode('utf-8').partition('|')
+        return datetime.fromisoformat(date_iso), int(cahier_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _page_cahiers(utilisateur, curseur=None, taille=TAILLE_PAGE_CAHIERS):
+    """
+    Page de cahiers triée du plus récent au plus ancien, paginée par curseur
+    (keyset) sur (date_creation, id) : le coût ne dépend pas du nombre de cahiers
+    de l'utilisateur ni de la profondeur de la page.
+    
+    Returns:
+        tuple: (liste des cahiers, curseur de la page suivante ou None)
+    """
+    cahiers = CahierCharges.objects.filter(utilisateur=utilisateur, brouillon=False).only(
+        'id', 'type_projet', 'nom_projet', 'date_creation', 'budget'
+    ).annotate(
+        extrait=Substr('description', 1, LONGUEUR_EXTRAIT)
+    ).order_by('-date_creation', '-id')
+    
+    position = _decoder_curseur(curseur)
+    if position:
+        date_creation, cahier_id = position
+        cahiers = cahiers.filter(
+            Q(date_creation__lt=date_creation) |
+            Q(date_creation=date_creation, id__lt=cahier_id)
+        )
+    
+    # Une ligne de plus pour savoir s'il existe une page suivante
+    cahiers = list(cahiers[:taille + 1])
+    if len(cahiers) > taille:
+        cahiers = cahiers[:taille]
+        return cahiers, _encoder_curseur(cahiers[-1])
+    return cahiers, None
+
+
 @login_required
 def mes_cahiers(request):
     """Liste des cahiers de charges de l'utilisateur connecté"""
-    cahiers = CahierCharges.objects.filter(utilisateur=request.user).order_by('-date_creation')
+    cahiers, curseur_suivant = _page_cahiers(request.user, request.GET.get('apres'))
     
     # Récupérer l'abonnement actif de l'utilisateur
-    abonnement = Abonnement.objects.filter(utilisateur=request.user, statut='actif').first()
+    abonnement = Abonnement.objects.filter(utilisateur=request.user, statut='actif').select_related('plan').first()
     
     # Vérifier les limites d'utilisation
     mois_courant = date.today().replace(day=1)
@@ -163,15 +237,103 @@ def mes_cahiers(request):
     
     return render(request, 'cahier_charges/mes_cahiers.html', {
         'cahiers': cahiers,
+        'curseur_suivant': curseur_suivant,
+        'premiere_page': not request.GET.get('apres'),
         'abonnement': abonnement,
         'peut_creer_cahier': peut_creer_cahier,
         'utilisation': utilisation
     })
 
 
+@login_required
+def mes_cahiers_page(request):
+    """Page suivante de "Mes cahiers" en JSON pour le défilement infini"""
+    cahiers, curseur_suivant = _page_cahiers(request.user, request.GET.get('apres'))
+    html = render_to_string('cahier_charges/_cartes_cahiers.html', {'cahiers': cahiers}, request=request)
+    return JsonResponse({
+        'html': html,
+        'nombre': len(cahiers),
+        'curseur_suivant': curseur_suivant,
+    })
+
+
+@login_required
+def recherche_cahiers(request):
+    """Recherche plein texte dans les cahiers de l'utilisateur connecté"""
+    texte = request.GET.get('q', '').strip()
+    cahiers = recherche.rechercher(CahierCharges.objects.filter(utilisateur=request.user, brouillon=False), texte)
+    
+    if request.headers.get('Accept', '').startswith('application/json'):
+        return JsonResponse({
+            'resultats': [{
+                'id': cahier.id,
+                'nom_projet': cahier.nom_projet,
+                'type_projet': cahier.type_projet,
+                'rang': cahier.rang,
+                'surlignage': cahier.surlignage or '',
+                'url': reverse('preview', args=[cahier.id]),
+            } for cahier in cahiers],
+        })
+    
+    return render(request, 'cahier_charges/recherche.html', {
+        'cahiers': cahiers,
+        'texte': texte,
+    })
+
+
+def _cahier_avec_historique(request, cahier_id):
+    """Cahier de l'utilisateur si son forfait inclut l'historique des versions, sinon None"""
+    cahier = get_object_or_404(
+        CahierCharges.objects.only('id', 'nom_projet', 'type_projet', 'utilisateur_id'),
+        id=cahier_id, utilisateur=request.user,
+    )
+    if not versions.historique_disponible(request.user):
+        messages.info(request, "L'historique des versions est inclus dans les forfaits Pro.")
+        return None
+    return cahier
+
+
+@login_required
+def historique_cahier(request, cahier_id):
+    """Liste des versions d'un cahier (forfaits avec historique_versions)"""
+    cahier = _cahier_avec_historique(request, cahier_id)
+    if cahier is None:
+        return redirect('choix_abonnement')
+    
+    return render(request, 'cahier_charges/historique.html', {
+        'cahier': cahier,
+        'versions': versions.lister(cahier.id),
+    })
+
+
+@login_required
+def version_cahier(request, cahier_id, numero):
+    """Contenu d'une version d'un cahier, reconstruit à la demande"""
+    cahier = _cahier_avec_historique(request, cahier_id)
+    if cahier is None:
+        return redirect('choix_abonnement')
+    
+    contenu = versions.reconstruire(cahier.id, numero)
+    if contenu is None:
+        raise Http404("Version introuvable")
+    
+    if request.headers.get('Accept', '').startswith('application/json'):
+        return JsonResponse({'numero': numero, 'contenu': contenu})
+    
+    return render(request, 'cahier_charges/version.html', {
+        'cahier': cahier,
+        'numero': numero,
+        'champs': [
+            (nom.replace('_', ' ').capitalize(), valeur)
+            for nom, valeur in contenu.items() if valeur not in (None, '')
+        ],
+    })
+
+
 def authentification(request, cahier_id=None):
     """Page d'authentification/inscription"""
-    if cahier_id:
+    # Ne modifier la session (et donc l'écrire) que si le cahier en attente change
+    if cahier_id and request.session.get('cahier_id') != cahier_id:
         request.session['cahier_id'] = cahier_id
     
     if request.method == 'POST':
@@ -279,6 +441,33 @@ def verifier_limite_cahiers(request):
         'limite_atteinte': not peut_creer
     })
 
+def _quota_cahiers(utilisateur):
+    """
+    Limite mensuelle de cahiers du forfait (3 sans abonnement)
+    
+    Returns:
+        tuple: (abonnement actif ou None, utilisation du mois, message de refus
+        si la limite est atteinte, sinon None)
+    """
+    abonnement = Abonnement.objects.select_related('plan').filter(utilisateur=utilisateur, statut='actif').first()
+    mois_courant = timezone.now().date().replace(day=1)
+    utilisation, _ = CahierUtilisation.objects.get_or_create(
+        utilisateur=utilisateur,
+        mois=mois_courant,
+        defaults={'nb_cahiers_crees': 0, 'nb_pdf_generes': 0}
+    )
+    
+    refus = None
+    if abonnement and abonnement.plan:
+        if abonnement.plan.max_cahiers > 0 and utilisation.nb_cahiers_crees >= abonnement.plan.max_cahiers:
+            refus = f"Vous avez atteint la limite de {abonnement.plan.max_cahiers} cahiers pour votre forfait actuel."
+    elif utilisation.nb_cahiers_crees >= 3:  # Limite gratuite
+        refus = "Vous avez atteint la limite de 3 cahiers pour le forfait gratuit. Passez à un forfait payant pour créer plus de cahiers."
+    if refus:
+        metrics.QUOTA_REJETS.labels('cahier').inc()
+    return abonnement, utilisation, refus
+
+
 @login_required
 def creer_cahier(request, type_projet=None):
     """Vue pour créer un nouveau cahier de charges"""
@@ -294,46 +483,176 @@ def creer_cahier(request, type_projet=None):
         })
     
     # Vérifier les limites d'abonnement
-    abonnement = Abonnement.objects.filter(utilisateur=request.user, statut='actif').first()
-    mois_courant = timezone.now().date().replace(day=1)
-    utilisation, _ = CahierUtilisation.objects.get_or_create(
-        utilisateur=request.user,
-        mois=mois_courant,
-        defaults={'nb_cahiers_crees': 0, 'nb_pdf_generes': 0}
-    )
-    
-    # Vérifier si l'utilisateur peut créer un nouveau cahier
-    if abonnement and abonnement.plan:
-        if abonnement.plan.max_cahiers > 0 and utilisation.nb_cahiers_crees >= abonnement.plan.max_cahiers:
-            messages.error(request, f"Vous avez atteint la limite de {abonnement.plan.max_cahiers} cahiers pour votre forfait actuel.")
-            return redirect('choix_abonnement')
-    elif utilisation.nb_cahiers_crees >= 3:  # Limite gratuite
-        messages.error(request, "Vous avez atteint la limite de 3 cahiers pour le forfait gratuit. Passez à un forfait payant pour créer plus de cahiers.")
+    abonnement, utilisation, refus = _quota_cahiers(request.user)
+    if refus:
+        messages.error(request, refus)
         return redirect('choix_abonnement')
     
+    # Brouillon enregistré par la sauvegarde automatique (un seul par type) : repris à l'affichage, validé à l'envoi
+    brouillons = CahierCharges.objects.filter(utilisateur=request.user, type_projet=type_projet, brouillon=True)
+    if request.method == 'POST':
+        brouillon_id = request.POST.get('brouillon_id', '')
+        brouillon = brouillons.filter(id=brouillon_id).first() if brouillon_id.isdigit() else None
+    else:
+        brouillon = brouillons.first()
+    
     # Traitement du formulaire
     if request.method == 'POST':
-        form = CahierChargesForm(request.POST, type_projet=type_projet)
+        form = formulaire_cahier(type_projet)(request.POST, instance=brouillon)
         if form.is_valid():
             cahier = form.save(commit=False)
             cahier.utilisateur = request.user
-            cahier.save()
+            if cahier.brouillon:
+                cahier.brouillon = False
+                cahier.revision += 1
+                cahier.date_creation = timezone.now()
             
-            # Mettre à jour le compteur de cahiers créés
-            utilisation.nb_cahiers_crees += 1
-            utilisation.save()
+            # Une seule transaction d'écriture (BEGIN IMMEDIATE sur SQLite)
+            with transaction.atomic():
+                cahier.save()
+                if abonnement and abonnement.plan and abonnement.plan.historique_versions:
+                    versions.enregistrer_version(cahier, auteur=request.user)
+                
+                # Mettre à jour le compteur de cahiers créés (incrément en base, sans écraser
+                # les créations concurrentes)
+                CahierUtilisation.objects.filter(pk=utilisation.pk).update(
+                    nb_cahiers_crees=F('nb_cahiers_crees') + 1
+                )
             
             messages.success(request, "Cahier de charges créé avec succès!")
             return redirect('preview', cahier_id=cahier.id)
     else:
-        form = CahierChargesForm(type_projet=type_projet)
+        form = formulaire_cahier(type_projet)(instance=brouillon)
     
     return render(request, 'cahier_charges/formulaire.html', {
         'form': form,
         'type_projet': type_projet,
-        'type_projet_display': dict(TypeProjet.choices)[type_projet]
+        'type_projet_display': dict(TypeProjet.choices)[type_projet],
+        'brouillon': brouillon,
     })
 
+
+def _valeurs_brouillon(type_projet, champs):
+    """
+    Valide les champs envoyés par la sauvegarde automatique avec les champs du
+    formulaire ; un brouillon peut être incomplet (aucun champ obligatoire)
+
+    Returns:
+        tuple: (valeurs nettoyées, erreurs par champ)
+    """
+    form = formulaire_cahier(type_projet)()
+    valeurs, erreurs = {}, {}
+    if not isinstance(champs, dict):
+        return valeurs, {'champs': ['Objet attendu']}
+    for nom, valeur in champs.items():
+        champ = form.fields.get(nom)
+        if champ is None:
+            erreurs[nom] = ['Champ inconnu']
+            continue
+        champ.required = False
+        try:
+            valeurs[nom] = champ.clean(valeur)
+        except ValidationError as e:
+            erreurs[nom] = e.messages
+    return valeurs, erreurs
+
+
+def _lire_json(request):
+    try:
+        donnees = json.loads(request.body)
+    except ValueError:
+        return None
+    return donnees if isinstance(donnees, dict) else None
+
+
+def _conflit_brouillon(cahier_id):
+    revision = CahierCharges.objects.filter(id=cahier_id).values_list('revision', flat=True).first()
+    return JsonResponse({
+        'erreur': "Ce brouillon a été modifié dans une autre fenêtre. Rechargez la page pour reprendre la dernière version.",
+        'revision': revision,
+    }, status=409)
+
+
+@login_required
+@require_http_methods(['POST'])
+def creer_brouillon(request, type_projet):
+    """Première sauvegarde automatique du formulaire : crée le brouillon"""
+    if type_projet not in dict(TypeProjet.choices):
+        return JsonResponse({'erreur': 'Type de projet invalide'}, status=400)
+    donnees = _lire_json(request)
+    if donnees is None:
+        return JsonResponse({'erreur': 'JSON invalide'}, status=400)
+    
+    # Même limite que creer_cahier : le formulaire n'est pas proposé une fois le quota atteint
+    _, _, refus = _quota_cahiers(request.user)
+    if refus:
+        return JsonResponse({'erreur': refus}, status=403)
+    
+    valeurs, erreurs = _valeurs_brouillon(type_projet, donnees.get('champs', {}))
+    if erreurs:
+        return JsonResponse({'erreurs': erreurs}, status=400)
+    
+    cahier = CahierCharges(utilisateur=request.user, type_projet=type_projet, brouillon=True, revision=1)
+    for nom, valeur in valeurs.items():
+        setattr(cahier, nom, valeur)
+    try:
+        with transaction.atomic():
+            cahier.save()
+    except IntegrityError:
+        # Un seul brouillon par type de projet (cahier_brouillon_unique_par_type) :
+        # une autre fenêtre l'a créé en même temps
+        existant = CahierCharges.objects.filter(
+            utilisateur=request.user, type_projet=type_projet, brouillon=True
+        ).values_list('id', flat=True).first()
+        return _conflit_brouillon(existant)
+    return JsonResponse({
+        'id': cahier.id,
+        'revision': cahier.revision,
+        'url': reverse('sauvegarder_brouillon', args=[cahier.id]),
+    }, status=201)
+
+
+@login_required
+@require_http_methods(['PATCH'])
+def sauvegarder_brouillon(request, cahier_id):
+    """
+    Sauvegarde automatique : applique uniquement les champs modifiés
+    
+    Corps JSON : {"revision": <revision connue du navigateur>, "champs": {nom: valeur}}.
+    L'écriture est conditionnée à la révision : si le brouillon a changé
+    entre-temps (autre fenêtre), rien n'est écrit et la réponse est 409.
+    """
+    cahier = get_object_or_404(
+        CahierCharges.objects.only('id', 'type_projet', 'revision', 'details'),
+        id=cahier_id, utilisateur=request.user, brouillon=True,
+    )
+    donnees = _lire_json(request)
+    if donnees is None or not isinstance(donnees.get('revision'), int):
+        return JsonResponse({'erreur': 'Corps JSON {"revision", "champs"} attendu'}, status=400)
+    revision = donnees['revision']
+    
+    valeurs, erreurs = _valeurs_brouillon(cahier.type_projet, donnees.get('champs', {}))
+    if erreurs:
+        return JsonResponse({'erreurs': erreurs}, status=400)
+    if revision != cahier.revision:
+        return _conflit_brouillon(cahier.id)
+    if not valeurs:
+        return JsonResponse({'revision': revision})
+    
+    colonnes = set()
+    for nom, valeur in valeurs.items():
+        setattr(cahier, nom, valeur)
+        colonnes.add('details' if nom in CHAMPS_DETAILS else nom)
+    
+    # Équivalent de save(update_fields=colonnes), avec la révision dans le WHERE
+    modifies = CahierCharges.objects.filter(id=cahier.id, revision=revision).update(
+        revision=F('revision') + 1,
+        **{colonne: getattr(cahier, colonne) for colonne in colonnes}
+    )
+    if not modifies:
+        return _conflit_brouillon(cahier.id)
+    return JsonResponse({'revision': revision + 1})
+
 @login_required
 def supprimer_cahier(request, cahier_id):
     """Vue pour supprimer un cahier de charges"""
@@ -2,7 +2,8 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
-from .models import PlanAbonnement, Abonnement, CahierUtilisation
+from .models import PlanAbonnement, Abonnement, CahierUtilisation, version_catalogue
+from .metrics import ABONNEMENTS_ACTIVES
 from datetime import timedelta
 
 @login_required
@@ -47,6 +48,7 @@ def choix_abonnement(request):
     return render(request, 'cahier_charges/abonnement/choix.html', {
         'plans': plans,
         'abonnement_actuel': abonnement_actuel,
+        'version_catalogue': version_catalogue(),
     })
 
 def creer_abonnement(request, plan_id):
@@ -102,6 +104,8 @@ def creer_abonnement(request, plan_id):
         }
     )
     
+    ABONNEMENTS_ACTIVES.labels(plan.nom, 'direct').inc()
+    
     # Envoyer un email de confirmation (à implémenter)
     # send_abonnement_confirmation_email(request.user, abonnement)
     
@@ -135,8 +139,8 @@ def tableau_de_bord(request):
     # Récupérer les 5 derniers cahiers créés par l'utilisateur
     from cahier_charges.models import CahierCharges
     derniers_cahiers = CahierCharges.objects.filter(
-        utilisateur=request.user
-    ).order_by('-date_creation')[:5]
+        utilisateur=request.user, brouillon=False
+    ).defer('details').order_by('-date_creation')[:5]
     
     # Calculer le pourcentage d'utilisation des cahiers
     if abonnement and abonnement.plan:
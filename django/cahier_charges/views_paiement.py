@@ -8,10 +8,12 @@ from django.contrib import messages
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse
 from django.conf import settings
 from django.urls import reverse
-from functools import wraps
+from django.core.cache import cache
+from datetime import timedelta
+from decimal import Decimal
 import json
 import uuid
 import hmac
@@ -20,7 +22,7 @@ import logging
 
 from .models import PlanAbonnement, Abonnement
 from .models_paiement import TransactionLigdiCash
-from .ligdicash_client import LigdiCashClient
+from .ligdicash_client import LigdiCashClient, DISJONCTEURS, MESSAGE_SERVICE_INDISPONIBLE
 from .ligdicash_config import LIGDICASH_CONFIG
 
 logger = logging.getLogger(__name__)
@@ -60,19 +62,101 @@ def verify_ligdicash_signature(payload, signature):
     return is_valid
 
 
-def handle_options_request(view_func):
-    """Décorateur pour gérer les requêtes OPTIONS (prévol) pour CORS"""
-    @wraps(view_func)
-    def _wrapped_view(request, *args, **kwargs):
-        if request.method == 'OPTIONS':
-            response = HttpResponse()
-            response['Access-Control-Allow-Origin'] = '*'
-            response['Access-Control-Allow-Methods'] = 'GET, POST, PUT, PATCH, DELETE, OPTIONS'
-            response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-CSRFToken, X-Requested-With, X-Api-Key'
-            response['Access-Control-Max-Age'] = '86400'  # 24 heures
-            return response
-        return view_func(request, *args, **kwargs)
-    return _wrapped_view
+def _transaction_reutilisable(utilisateur, plan, montant_xof):
+    """Retourne une transaction en attente récente et réutilisable pour ce paiement, ou None"""
+    fenetre = LIGDICASH_CONFIG['REUTILISATION_FENETRE']
+    if fenetre <= 0:
+        return None
+    
+    transaction = TransactionLigdiCash.objects.filter(
+        utilisateur=utilisateur,
+        statut='pending',
+        plan=plan,
+        montant=Decimal(str(montant_xof)),
+        payment_token__isnull=False,
+        date_creation__gte=timezone.now() - timedelta(seconds=fenetre),
+    ).order_by('-date_creation').first()
+    
+    if transaction and transaction.metadata.get('payment_url'):
+        return transaction
+    return None
+
+
+def _creer_et_initier_paiement(request, plan, montant_usd, montant_xof, periode):
+    """Crée la transaction et initialise le paiement auprès de LigdiCash"""
+    # Créer une transaction
+    try:
+        transaction = TransactionLigdiCash.objects.create(
+            utilisateur=request.user,
+            plan=plan,
+            montant=montant_xof,  # LigdiCash utilise XOF
+            devise='XOF',
+            statut='pending',
+            metadata={
+                'plan_nom': plan.nom,
+                'plan_description': plan.description,
+                'user_email': request.user.email,
+                'user_id': str(request.user.id),
+                'periode': periode,
+                'montant_usd': float(montant_usd) if montant_usd else 0,
+                'montant_xof': float(montant_xof) if montant_xof else 0
+            }
+        )
+        print(f"Transaction créée - ID: {transaction.transaction_id}")
+    except Exception as e:
+        print(f"ERREUR lors de la création de la transaction: {str(e)}")
+        messages.error(request, f"Erreur lors de la création de la transaction: {str(e)}")
+        return redirect('choix_abonnement')
+
+    # Initialiser le client LigdiCash
+    print("Initialisation du client LigdiCash...")
+    client = LigdiCashClient()
+
+    # Préparer les données du client
+    customer_name = f"{request.user.first_name} {request.user.last_name}".strip() or request.user.username
+    customer_email = request.user.email
+    customer_phone = getattr(request.user.profile, 'telephone', '') if hasattr(request.user, 'profile') else ''
+
+    print(f"Client: {customer_name}, {customer_email}, {customer_phone}")
+
+    # Générer le paiement
+    print(f"Initialisation du paiement pour {montant_xof} XOF...")
+    result = client.initier_paiement(
+        montant=montant_xof,
+        transaction_id=str(transaction.transaction_id),
+        description=f"Abonnement {plan.get_nom_display()} - {periode}",
+        customer_name=customer_name,
+        customer_email=customer_email,
+        customer_phone=customer_phone,
+        autorise=True
+    )
+
+    if result.get('success', False):
+        # Mettre à jour la transaction avec le token et l'URL de paiement (réutilisable)
+        payment_url = result.get('payment_url')
+        transaction.payment_token = result.get('payment_token')
+        transaction.metadata['payment_url'] = payment_url
+        transaction.save(update_fields=['payment_token', 'metadata', 'date_mise_a_jour'])
+
+        if payment_url:
+            print(f"[OK] Redirection vers: {payment_url}")
+            print("=== INITIER PAIEMENT LIGDICASH - Succès ===\n")
+            return redirect(payment_url)
+        else:
+            error_msg = "URL de paiement manquante"
+            print(f"[ERREUR] {error_msg}")
+            transaction.marquer_comme_echouee(error_msg)
+            messages.error(request, "Erreur: Impossible d'accéder à la page de paiement")
+            return redirect('choix_abonnement')
+    else:
+        # En cas d'erreur
+        error_msg = result.get('message', 'Erreur inconnue')
+        print(f"[ERREUR] {error_msg}")
+        transaction.marquer_comme_echouee(error_msg)
+        messages.error(request, f"Erreur lors de l'initialisation du paiement: {error_msg}")
+        print("=== INITIER PAIEMENT LIGDICASH - Échec ===\n")
+        return redirect('choix_abonnement')
+
 
 
 @login_required
@@ -111,77 +195,34 @@ def initier_paiement_ligdicash(request, plan_id):
         
         print(f"Montant: {montant_usd} USD = {montant_xof} XOF ({periode})")
         
-        # Créer une transaction
-        try:
-            transaction = TransactionLigdiCash.objects.create(
-                utilisateur=request.user,
-                plan=plan,
-                montant=montant_xof,  # LigdiCash utilise XOF
-                devise='XOF',
-                statut='pending',
-                metadata={
-                    'plan_nom': plan.nom,
-                    'plan_description': plan.description,
-                    'user_email': request.user.email,
-                    'user_id': str(request.user.id),
-                    'periode': periode,
-                    'montant_usd': float(montant_usd) if montant_usd else 0,
-                    'montant_xof': float(montant_xof) if montant_xof else 0
-                }
-            )
-            print(f"Transaction créée - ID: {transaction.transaction_id}")
-        except Exception as e:
-            print(f"ERREUR lors de la création de la transaction: {str(e)}")
-            messages.error(request, f"Erreur lors de la création de la transaction: {str(e)}")
-            return redirect('choix_abonnement')
-        
-        # Initialiser le client LigdiCash
-        print("Initialisation du client LigdiCash...")
-        client = LigdiCashClient()
-        
-        # Préparer les données du client
-        customer_name = f"{request.user.first_name} {request.user.last_name}".strip() or request.user.username
-        customer_email = request.user.email
-        customer_phone = getattr(request.user.profile, 'telephone', '') if hasattr(request.user, 'profile') else ''
+        # Réutiliser un paiement identique initié récemment (double clic, retour arrière)
+        transaction_existante = _transaction_reutilisable(request.user, plan, montant_xof)
+        if transaction_existante:
+            print(f"[OK] Réutilisation de la transaction {transaction_existante.transaction_id}")
+            return redirect(transaction_existante.metadata['payment_url'])
         
-        print(f"Client: {customer_name}, {customer_email}, {customer_phone}")
-        
-        # Générer le paiement
-        print(f"Initialisation du paiement pour {montant_xof} XOF...")
-        result = client.initier_paiement(
-            montant=montant_xof,
-            transaction_id=str(transaction.transaction_id),
-            description=f"Abonnement {plan.get_nom_display()} - {periode}",
-            customer_name=customer_name,
-            customer_email=customer_email,
-            customer_phone=customer_phone
-        )
+        # Une seule initialisation à la fois par utilisateur et par plan
+        cle_verrou = f'ligdicash:initiation:{request.user.id}:{plan.id}'
+        if not cache.add(cle_verrou, 1, 60):
+            # Pas d'attente dans le worker : la transaction de l'autre requête
+            # n'est pas encore prête, le client réessaie dans quelques secondes
+            transaction_existante = _transaction_reutilisable(request.user, plan, montant_xof)
+            if transaction_existante:
+                return redirect(transaction_existante.metadata['payment_url'])
+            messages.info(request, "Un paiement est déjà en cours d'initialisation pour ce plan. Veuillez réessayer dans quelques secondes.")
+            return redirect('choix_abonnement')
         
-        if result.get('success', False):
-            # Mettre à jour la transaction avec le token
-            transaction.payment_token = result.get('payment_token')
-            transaction.save()
-            
-            payment_url = result.get('payment_url')
-            if payment_url:
-                print(f"[OK] Redirection vers: {payment_url}")
-                print("=== INITIER PAIEMENT LIGDICASH - Succès ===\n")
-                return redirect(payment_url)
-            else:
-                error_msg = "URL de paiement manquante"
-                print(f"[ERREUR] {error_msg}")
-                transaction.marquer_comme_echouee(error_msg)
-                messages.error(request, "Erreur: Impossible d'accéder à la page de paiement")
+        try:
+            # Échouer rapidement si LigdiCash est indisponible, sans créer de transaction.
+            # En semi-ouvert, seule la requête qui réserve l'appel d'essai continue.
+            if not DISJONCTEURS['initiate'].autoriser():
+                print("[ERREUR] Disjoncteur LigdiCash ouvert, paiement non initié")
+                messages.warning(request, MESSAGE_SERVICE_INDISPONIBLE)
                 return redirect('choix_abonnement')
-        else:
-            # En cas d'erreur
-            error_msg = result.get('message', 'Erreur inconnue')
-            print(f"[ERREUR] {error_msg}")
-            transaction.marquer_comme_echouee(error_msg)
-            messages.error(request, f"Erreur lors de l'initialisation du paiement: {error_msg}")
-            print("=== INITIER PAIEMENT LIGDICASH - Échec ===\n")
-            return redirect('choix_abonnement')
-            
+            return _creer_et_initier_paiement(request, plan, montant_usd, montant_xof, periode)
+        finally:
+            cache.delete(cle_verrou)
+    
     except Exception as e:
         error_msg = f"Erreur inattendue: {str(e)}"
         print(f"[ERREUR CRITIQUE] {error_msg}")
@@ -193,7 +234,6 @@ def initier_paiement_ligdicash(request, plan_id):
 
 
 @csrf_exempt
-@handle_options_request
 @require_http_methods(["POST", "GET"])
 def notification_ligdicash(request):
     """
@@ -268,7 +308,6 @@ def notification_ligdicash(request):
 
 
 @csrf_exempt
-@handle_options_request
 def retour_ligdicash(request):
     """Page de retour après un paiement LigdiCash"""
     print("\n=== RETOUR LIGDICASH ===")
@@ -305,8 +344,8 @@ def retour_ligdicash(request):
             )
             messages.success(request, "Votre paiement a été effectué avec succès ! Votre abonnement est maintenant actif.")
             return redirect('tableau_de_bord')
-        elif statut['status'] == 'PENDING':
-            print("[ATTENTE] Paiement en attente")
+        elif statut['status'] in ('PENDING', 'CIRCUIT_OPEN'):
+            print(f"[ATTENTE] Paiement en attente ({statut['status']})")
             messages.warning(request, "Votre paiement est en cours de traitement. Vous recevrez une confirmation par email.")
             return redirect('tableau_de_bord')
         else:
@@ -327,7 +366,6 @@ def retour_ligdicash(request):
 
 
 @csrf_exempt
-@handle_options_request
 def annulation_ligdicash(request):
     """Page d'annulation de paiement LigdiCash"""
     print("\n=== ANNULATION LIGDICASH ===")
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 import os
 from pathlib import Path
 from dotenv import load_dotenv
+from django.core.exceptions import ImproperlyConfigured
 
 # Charger les variables d'environnement depuis .env
 load_dotenv()
@@ -53,7 +54,7 @@ if not DEBUG:
     if domain:
         CSRF_TRUSTED_ORIGINS.append(domain)
 
-# Configuration CORS - SÉCURISÉE
+# Configuration CORS - SÉCURISÉE (cahier_charges.middleware.CorsMiddleware, lue au démarrage)
 # CORRECTION: CORS_ALLOW_ALL_ORIGINS = False (problème critique #4)
 CORS_ALLOW_ALL_ORIGINS = False  # JAMAIS True en production!
 CORS_ALLOW_CREDENTIALS = True
@@ -119,6 +120,26 @@ SESSION_COOKIE_SECURE = not DEBUG  # Sécurisé uniquement en production (HTTPS)
 SESSION_COOKIE_SAMESITE = 'Lax' if DEBUG else 'None'  # 'Lax' en dev, 'None' en prod pour CORS
 SESSION_COOKIE_HTTPONLY = True
 
+# Stockage des sessions (SESSION_PROFIL) :
+# - db : table django_session, lue et écrite à chaque requête qui touche la session
+# - cached_db : lectures depuis le cache, écritures en base. Demande un cache
+#   partagé (REDIS_URL) : avec le cache mémoire propre à chaque worker, une
+#   session supprimée (déconnexion, flush, cycle_key) resterait valide dans le
+#   cache des autres workers jusqu'à son expiration
+# - signed_cookies : aucune requête SQL, mais pas de révocation côté serveur
+#   (déconnexion forcée impossible) et taille limitée par le cookie
+SESSION_PROFIL = os.environ.get('SESSION_PROFIL', 'cached_db' if os.environ.get('REDIS_URL') else 'db')
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[SESSION_PROFIL]
+
+# Messages flash dans un cookie signé plutôt que dans la session :
+# messages.success() ne provoque plus d'écriture de session
+if os.environ.get('MESSAGES_COOKIE', 'True') == 'True':
+    MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
 # Configuration des iframes - SÉCURISÉE
 # CORRECTION: X_FRAME_OPTIONS = 'DENY' (problème critique #5)
 X_FRAME_OPTIONS = 'DENY'  # Protection contre Clickjacking
@@ -132,14 +153,16 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'corsheaders',
     'cahier_charges',
 ]
 
 MIDDLEWARE = [
+    'cahier_charges.middleware.PerformanceMiddleware',  # Inactif sauf PERFORMANCE_INSTRUMENTATION=True
+    'cahier_charges.middleware.MetriquesMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
-    'corsheaders.middleware.CorsMiddleware',  # Doit être placé avant tout autre middleware
+    'cahier_charges.middleware.CompressionMiddleware',  # Après WhiteNoise: les statiques sont déjà précompressés
+    'cahier_charges.middleware.CorsMiddleware',  # Répond aux prévols avant les middlewares suivants
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -147,14 +170,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'cahier_charges.middleware.SubscriptionMiddleware',
+    'cahier_charges.middleware.ReplicaMiddleware',  # Inactif sans DB_REPLICAS
 ]
 
-# Configuration de WhiteNoise
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
-WHITENOISE_USE_FINDERS = True
-WHITENOISE_MANIFEST_STRICT = False
-WHITENOISE_ALLOW_ALL_ORIGINS = True
-
 # Clickjacking protection toujours activé
 if 'django.middleware.clickjacking.XFrameOptionsMiddleware' not in MIDDLEWARE:
     MIDDLEWARE.append('django.middleware.clickjacking.XFrameOptionsMiddleware')
@@ -163,7 +181,8 @@ ROOT_URLCONF = 'django_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates avec mesure du temps de rendu (voir cahier_charges.instrumentation)
+        'BACKEND': 'cahier_charges.instrumentation.DjangoTemplatesInstrumente',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -196,14 +215,43 @@ if DB_ENGINE == 'postgresql' or os.environ.get('DB_PASSWORD'):
             'PASSWORD': os.environ.get('DB_PASSWORD', ''),
             'HOST': os.environ.get('DB_HOST', 'localhost'),
             'PORT': os.environ.get('DB_PORT', '5432'),
-            'CONN_MAX_AGE': 600,  # Connection pooling
+            # Connexions persistantes par worker, vérifiées avant réutilisation
+            # (une connexion coupée par le serveur ne fait plus échouer la requête suivante)
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '600')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', '5')),
+            },
         }
     }
+    
+    # Pooler externe (PgBouncer en mode transaction): les curseurs côté serveur
+    # ne survivent pas au changement de connexion serveur entre deux transactions
+    if os.environ.get('DB_PGBOUNCER', 'False') == 'True':
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+    
+    # Pool natif de Django (Django >= 5.1 et psycopg 3: pip install "psycopg[pool]")
+    if os.environ.get('DB_POOL', 'False') == 'True':
+        import django
+        if django.VERSION >= (5, 1):
+            DATABASES['default']['OPTIONS']['pool'] = {
+                'min_size': int(os.environ.get('DB_POOL_MIN', '2')),
+                'max_size': int(os.environ.get('DB_POOL_MAX', '10')),
+                'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+            }
+            # Le pool gère la durée de vie des connexions
+            DATABASES['default']['CONN_MAX_AGE'] = 0
+        else:
+            import warnings
+            warnings.warn("DB_POOL=True nécessite Django >= 5.1 et psycopg 3: connexions persistantes utilisées à la place")
 else:
-    # SQLite pour développement uniquement
+    # SQLite pour le développement et les petits déploiements
+    # SQLITE_PRODUCTION (sur demande): transactions BEGIN IMMEDIATE et PRAGMA
+    # ci-dessous, contre les erreurs "database is locked" lors d'écritures concurrentes
+    SQLITE_PRODUCTION = os.environ.get('SQLITE_PRODUCTION', 'False') == 'True'
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.sqlite3',
+            'ENGINE': 'cahier_charges.backends.sqlite3' if SQLITE_PRODUCTION else 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
         }
     }
@@ -211,6 +259,103 @@ else:
         import warnings
         warnings.warn("WARNING: Using SQLite in production! Configure PostgreSQL with DB_PASSWORD in .env")
 
+# Réplicas en lecture (voir cahier_charges.replicas): DB_REPLICAS=hote1:5432,hote2
+# (avec SQLite: chemins de fichiers, pour tester en local avec deux bases)
+REPLICA_ALIASES = []
+for numero, replica in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), 1):
+    alias = f'replica_{numero}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'OPTIONS': dict(DATABASES['default'].get('OPTIONS', {})),
+        # Pendant les tests, le réplica lit la base de test principale
+        'TEST': {'MIRROR': 'default'},
+    }
+    if 'sqlite3' in DATABASES['default']['ENGINE']:
+        DATABASES[alias]['NAME'] = replica.strip()
+    else:
+        hote, _, port = replica.strip().partition(':')
+        DATABASES[alias].update(HOST=hote, PORT=port or DATABASES['default']['PORT'])
+    REPLICA_ALIASES.append(alias)
+
+DATABASE_ROUTERS = ['cahier_charges.replicas.RouteurReplicas']
+# Vues en lecture seule servies par un réplica (noms de vue, motifs acceptés)
+REPLICA_VUES = [
+    'mes_cahiers',
+    'mes_cahiers_page',
+    'tableau_de_bord',
+    'choix_abonnement',
+    'admin:*_changelist',
+]
+# Retard de réplication (s) au-delà duquel un réplica est écarté
+REPLICA_RETARD_MAX = float(os.environ.get('DB_REPLICA_RETARD_MAX', '5'))
+# Après une écriture, lectures sur la base principale pendant cette durée (s)
+REPLICA_EPINGLAGE = int(os.environ.get('DB_REPLICA_EPINGLAGE', '15'))
+
+# PRAGMA appliqués à chaque connexion du backend SQLite de production
+# (cahier_charges.apps.configurer_sqlite)
+SQLITE_PRAGMAS = {
+    # Lecteurs et écrivain ne se bloquent plus mutuellement
+    'journal_mode': 'WAL',
+    # Attente (ms) du verrou d'écriture avant "database is locked"
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', '5000')),
+    # Sûr en WAL: seule la dernière transaction peut être perdue en cas de coupure de courant
+    'synchronous': 'NORMAL',
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    # Négatif: en Kio (64 Mio par connexion)
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', '-65536')),
+    'temp_store': 'MEMORY',
+}
+
+# Cache
+# Le disjoncteur LigdiCash et les verrous des commandes partagent leur état via le cache:
+# en production avec plusieurs workers, utiliser Redis (pip install redis) via REDIS_URL.
+REDIS_URL = os.environ.get('REDIS_URL', '')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    # Cache mémoire local: non partagé entre les processus
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+    if SESSION_PROFIL == 'cached_db':
+        raise ImproperlyConfigured(
+            "SESSION_PROFIL=cached_db demande un cache partagé entre les workers (REDIS_URL) : "
+            "utiliser SESSION_PROFIL=db sans Redis"
+        )
+
+# Pages mises en cache (cahier_charges.cache_pages): durée (s) de la page d'accueil
+# servie aux visiteurs anonymes, 0 pour désactiver
+CACHE_PAGES_DUREE = int(os.environ.get('CACHE_PAGES_DUREE', '300'))
+
+# Compression Brotli/gzip des réponses HTML et JSON (cahier_charges.middleware.CompressionMiddleware)
+COMPRESSION_REPONSES = os.environ.get('COMPRESSION_REPONSES', 'True') == 'True'
+# Corps plus petits non compressés (octets): le gain ne couvre pas l'en-tête et le coût CPU
+COMPRESSION_TAILLE_MIN = int(os.environ.get('COMPRESSION_TAILLE_MIN', '500'))
+# faible, moyen ou eleve (voir cahier_charges.compression.NIVEAUX et manage.py bench_compression)
+COMPRESSION_BUDGET_CPU = os.environ.get('COMPRESSION_BUDGET_CPU', 'moyen')
+# Remplissage aléatoire maximal (octets) de chaque réponse compressée contre BREACH
+# (voir cahier_charges.compression), 0 pour désactiver
+COMPRESSION_REMPLISSAGE_MAX = int(os.environ.get('COMPRESSION_REMPLISSAGE_MAX', '100'))
+
+# Métriques: jeton d'accès pour les collecteurs (Authorization: Bearer <token>)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Instrumentation des requêtes (Server-Timing + log JSON), sur une fraction des requêtes
+PERFORMANCE_INSTRUMENTATION = os.environ.get('PERFORMANCE_INSTRUMENTATION', 'False') == 'True'
+PERFORMANCE_ECHANTILLONNAGE = float(os.environ.get('PERFORMANCE_ECHANTILLONNAGE', '0.05'))
+
+# Historique des versions des cahiers: rétention appliquée par `manage.py purger_versions`
+VERSIONS_CONSERVEES = int(os.environ.get('VERSIONS_CONSERVEES', '50'))
+VERSIONS_DUREE_JOURS = int(os.environ.get('VERSIONS_DUREE_JOURS', '90'))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -260,9 +405,8 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
-STATICFILES_DIRS = [
-    os.path.join(BASE_DIR, 'cahier_charges', 'static'),
-]
+# Pas de STATICFILES_DIRS : cahier_charges/static est déjà trouvé par AppDirectoriesFinder
+# (le déclarer deux fois fait collecter chaque fichier en double)
 
 # Configuration pour les finders de fichiers statiques
 STATICFILES_FINDERS = [
@@ -270,12 +414,26 @@ STATICFILES_FINDERS = [
     'django.contrib.staticfiles.finders.AppDirectoriesFinder',
 ]
 
-# Configuration pour WhiteNoise
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
-WHITENOISE_USE_FINDERS = True
+# Fichiers statiques servis par WhiteNoise
+# Production (DEBUG=False) : collectstatic produit des noms hachés (style.3f2a9c.css),
+# servis avec Cache-Control immutable pour un an, et leurs versions gzip et Brotli
+# (paquet brotli) précompressées : aucune compression ni recherche de fichier par requête.
+# Développement : fichiers lus directement dans les applications, rechargés à chaque modification.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
+WHITENOISE_USE_FINDERS = DEBUG
+WHITENOISE_AUTOREFRESH = DEBUG
 WHITENOISE_MANIFEST_STRICT = False
 WHITENOISE_ALLOW_ALL_ORIGINS = True
-WHITENOISE_AUTOREFRESH = True
 
 # Media files
 MEDIA_URL = '/media/'
@@ -287,38 +445,80 @@ MEDIA_ROOT = BASE_DIR / 'media'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Configuration de la journalisation
-LOGGING = {
-    'version': 1,
-    'disable_existing_loggers': False,
-    'formatters': {
-        'verbose': {
-            'format': '{levelname} {asctime} {module} {message}',
-            'style': '{',
+# JOURNAL_PROFIL :
+# - developpement : fichier logs/django.log et console, écrits pendant la requête
+# - production : écriture par un thread (cahier_charges.journalisation.HandlerAsynchrone),
+#   rotation à JOURNAL_TAILLE_MAX_MO ou chaque jour, requêtes jamais bloquées
+JOURNAL_PROFIL = os.environ.get('JOURNAL_PROFIL', 'developpement' if DEBUG else 'production')
+JOURNAL_FICHIER = os.path.join(BASE_DIR, 'logs', 'django.log')
+
+# Niveaux par logger, ex: "django=INFO,cahier_charges=DEBUG,django.db.backends=WARNING"
+JOURNAL_NIVEAUX = {
+    'django': 'DEBUG' if JOURNAL_PROFIL == 'developpement' else 'INFO',
+    'cahier_charges': 'DEBUG' if JOURNAL_PROFIL == 'developpement' else 'INFO',
+}
+for _element in filter(None, os.environ.get('JOURNAL_NIVEAUX', '').split(',')):
+    _logger, _, _niveau = _element.partition('=')
+    JOURNAL_NIVEAUX[_logger.strip()] = _niveau.strip().upper()
+
+# Loggers bavards échantillonnés sous WARNING, ex: "django.db.backends=0.01" (1 requête SQL sur 100)
+JOURNAL_ECHANTILLONNAGE = {}
+for _element in filter(None, os.environ.get('JOURNAL_ECHANTILLONNAGE', '').split(',')):
+    _logger, _, _taux = _element.partition('=')
+    JOURNAL_ECHANTILLONNAGE[_logger.strip()] = float(_taux)
+
+if JOURNAL_PROFIL == 'production':
+    _handlers_journal = {
+        'file_attente': {
+            '()': 'cahier_charges.journalisation.HandlerAsynchrone',
+            'formatter': 'verbose',
+            'fichier': JOURNAL_FICHIER,
+            'taille_max': int(os.environ.get('JOURNAL_TAILLE_MAX_MO', '50')) * 1024 * 1024,
+            'intervalle': int(os.environ.get('JOURNAL_ROTATION_HEURES', '24')) * 3600,
+            'sauvegardes': int(os.environ.get('JOURNAL_SAUVEGARDES', '7')),
+            'console': os.environ.get('JOURNAL_CONSOLE', 'True') == 'True',
         },
-    },
-    'handlers': {
+    }
+else:
+    _handlers_journal = {
         'file': {
             'level': 'DEBUG',
             'class': 'logging.FileHandler',
-            'filename': os.path.join(BASE_DIR, 'logs', 'django.log'),
+            'filename': JOURNAL_FICHIER,
             'formatter': 'verbose',
         },
         'console': {
             'class': 'logging.StreamHandler',
             'formatter': 'verbose',
         },
+    }
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'verbose': {
+            'format': '{levelname} {asctime} {module} {message}',
+            'style': '{',
+        },
+    },
+    'filters': {
+        f'echantillon_{_logger}': {
+            '()': 'cahier_charges.journalisation.FiltreEchantillonnage',
+            'taux': _taux,
+        }
+        for _logger, _taux in JOURNAL_ECHANTILLONNAGE.items()
     },
+    'handlers': _handlers_journal,
     'loggers': {
-        'django': {
-            'handlers': ['file', 'console'],
-            'level': 'DEBUG',
-            'propagate': True,
-        },
-        'cahier_charges': {
-            'handlers': ['file', 'console'],
-            'level': 'DEBUG',
-            'propagate': True,
-        },
+        # Les loggers enfants (django.db.backends...) écrivent via les handlers de leur parent
+        # Un logger seulement échantillonné garde le niveau hérité de son parent
+        _logger: {
+            **({'handlers': list(_handlers_journal)} if _logger in ('django', 'cahier_charges') else {}),
+            **({'level': JOURNAL_NIVEAUX[_logger]} if _logger in JOURNAL_NIVEAUX else {}),
+            **({'filters': [f'echantillon_{_logger}']} if _logger in JOURNAL_ECHANTILLONNAGE else {}),
+        }
+        for _logger in JOURNAL_NIVEAUX.keys() | JOURNAL_ECHANTILLONNAGE.keys()
     },
 }
 
@@ -0,0 +1,103 @@
+"""
+Configuration gunicorn
+
+    gunicorn -c gunicorn.conf.py
+
+Profil réglé par variables d'environnement (voir env.example) :
+- GUNICORN_WORKER_CLASS : gthread (défaut), sync ou uvicorn (ASGI, pip install uvicorn)
+- GUNICORN_WORKERS / GUNICORN_THREADS : processus, et threads par processus en gthread.
+  Chaque thread a sa propre connexion à la base (CONN_MAX_AGE) : prévoir
+  workers x threads connexions côté PostgreSQL.
+- GUNICORN_PRELOAD : application chargée une fois dans le maître puis partagée
+  par fork (démarrage plus rapide, mémoire partagée). Un `kill -HUP` ne
+  recharge alors plus le code : redémarrer le maître pour déployer.
+- GUNICORN_MAX_REQUESTS (+ _JITTER) : recyclage des workers, borne la croissance mémoire
+- GUNICORN_PRECHAUFFAGE : ReportLab, templates et catalogue des forfaits chargés
+  avant la première requête (cahier_charges.prechauffage)
+"""
+
+import glob
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+
+# Mêmes variables que Django (settings.py charge aussi .env)
+load_dotenv()
+
+WORKER_CLASSES = {
+    'sync': 'sync',
+    'gthread': 'gthread',
+    'uvicorn': 'uvicorn.workers.UvicornWorker',
+}
+
+_classe = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+worker_class = WORKER_CLASSES[_classe]
+wsgi_app = 'django_project.asgi:application' if _classe == 'uvicorn' else 'django_project.wsgi:application'
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+workers = int(os.environ.get('GUNICORN_WORKERS') or multiprocessing.cpu_count() * 2 + 1)
+threads = int(os.environ.get('GUNICORN_THREADS', '4')) if _classe == 'gthread' else 1
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True') == 'True'
+
+# Recyclage : un worker est remplacé après max_requests (+ aléa) requêtes ;
+# l'aléa évite que tous les workers redémarrent en même temps
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '100'))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = 30
+keepalive = 5
+
+# Fichier de heartbeat des workers en mémoire : un disque lent ne fait plus tuer les workers
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = '-'
+errorlog = '-'
+
+PRECHAUFFAGE = os.environ.get('GUNICORN_PRECHAUFFAGE', 'True') == 'True'
+
+
+def on_starting(server):
+    # Repartir d'un répertoire de métriques vide (fichiers des workers d'une exécution précédente)
+    repertoire = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if repertoire:
+        os.makedirs(repertoire, exist_ok=True)
+        for fichier in glob.glob(os.path.join(repertoire, '*.db')):
+            os.remove(fichier)
+
+
+def _prechauffer(log, qui):
+    from cahier_charges.prechauffage import prechauffer
+    durees = prechauffer()
+    log.info(
+        "%s préchauffé en %.0f ms (%s)", qui, sum(durees.values()),
+        ', '.join(f'{etape} {duree:.0f} ms' for etape, duree in durees.items()),
+    )
+
+
+def when_ready(server):
+    # preload_app : préchauffer une seule fois dans le maître, les workers en héritent au fork
+    if PRECHAUFFAGE and preload_app:
+        _prechauffer(server.log, 'Maître')
+
+
+def pre_fork(server, worker):
+    # Une connexion à la base ouverte par le maître ne doit pas être partagée avec les workers
+    if preload_app:
+        from django.db import connections
+        connections.close_all()
+
+
+def post_worker_init(worker):
+    # Sans preload_app, l'application n'est chargée qu'ici (après le fork) : préchauffer chaque worker
+    if PRECHAUFFAGE and not preload_app:
+        _prechauffer(worker.log, f'Worker {worker.pid}')
+
+
+def child_exit(server, worker):
+    # Retirer les métriques du worker terminé (jauges en mode multiprocess)
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)